@@ -0,0 +1,55 @@
+"""
+Lookup latency of the autocomplete prefix index for a large address book.
+
+    python -m benchmarks.autocomplete [contacts] [lookups]
+
+Builds the index of one user with synthetic contacts and times lookups of random
+one to four character prefixes of existing names, emails and phones.
+"""
+import os
+import random
+import string
+import sys
+from statistics import quantiles
+from time import perf_counter
+from types import SimpleNamespace
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.services.autocomplete import PrefixIndex, normalize_prefix
+
+
+def word(rng: random.Random) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))).capitalize()
+
+
+def main(contacts: int, lookups: int):
+    rng = random.Random(14)
+    rows = [
+        SimpleNamespace(
+            id=i,
+            first_name=word(rng),
+            last_name=word(rng),
+            email=f"{word(rng).lower()}{i}@example.com",
+            phone=f"+380 {rng.randint(10, 99)} {rng.randint(100, 999)}-{rng.randint(1000, 9999)}",
+        )
+        for i in range(1, contacts + 1)
+    ]
+    start = perf_counter()
+    index = PrefixIndex(rows)
+    print(f"build: {(perf_counter() - start) * 1000:.0f} ms for {contacts} contacts, {len(index.keys)} keys")
+
+    timings = []
+    for _ in range(lookups):
+        row = rng.choice(rows)
+        source = rng.choice((row.first_name, row.last_name, row.email, row.phone[5:]))
+        prefix = normalize_prefix(source[:rng.randint(1, 4)])
+        start = perf_counter()
+        index.lookup(prefix, 10)
+        timings.append((perf_counter() - start) * 1_000_000)
+    percentiles = quantiles(timings, n=100)
+    print(f"lookup: p50 {percentiles[49]:.1f} us, p99 {percentiles[98]:.1f} us, max {max(timings):.1f} us")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000, int(sys.argv[2]) if len(sys.argv) > 2 else 20_000)
@@ -0,0 +1,59 @@
+"""
+Throughput and peak Python memory of the streaming contacts import.
+
+    python -m benchmarks.contacts_import [rows]
+
+Writes a CSV with the given number of rows to a temporary file and imports it into
+a fresh SQLite database through the same code path as POST /api/contacts/import.
+The peak memory reported by tracemalloc stays flat as the number of rows grows.
+"""
+import asyncio
+import csv
+import os
+import sys
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.database.models import Base, User
+from src.services import contacts_io
+
+
+async def main(rows: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "contacts.csv")
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(["first_name", "last_name", "email", "phone", "birthday"])
+            for i in range(rows):
+                writer.writerow([f"First{i}", f"Last{i}", f"contact{i}@example.com", f"+380{i:09d}",
+                                 f"19{i % 100:02d}-{i % 12 + 1:02d}-{i % 28 + 1:02d}"])
+
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/import.db")
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        async with session_maker() as session:
+            session.add(User(id=1, username="bench", email="bench@example.com", password="secret"))
+            await session.commit()
+
+        tracemalloc.start()
+        start = perf_counter()
+        with open(path, "rb") as file:
+            async with session_maker() as session:
+                report = await contacts_io.import_contacts(contacts_io.read_csv(file), 1, session)
+        elapsed = perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        await engine.dispose()
+
+    print(f"imported {report.imported} of {rows} rows in {elapsed:.1f} s ({rows / elapsed:,.0f} rows/s), "
+          f"peak {peak / 2 ** 20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000))
@@ -0,0 +1,128 @@
+"""
+Latency of legitimate logins during a credential-stuffing attack, with and without the login throttle.
+
+    python -m benchmarks.login_attack [seconds] [rate] [warmup]
+
+Real users log in from their own addresses one after another for the given number of seconds.
+In the attack phases two attacker addresses send rate attempts per second with wrong passwords
+for existing accounts, without waiting for the answers, as a botnet does. The attack starts warmup
+seconds before the real users, so the latencies are those of an attack under way rather than
+of its first minute. "baseline" has no attack, "unthrottled" runs the attack
+against limits too high to apply, "throttled" against the configured limits. Without the throttle
+every attempt is a user lookup and a bcrypt run, legitimate logins queue behind them and are
+turned away with 503 once the password hasher is full.
+Redis is fakeredis in process, a fresh one per phase.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from time import perf_counter
+from unittest.mock import patch
+
+import fakeredis.aioredis
+import httpx
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from main import app
+from src.conf.config import settings
+from src.database.db import get_db, get_read_db
+from src.database.models import Base, User
+from src.services.auth import auth_service
+from src.services.login_throttle import LoginThrottle
+from src.services.refresh_tokens import refresh_token_store
+from src.services.revocation import revocation_list
+
+PASSWORD = "qwerty"
+USERS = 100
+VICTIMS = 100
+ATTACKERS = 2
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def client_from(address: str) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app, client=(address, 50000)), base_url="http://bench")
+
+
+async def phase(seconds: float, rate: float, warmup: float) -> tuple[list[float], int, dict]:
+    latencies, failed, attempts = [], 0, {}
+    deadline = perf_counter() + warmup + seconds
+
+    async def legitimate():
+        nonlocal failed
+        await asyncio.sleep(warmup)
+        for i in range(USERS):
+            if perf_counter() >= deadline:
+                break
+            async with client_from(f"198.51.100.{i}") as client:
+                start = perf_counter()
+                response = await client.post("/api/auth/login", data={"username": f"user{i}@example.com",
+                                                                      "password": PASSWORD})
+                latencies.append(perf_counter() - start)
+                failed += response.status_code != 200
+            await asyncio.sleep(0.2)
+
+    async def attempt(client: httpx.AsyncClient, number: int):
+        response = await client.post("/api/auth/login", data={"username": f"victim{number % VICTIMS}@example.com",
+                                                              "password": f"guess{number}"})
+        attempts[response.status_code] = attempts.get(response.status_code, 0) + 1
+
+    async def attack():
+        clients = [client_from(f"203.0.113.{i}") for i in range(ATTACKERS)]
+        tasks, number = [], 0
+        while perf_counter() < deadline:
+            tasks.append(asyncio.create_task(attempt(clients[number % ATTACKERS], number)))
+            number += 1
+            await asyncio.sleep(1 / rate)
+        await asyncio.gather(*tasks)
+        for client in clients:
+            await client.aclose()
+
+    await asyncio.gather(legitimate(), *([attack()] if warmup else []))
+    return latencies, failed, attempts
+
+
+async def main(seconds: float, rate: float, warmup: float):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/login.db", connect_args={"timeout": 60})
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        password = auth_service.get_password_hash(PASSWORD)
+        async with session_maker() as session:
+            session.add_all(User(username=f"{name}{i}", email=f"{name}{i}@example.com", confirmed=True, password=password)
+                            for name, count in (("user", USERS), ("victim", VICTIMS)) for i in range(count))
+            await session.commit()
+
+        async def override_get_db():
+            async with session_maker() as db:
+                yield db
+
+        app.dependency_overrides[get_db] = override_get_db
+        app.dependency_overrides[get_read_db] = override_get_db
+        for name, attack, limits in (("baseline", False, 1), ("unthrottled", True, 10 ** 9), ("throttled", True, 1)):
+            redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+            refresh_token_store.client = revocation_list.client = redis
+            throttle = LoginThrottle(settings.login_window, settings.login_ip_limit * limits,
+                                     settings.login_account_limit * limits, settings.login_free_failures * limits,
+                                     settings.login_delay_base, settings.login_delay_max, client=redis)
+            with patch("src.routes.auth.login_throttle", throttle):
+                latencies, failed, attempts = await phase(seconds, rate, warmup if attack else 0)
+            print(f"{name:>11}: legitimate login p50 {percentile(latencies, 0.5) * 1000:7.1f} ms, "
+                  f"p99 {percentile(latencies, 0.99) * 1000:7.1f} ms, {failed} of {len(latencies)} failed; "
+                  f"attack responses {dict(sorted(attempts.items()))}")
+        refresh_token_store.client = revocation_list.client = None
+        app.dependency_overrides.clear()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(float(sys.argv[1]) if len(sys.argv) > 1 else 10,
+                     float(sys.argv[2]) if len(sys.argv) > 2 else 20,
+                     float(sys.argv[3]) if len(sys.argv) > 3 else 40))
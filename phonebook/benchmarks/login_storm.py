@@ -0,0 +1,100 @@
+"""
+Login throughput and latency of an unrelated route during a login storm.
+
+    python -m benchmarks.login_storm [logins] [concurrency]
+
+Sends the given number of POST /api/auth/login requests, concurrency at a time, to the
+application in process while GET / is polled without pause. "inline" hashes on the event
+loop as the login route used to, "pool" uses the password hasher thread pool. With inline
+hashing every poll waits for the bcrypt runs ahead of it, so its p99 grows with the cost factor.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+import httpx
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from main import app
+from src.database.db import get_db, get_read_db
+from src.database.models import Base, User
+from src.services.auth import auth_service
+from src.services.password_hasher import PasswordHasher
+
+PASSWORD = "qwerty"
+
+
+class InlineHasher(PasswordHasher):
+    async def _run(self, function, *args):
+        return function(*args)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def storm(client: httpx.AsyncClient, logins: int, concurrency: int) -> tuple[float, list[float]]:
+    latencies = []
+    done = asyncio.Event()
+
+    async def poll():
+        while not done.is_set():
+            start = perf_counter()
+            await client.get("/")
+            latencies.append(perf_counter() - start)
+            await asyncio.sleep(0.001)
+
+    async def login(semaphore):
+        async with semaphore:
+            response = await client.post("/api/auth/login", data={"username": "bench@example.com",
+                                                                  "password": PASSWORD})
+            response.raise_for_status()
+
+    poller = asyncio.create_task(poll())
+    semaphore = asyncio.Semaphore(concurrency)
+    start = perf_counter()
+    await asyncio.gather(*(login(semaphore) for _ in range(logins)))
+    elapsed = perf_counter() - start
+    done.set()
+    await poller
+    return elapsed, latencies
+
+
+async def main(logins: int, concurrency: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/login.db", connect_args={"timeout": 60})
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        async with session_maker() as session:
+            session.add(User(id=1, username="bench", email="bench@example.com", confirmed=True,
+                             password=auth_service.get_password_hash(PASSWORD)))
+            await session.commit()
+
+        async def override_get_db():
+            async with session_maker() as db:
+                yield db
+
+        app.dependency_overrides[get_db] = override_get_db
+        app.dependency_overrides[get_read_db] = override_get_db
+        pool = auth_service.password_hasher
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, hasher in (("inline", InlineHasher(pool.context, 1, logins)), ("pool", pool)):
+                auth_service.password_hasher = hasher
+                elapsed, latencies = await storm(client, logins, concurrency)
+                print(f"{name:>6}: {logins / elapsed:6.1f} logins/s, GET / p50 {percentile(latencies, 0.5) * 1000:7.1f} ms, "
+                      f"p99 {percentile(latencies, 0.99) * 1000:7.1f} ms ({len(latencies)} polls)")
+        auth_service.password_hasher = pool
+        app.dependency_overrides.clear()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else 16))
@@ -0,0 +1,99 @@
+"""
+Per-request overhead of rate limiting: fastapi_limiter against the hybrid rate limiter.
+
+    python -m benchmarks.rate_limiter [requests] [rtt_ms]
+
+Sends the given number of requests to a route without a limiter, one behind fastapi_limiter's
+RateLimiter and one behind RateLimit, with limits too high to refuse anything, and prints the
+time per request above the unlimited route. Redis is fakeredis in process, every command delayed
+by rtt_ms to stand in for the network round trip. "down" is a Redis that refuses connections:
+fastapi_limiter fails the request, the hybrid limiter opens its circuit breaker and lets it through.
+"""
+import asyncio
+import os
+import sys
+from time import perf_counter
+
+import fakeredis.aioredis
+import httpx
+from fastapi import Depends, FastAPI
+from fastapi_limiter import FastAPILimiter
+from fastapi_limiter.depends import RateLimiter
+from redis.exceptions import ConnectionError
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.schemas import Principal
+from src.services.auth import auth_service
+from src.services.rate_limiter import RateLimit, rate_limiter
+
+
+class DelayedRedis(fakeredis.aioredis.FakeRedis):
+    rtt = 0.0
+
+    async def execute_command(self, *args, **options):
+        await asyncio.sleep(self.rtt)
+        return await super().execute_command(*args, **options)
+
+
+class DownRedis(fakeredis.aioredis.FakeRedis):
+    async def execute_command(self, *args, **options):
+        raise ConnectionError("Connection refused")
+
+
+async def principal() -> Principal:
+    return Principal(id=1, email="bench@example.com", confirmed=True)
+
+
+app = FastAPI()
+app.dependency_overrides[auth_service.get_current_principal] = principal
+
+
+@app.get("/none")
+async def unlimited():
+    return {}
+
+
+@app.get("/fastapi_limiter", dependencies=[Depends(RateLimiter(times=10 ** 9, seconds=60))])
+async def fastapi_limiter():
+    return {}
+
+
+@app.get("/hybrid", dependencies=[Depends(RateLimit(cost=5, times=10 ** 9, seconds=60))])
+async def hybrid():
+    return {}
+
+
+async def run(client: httpx.AsyncClient, path: str, requests: int) -> tuple[float, int]:
+    failed = 0
+    start = perf_counter()
+    for _ in range(requests):
+        failed += (await client.get(path)).status_code != 200
+    return (perf_counter() - start) / requests, failed
+
+
+async def main(requests: int, rtt: float):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app, raise_app_exceptions=False),
+                                 base_url="http://bench") as client:
+        await run(client, "/none", 100)
+        baseline, _ = await run(client, "/none", requests)
+        print(f"{'no limiter':>24}: {baseline * 1e6:7.1f} us per request")
+        for name, redis in (("redis", DelayedRedis(decode_responses=True)), ("down", DownRedis(decode_responses=True))):
+            redis.rtt = rtt
+            rate_limiter.client = redis
+            rate_limiter.clear()
+            if name == "down":
+                FastAPILimiter.redis = redis
+            else:
+                await FastAPILimiter.init(redis)
+            for path in ("/fastapi_limiter", "/hybrid"):
+                elapsed, failed = await run(client, path, requests)
+                print(f"{path[1:] + ' (' + name + ')':>24}: {(elapsed - baseline) * 1e6:+7.1f} us per request, "
+                      f"{failed} of {requests} failed")
+        print(f"hybrid limiter: {rate_limiter.stats()}")
+        rate_limiter.client = None
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+                     (float(sys.argv[2]) if len(sys.argv) > 2 else 0.5) / 1000))
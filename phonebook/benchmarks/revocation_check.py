@@ -0,0 +1,51 @@
+"""
+Per-request cost of the access-token revocation check.
+
+    python -m benchmarks.revocation_check [calls] [revoked]
+
+Fills the revocation list with the given number of revoked tokens, then checks tokens that
+were never revoked, as almost every request does. "bloom" is RevocationList.is_revoked,
+which answers from the worker's Bloom filter; "redis" asks Redis on every call, as a check
+without the filter would. Redis is fakeredis in process here, so the "redis" numbers leave out
+the network round trip a real server adds to every call.
+"""
+import asyncio
+import os
+import sys
+from time import perf_counter, time
+
+import fakeredis.aioredis
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.conf.config import settings
+from src.services.revocation import ENTRIES_KEY, USER_PREFIX, RevocationList, token_entry
+
+
+async def redis_only(redis, payload: dict) -> bool:
+    if await redis.zscore(ENTRIES_KEY, token_entry(payload["jti"])) is not None:
+        return True
+    return await redis.get(f"{USER_PREFIX}{payload['uid']}") is not None
+
+
+async def main(calls: int, revoked: int):
+    redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    revocations = RevocationList(settings.revocation_bloom_size, settings.revocation_bloom_hashes,
+                                 settings.revocation_rebuild_interval, client=redis)
+    await redis.zadd(ENTRIES_KEY, {token_entry(f"revoked{i}"): time() + 900 for i in range(revoked)})
+    await revocations.rebuild()
+    payloads = [{"jti": f"live{i}", "uid": i % 1000, "iat": int(time())} for i in range(calls)]
+
+    for name, check in (("bloom", revocations.is_revoked), ("redis", lambda payload: redis_only(redis, payload))):
+        start = perf_counter()
+        for payload in payloads:
+            await check(payload)
+        elapsed = perf_counter() - start
+        print(f"{name:>5}: {elapsed / calls * 1e6:6.1f} us per check ({calls / elapsed:,.0f} checks/s)")
+    stats = revocations.stats()
+    print(f"bloom hits {stats['bloom_hits']} of {stats['checks']} checks with {revoked:,} revoked tokens")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else 50_000))
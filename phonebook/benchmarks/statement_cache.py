@@ -0,0 +1,72 @@
+"""
+Per-call overhead of the hot repository queries with and without the compiled statement cache.
+
+    python -m benchmarks.statement_cache [calls]
+
+"uncached" rebuilds select(...).filter(...) on every call and runs on an engine with
+query_cache_size=0, so each call constructs and compiles the statement again.
+"cached" calls the repository functions, which use lambda statements on an engine with
+the default compiled cache. Both run against in-memory SQLite so the database round trip
+is as small as possible and the difference is the ORM layer.
+"""
+import asyncio
+import os
+import sys
+from time import perf_counter
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.database.models import Base, Contact, User
+from src.repository import contacts as repository_contacts
+from src.repository import users as repository_users
+
+
+async def uncached_get_user_by_email(email, db):
+    return (await db.execute(select(User).filter(func.lower(User.email) == email.lower()))).scalar_one_or_none()
+
+
+async def uncached_get_contact_by_id(contact_id, user_id, db):
+    return (await db.execute(select(Contact).filter_by(id=contact_id, user_id=user_id))).scalar_one_or_none()
+
+
+async def prepare(query_cache_size: int):
+    engine = create_async_engine("sqlite+aiosqlite://", query_cache_size=query_cache_size)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_maker() as session:
+        session.add(User(id=1, username="bench", email="bench@example.com", password="secret"))
+        session.add(Contact(id=1, first_name="first", last_name="last", email="c1@example.com", user_id=1))
+        await session.commit()
+    return engine, session_maker
+
+
+async def measure(name: str, query_cache_size: int, get_user, get_contact, calls: int) -> float:
+    engine, session_maker = await prepare(query_cache_size)
+    async with session_maker() as session:
+        for _ in range(100):
+            await get_user("bench@example.com", session)
+            await get_contact(1, 1, session)
+        start = perf_counter()
+        for _ in range(calls):
+            await get_user("bench@example.com", session)
+            await get_contact(1, 1, session)
+        elapsed = perf_counter() - start
+    await engine.dispose()
+    per_call = elapsed / (calls * 2) * 1_000_000
+    print(f"{name:>10}: {per_call:8.1f} us/query")
+    return per_call
+
+
+async def main(calls: int):
+    uncached = await measure("uncached", 0, uncached_get_user_by_email, uncached_get_contact_by_id, calls)
+    cached = await measure("cached", 500, repository_users.get_user_by_email, repository_contacts.get_contact_by_id,
+                           calls)
+    print(f"{'saved':>10}: {uncached - cached:8.1f} us/query ({(1 - cached / uncached) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
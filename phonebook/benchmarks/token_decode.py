@@ -0,0 +1,53 @@
+"""
+Per-request cost of authenticating an access token with and without the verified payload cache.
+
+    python -m benchmarks.token_decode [calls]
+
+Calls auth_service.get_current_user with the same access token, as a client does for the
+whole lifetime of the token. The user cache is warm, so the database is not read and the
+difference is the JWT signature and claims check. "uncached" runs on a cache of size 0,
+which decodes the token on every call.
+"""
+import asyncio
+import os
+import sys
+from time import perf_counter
+from unittest.mock import patch
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.database.models import Base, User
+from src.services.auth import auth_service
+from src.services.token_cache import TokenCache
+
+
+async def run(token: str, db: AsyncSession, calls: int, cache: TokenCache) -> float:
+    with patch("src.services.auth.token_cache", cache):
+        await auth_service.get_current_user(token, db)
+        start = perf_counter()
+        for _ in range(calls):
+            await auth_service.get_current_user(token, db)
+        return perf_counter() - start
+
+
+async def main(calls: int):
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_maker() as session:
+        session.add(User(id=1, username="bench", email="bench@example.com", password="secret"))
+        await session.commit()
+
+    token = await auth_service.create_access_token(data={"sub": "bench@example.com"})
+    async with session_maker() as session:
+        for name, cache in (("uncached", TokenCache(max_size=0)), ("cached", TokenCache(max_size=1000))):
+            elapsed = await run(token, session, calls, cache)
+            print(f"{name:>8}: {elapsed / calls * 1e6:7.1f} us per call ({calls / elapsed:,.0f} calls/s)")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000))
@@ -1,18 +1,25 @@
+from contextlib import asynccontextmanager
 from pathlib import Path
-from fastapi import FastAPI, BackgroundTasks, Depends
+from fastapi import FastAPI, BackgroundTasks, Depends, Header, HTTPException, status
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
 from src.routes import contacts, auth, users
 from pydantic import EmailStr, BaseModel
 from typing import List
+from secrets import compare_digest
 
 import uvicorn
 from dotenv import load_dotenv
 import os
 
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
-import redis.asyncio as redis
 from src.conf.config import settings
+from src.database.db import engine, replica_engine, pool_status, statement_cache_stats
+from src.services.auth import auth_service
+from src.services.login_throttle import login_throttle
+from src.services.rate_limiter import rate_limiter
+from src.services.redis_client import close_redis, pool_stats
+from src.services.revocation import revocation_list
+from src.services.token_cache import token_cache
+from src.services.user_cache import user_cache
 from fastapi.middleware.cors import CORSMiddleware
 from src.conf.config import settings
 import cloudinary
@@ -37,7 +44,15 @@ conf = ConnectionConfig(
 )
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    revocation_list.start()
+    yield
+    await revocation_list.stop()
+    await close_redis()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [ 
     "http://localhost:3000"
@@ -53,6 +68,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],
 )
 
 
@@ -72,18 +88,37 @@ async def send_in_background(background_tasks: BackgroundTasks, body: EmailSchem
     return {"message": "email has been sent"}
 
 
-@app.on_event("startup")
-async def startup():
-    r = await redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0, encoding="utf-8",
-                          decode_responses=True)
-    await FastAPILimiter.init(r)
-
-
 @app.get("/")
 def read_root():
     return {"message": "Hello World"}
 
 
+def metrics_access(x_metrics_token: str | None = Header(None)) -> None:
+    """
+    The metrics_access function lets a request read the metrics only with the X-Metrics-Token header
+    equal to metrics_token. The metrics tell the load and the limits of the service, so without
+    metrics_token set the endpoint is not served at all.
+
+    :param x_metrics_token: str | None: Value of the X-Metrics-Token header
+    """
+    if not settings.metrics_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if x_metrics_token is None or not compare_digest(x_metrics_token, settings.metrics_token):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+
+
+@app.get("/metrics", dependencies=[Depends(metrics_access)])
+def read_metrics():
+    metrics = {"db_pool": pool_status(engine), "statement_cache": statement_cache_stats.as_dict(),
+               "user_cache": user_cache.stats(), "password_hasher": auth_service.password_hasher.stats(),
+               "token_cache": token_cache.stats(), "revocation_list": revocation_list.stats(),
+               "login_throttle": login_throttle.stats(), "rate_limiter": rate_limiter.stats(),
+               "redis_pool": pool_stats()}
+    if replica_engine is not engine:
+        metrics["db_replica_pool"] = pool_status(replica_engine)
+    return metrics
+
+
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host=settings.app_host, port=settings.app_port, reload=True)
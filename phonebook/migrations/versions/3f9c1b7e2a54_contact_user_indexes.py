@@ -0,0 +1,44 @@
+"""contact and user lookup indexes
+
+Revision ID: 3f9c1b7e2a54
+Revises: 88df32fbfb1a
+Create Date: 2026-10-17 09:12:40.518223
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c1b7e2a54'
+down_revision: Union[str, None] = '88df32fbfb1a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction, so every
+# statement runs in an autocommit block. if_not_exists/if_exists make the
+# revision safe to re-run after an interrupted build; an INVALID index left
+# behind by a failed concurrent build has to be dropped by hand first.
+# uq_contacts_user_id_email_lower fails if a user already has contacts whose
+# emails differ only by case; deduplicate them before upgrading.
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_contacts_user_id_id', 'contacts', ['user_id', 'id'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('uq_contacts_user_id_email_lower', 'contacts', ['user_id', sa.text('lower(email)')],
+                        unique=True, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_users_email_lower', 'users', [sa.text('lower(email)')], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_email_lower', table_name='users', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('uq_contacts_user_id_email_lower', table_name='contacts', postgresql_concurrently=True,
+                      if_exists=True)
+        op.drop_index('ix_contacts_user_id_id', table_name='contacts', postgresql_concurrently=True, if_exists=True)
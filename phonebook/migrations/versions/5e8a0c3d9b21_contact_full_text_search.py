@@ -0,0 +1,73 @@
+"""contact full-text search
+
+Revision ID: 5e8a0c3d9b21
+Revises: c41e9d2b6f73
+Create Date: 2026-10-17 14:02:37.415093
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8a0c3d9b21'
+down_revision: Union[str, None] = 'c41e9d2b6f73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Same structures as src.database.fts creates for new databases.
+FIELDS = "first_name, last_name, email, phone, comments"
+NEW_VALUES = "new.first_name, new.last_name, new.email, new.phone, new.comments"
+OLD_VALUES = "old.first_name, old.last_name, old.email, old.phone, old.comments"
+# punctuation is replaced with spaces, so emails and phone numbers are split into words as on SQLite
+SEARCH_VECTOR_DDL = (
+    "ALTER TABLE contacts ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS "
+    "(to_tsvector('simple', regexp_replace(coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' || "
+    "coalesce(email, '') || ' ' || coalesce(phone, '') || ' ' || coalesce(comments, ''), "
+    "'[^[:alnum:]]+', ' ', 'g'))) STORED"
+)
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        # generated column: filled for existing rows by the ALTER, maintained by PostgreSQL afterwards
+        op.execute(SEARCH_VECTOR_DDL)
+        with op.get_context().autocommit_block():
+            op.create_index('ix_contacts_search_vector', 'contacts', ['search_vector'], unique=False,
+                            postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True)
+    elif op.get_bind().dialect.name == 'sqlite':
+        op.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5({FIELDS}, "
+            "content='contacts', content_rowid='id', tokenize='unicode61')"
+        )
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+            f"INSERT INTO contacts_fts(rowid, {FIELDS}) VALUES (new.id, {NEW_VALUES}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+            f"INSERT INTO contacts_fts(contacts_fts, rowid, {FIELDS}) VALUES ('delete', old.id, {OLD_VALUES}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS contacts_fts_au AFTER UPDATE ON contacts BEGIN "
+            f"INSERT INTO contacts_fts(contacts_fts, rowid, {FIELDS}) VALUES ('delete', old.id, {OLD_VALUES}); "
+            f"INSERT INTO contacts_fts(rowid, {FIELDS}) VALUES (new.id, {NEW_VALUES}); END"
+        )
+        # index the rows that already exist
+        op.execute("INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.drop_index('ix_contacts_search_vector', table_name='contacts', postgresql_concurrently=True,
+                          if_exists=True)
+        op.drop_column('contacts', 'search_vector')
+    elif op.get_bind().dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS contacts_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS contacts_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS contacts_fts_ai")
+        op.execute("DROP TABLE IF EXISTS contacts_fts")
@@ -0,0 +1,57 @@
+"""contact birthday month-day key
+
+Revision ID: 7b2d4e6f8a10
+Revises: 3f9c1b7e2a54
+Create Date: 2026-10-17 11:03:17.204311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b2d4e6f8a10'
+down_revision: Union[str, None] = '3f9c1b7e2a54'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+contacts = sa.table(
+    'contacts',
+    sa.column('id', sa.Integer),
+    sa.column('birthday', sa.Date),
+    sa.column('birthday_key', sa.Integer),
+)
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('birthday_key', sa.Integer(), nullable=True))
+
+    # Backfill in id ranges so a large table is never locked by one long UPDATE.
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        last_id = bind.execute(sa.select(sa.func.max(contacts.c.id))).scalar() or 0
+        for first_id in range(0, last_id + 1, BACKFILL_BATCH_SIZE):
+            bind.execute(
+                contacts.update()
+                .where(
+                    contacts.c.id.between(first_id, first_id + BACKFILL_BATCH_SIZE - 1),
+                    contacts.c.birthday.isnot(None),
+                )
+                .values(
+                    birthday_key=sa.cast(sa.extract('month', contacts.c.birthday), sa.Integer) * 100
+                    + sa.cast(sa.extract('day', contacts.c.birthday), sa.Integer)
+                )
+            )
+        op.create_index('ix_contacts_user_id_birthday_key', 'contacts', ['user_id', 'birthday_key'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_contacts_user_id_birthday_key', table_name='contacts', postgresql_concurrently=True,
+                      if_exists=True)
+    op.drop_column('contacts', 'birthday_key')
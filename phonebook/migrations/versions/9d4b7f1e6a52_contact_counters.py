@@ -0,0 +1,114 @@
+"""contact counters
+
+Revision ID: 9d4b7f1e6a52
+Revises: 5e8a0c3d9b21
+Create Date: 2026-10-17 16:41:09.208314
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4b7f1e6a52'
+down_revision: Union[str, None] = '5e8a0c3d9b21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Same triggers as src.database.counters creates for new databases.
+POSTGRESQL_APPLY = """
+CREATE OR REPLACE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO contact_counters (user_id, counter, value)
+    SELECT r.user_id, c.counter, sum(r.delta)
+    FROM ({rows}) AS r
+    CROSS JOIN LATERAL (VALUES ('total'), (CASE WHEN r.favorite THEN 'favorite' END),
+                               ('birthday_' || (r.birthday_key / 100))) AS c (counter)
+    WHERE c.counter IS NOT NULL AND r.user_id IS NOT NULL
+    GROUP BY r.user_id, c.counter
+    HAVING sum(r.delta) <> 0
+    ON CONFLICT (user_id, counter) DO UPDATE SET value = contact_counters.value + excluded.value;
+    RETURN NULL;
+END
+$$
+"""
+NEW_ROWS = "SELECT user_id, favorite, birthday_key, 1 AS delta FROM new_rows"
+OLD_ROWS = "SELECT user_id, favorite, birthday_key, -1 AS delta FROM old_rows"
+
+
+def sqlite_apply(row: str, delta: int) -> str:
+    return (
+        "INSERT INTO contact_counters (user_id, counter, value) "
+        f"SELECT {row}.user_id, counter, {delta} FROM (SELECT 'total' AS counter "
+        f"UNION ALL SELECT CASE WHEN {row}.favorite THEN 'favorite' END "
+        f"UNION ALL SELECT 'birthday_' || ({row}.birthday_key / 100)) "
+        f"WHERE counter IS NOT NULL AND {row}.user_id IS NOT NULL "
+        "ON CONFLICT (user_id, counter) DO UPDATE SET value = value + excluded.value;"
+    )
+
+
+BACKFILL = (
+    "INSERT INTO contact_counters (user_id, counter, value) "
+    "SELECT user_id, 'total', count(*) FROM contacts WHERE user_id IS NOT NULL GROUP BY user_id "
+    "UNION ALL SELECT user_id, 'favorite', count(*) FROM contacts "
+    "WHERE user_id IS NOT NULL AND favorite GROUP BY user_id "
+    "UNION ALL SELECT user_id, 'birthday_' || (birthday_key / 100), count(*) FROM contacts "
+    "WHERE user_id IS NOT NULL AND birthday_key IS NOT NULL GROUP BY user_id, birthday_key / 100"
+)
+
+
+def upgrade() -> None:
+    op.create_table('contact_counters',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('counter', sa.String(length=20), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'counter')
+    )
+    if op.get_bind().dialect.name == 'postgresql':
+        # no writes between the backfill and the triggers taking over
+        op.execute("LOCK TABLE contacts IN SHARE MODE")
+        op.execute(POSTGRESQL_APPLY.format(name='contact_counters_insert', rows=NEW_ROWS))
+        op.execute(POSTGRESQL_APPLY.format(name='contact_counters_update', rows=f"{NEW_ROWS} UNION ALL {OLD_ROWS}"))
+        op.execute(POSTGRESQL_APPLY.format(name='contact_counters_delete', rows=OLD_ROWS))
+        op.execute(
+            "CREATE TRIGGER contact_counters_insert AFTER INSERT ON contacts REFERENCING NEW TABLE AS new_rows "
+            "FOR EACH STATEMENT EXECUTE FUNCTION contact_counters_insert()"
+        )
+        op.execute(
+            "CREATE TRIGGER contact_counters_update AFTER UPDATE ON contacts REFERENCING OLD TABLE AS old_rows "
+            "NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION contact_counters_update()"
+        )
+        op.execute(
+            "CREATE TRIGGER contact_counters_delete AFTER DELETE ON contacts REFERENCING OLD TABLE AS old_rows "
+            "FOR EACH STATEMENT EXECUTE FUNCTION contact_counters_delete()"
+        )
+    elif op.get_bind().dialect.name == 'sqlite':
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS contact_counters_insert AFTER INSERT ON contacts BEGIN "
+            f"{sqlite_apply('new', 1)} END"
+        )
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS contact_counters_update AFTER UPDATE OF user_id, favorite, birthday_key "
+            f"ON contacts BEGIN {sqlite_apply('old', -1)} {sqlite_apply('new', 1)} END"
+        )
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS contact_counters_delete AFTER DELETE ON contacts BEGIN "
+            f"{sqlite_apply('old', -1)} END"
+        )
+    # count the contacts that already exist
+    op.execute(BACKFILL)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        for event in ('insert', 'update', 'delete'):
+            op.execute(f"DROP TRIGGER IF EXISTS contact_counters_{event} ON contacts")
+            op.execute(f"DROP FUNCTION IF EXISTS contact_counters_{event}()")
+    elif op.get_bind().dialect.name == 'sqlite':
+        for event in ('insert', 'update', 'delete'):
+            op.execute(f"DROP TRIGGER IF EXISTS contact_counters_{event}")
+    op.drop_table('contact_counters')
@@ -0,0 +1,44 @@
+"""contact keyset pagination indexes
+
+Revision ID: c41e9d2b6f73
+Revises: 7b2d4e6f8a10
+Create Date: 2026-10-17 13:26:51.830174
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41e9d2b6f73'
+down_revision: Union[str, None] = '7b2d4e6f8a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# The expressions must match src.repository.pagination.SORT_KEYS exactly,
+# otherwise the planner cannot use the indexes for keyset seeks.
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_contacts_user_id_name_sort', 'contacts',
+                        ['user_id', sa.text("coalesce(last_name, '')"), sa.text("coalesce(first_name, '')"), 'id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_contacts_user_id_created_at_id', 'contacts', ['user_id', 'created_at', 'id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_contacts_user_id_birthday_sort', 'contacts',
+                        ['user_id', sa.text("coalesce(birthday, '9999-12-31')"), 'id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_contacts_user_id_birthday_sort', table_name='contacts', postgresql_concurrently=True,
+                      if_exists=True)
+        op.drop_index('ix_contacts_user_id_created_at_id', table_name='contacts', postgresql_concurrently=True,
+                      if_exists=True)
+        op.drop_index('ix_contacts_user_id_name_sort', table_name='contacts', postgresql_concurrently=True,
+                      if_exists=True)
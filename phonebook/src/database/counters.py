@@ -0,0 +1,80 @@
+from sqlalchemy import DDL, event
+
+# Per-user contact counters in the contact_counters table, kept current by triggers on contacts,
+# so every write - single statements, bulk updates, imports - updates them in its own transaction.
+#   "total": all contacts, "favorite": favorite contacts, "birthday_<month>": birthdays in that month.
+# The same statements are applied to existing databases by the migration 9d4b7f1e6a52.
+
+TOTAL = "total"
+FAVORITE = "favorite"
+BIRTHDAY_MONTH = "birthday_"
+
+# PostgreSQL: statement level triggers with transition tables, one upsert per statement however many rows it touched
+_POSTGRESQL_APPLY = """
+CREATE OR REPLACE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO contact_counters (user_id, counter, value)
+    SELECT r.user_id, c.counter, sum(r.delta)
+    FROM ({rows}) AS r
+    CROSS JOIN LATERAL (VALUES ('total'), (CASE WHEN r.favorite THEN 'favorite' END),
+                               ('birthday_' || (r.birthday_key / 100))) AS c (counter)
+    WHERE c.counter IS NOT NULL AND r.user_id IS NOT NULL
+    GROUP BY r.user_id, c.counter
+    HAVING sum(r.delta) <> 0
+    ON CONFLICT (user_id, counter) DO UPDATE SET value = contact_counters.value + excluded.value;
+    RETURN NULL;
+END
+$$
+"""
+_NEW_ROWS = "SELECT user_id, favorite, birthday_key, 1 AS delta FROM new_rows"
+_OLD_ROWS = "SELECT user_id, favorite, birthday_key, -1 AS delta FROM old_rows"
+
+POSTGRESQL_DDL = (
+    _POSTGRESQL_APPLY.format(name="contact_counters_insert", rows=_NEW_ROWS),
+    _POSTGRESQL_APPLY.format(name="contact_counters_update", rows=f"{_NEW_ROWS} UNION ALL {_OLD_ROWS}"),
+    _POSTGRESQL_APPLY.format(name="contact_counters_delete", rows=_OLD_ROWS),
+    "DROP TRIGGER IF EXISTS contact_counters_insert ON contacts",
+    "CREATE TRIGGER contact_counters_insert AFTER INSERT ON contacts REFERENCING NEW TABLE AS new_rows "
+    "FOR EACH STATEMENT EXECUTE FUNCTION contact_counters_insert()",
+    "DROP TRIGGER IF EXISTS contact_counters_update ON contacts",
+    "CREATE TRIGGER contact_counters_update AFTER UPDATE ON contacts "
+    "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION contact_counters_update()",
+    "DROP TRIGGER IF EXISTS contact_counters_delete ON contacts",
+    "CREATE TRIGGER contact_counters_delete AFTER DELETE ON contacts REFERENCING OLD TABLE AS old_rows "
+    "FOR EACH STATEMENT EXECUTE FUNCTION contact_counters_delete()",
+)
+
+
+def _sqlite_apply(row: str, delta: int) -> str:
+    return (
+        "INSERT INTO contact_counters (user_id, counter, value) "
+        f"SELECT {row}.user_id, counter, {delta} FROM (SELECT 'total' AS counter "
+        f"UNION ALL SELECT CASE WHEN {row}.favorite THEN 'favorite' END "
+        f"UNION ALL SELECT 'birthday_' || ({row}.birthday_key / 100)) "
+        f"WHERE counter IS NOT NULL AND {row}.user_id IS NOT NULL "
+        "ON CONFLICT (user_id, counter) DO UPDATE SET value = value + excluded.value;"
+    )
+
+
+# SQLite: row level triggers, the update trigger only fires when a counted column changes
+SQLITE_DDL = (
+    f"CREATE TRIGGER IF NOT EXISTS contact_counters_insert AFTER INSERT ON contacts BEGIN "
+    f"{_sqlite_apply('new', 1)} END",
+    f"CREATE TRIGGER IF NOT EXISTS contact_counters_update AFTER UPDATE OF user_id, favorite, birthday_key ON contacts "
+    f"BEGIN {_sqlite_apply('old', -1)} {_sqlite_apply('new', 1)} END",
+    f"CREATE TRIGGER IF NOT EXISTS contact_counters_delete AFTER DELETE ON contacts BEGIN "
+    f"{_sqlite_apply('old', -1)} END",
+)
+
+
+def register(metadata) -> None:
+    """
+    The register function attaches the counter triggers to metadata.create_all. They are created
+    once all tables exist, since the triggers on contacts write to contact_counters.
+
+    :param metadata: MetaData: Metadata holding the contacts and contact_counters tables
+    """
+    for statement in POSTGRESQL_DDL:
+        event.listen(metadata, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+    for statement in SQLITE_DDL:
+        event.listen(metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
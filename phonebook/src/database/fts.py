@@ -0,0 +1,89 @@
+import re
+
+from sqlalchemy import DDL, column, event, func, literal_column, table
+
+# Full-text search over contacts.
+#   PostgreSQL: a generated tsvector column with a GIN index, kept up to date by the database.
+#   SQLite: an external-content FTS5 table mirrored by triggers on contacts.
+# The same statements are applied to existing databases by the migration 5e8a0c3d9b21.
+
+SEARCH_FIELDS = ("first_name", "last_name", "email", "phone", "comments")
+
+# The simple parser keeps an email address as one word and reads "123-4567" as 123 and -4567;
+# replacing punctuation with spaces first splits the text into the same words as search_terms
+# and the unicode61 tokenizer of SQLite.
+POSTGRESQL_DDL = (
+    "ALTER TABLE contacts ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (to_tsvector('simple', "
+    "regexp_replace("
+    + " || ' ' || ".join(f"coalesce({field}, '')" for field in SEARCH_FIELDS)
+    + ", '[^[:alnum:]]+', ' ', 'g'))) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_contacts_search_vector ON contacts USING gin (search_vector)",
+)
+
+_fields = ", ".join(SEARCH_FIELDS)
+_new_values = ", ".join(f"new.{field}" for field in SEARCH_FIELDS)
+_old_values = ", ".join(f"old.{field}" for field in SEARCH_FIELDS)
+
+SQLITE_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5({_fields}, "
+    "content='contacts', content_rowid='id', tokenize='unicode61')",
+    f"CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+    f"INSERT INTO contacts_fts(rowid, {_fields}) VALUES (new.id, {_new_values}); END",
+    f"CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+    f"INSERT INTO contacts_fts(contacts_fts, rowid, {_fields}) VALUES ('delete', old.id, {_old_values}); END",
+    f"CREATE TRIGGER IF NOT EXISTS contacts_fts_au AFTER UPDATE ON contacts BEGIN "
+    f"INSERT INTO contacts_fts(contacts_fts, rowid, {_fields}) VALUES ('delete', old.id, {_old_values}); "
+    f"INSERT INTO contacts_fts(rowid, {_fields}) VALUES (new.id, {_new_values}); END",
+)
+
+SQLITE_DROP_DDL = ("DROP TABLE IF EXISTS contacts_fts",)
+
+search_vector = literal_column("contacts.search_vector")
+contacts_fts = table("contacts_fts", column("contacts_fts"), column("rowid"), column("rank"))
+
+
+def search_terms(q: str) -> list[str]:
+    """
+    The search_terms function splits a search string into words at every character that is not
+    a letter or a digit, the way the indexed text is split. This also drops the query syntax
+    characters of tsquery and FTS5, so user input is always matched literally.
+
+    :param q: str: Search string entered by the user
+    :return: A list of words
+    """
+    return re.findall(r"[^\W_]+", q.lower())
+
+
+def tsquery(terms: list[str]):
+    """
+    The tsquery function builds a PostgreSQL prefix query matching contacts that contain every term.
+
+    :param terms: list[str]: Words returned by search_terms
+    :return: A to_tsquery expression
+    """
+    return func.to_tsquery(literal_column("'simple'::regconfig"), " & ".join(f"{term}:*" for term in terms))
+
+
+def fts5_query(terms: list[str]) -> str:
+    """
+    The fts5_query function builds an FTS5 prefix query matching contacts that contain every term.
+
+    :param terms: list[str]: Words returned by search_terms
+    :return: An FTS5 MATCH expression
+    """
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def register(contacts) -> None:
+    """
+    The register function attaches the full-text DDL to the contacts table, so metadata.create_all
+    builds the search structures of the dialect it runs on.
+
+    :param contacts: Table: The contacts table
+    """
+    for statement in POSTGRESQL_DDL:
+        event.listen(contacts, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+    for statement in SQLITE_DDL:
+        event.listen(contacts, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+    for statement in SQLITE_DROP_DDL:
+        event.listen(contacts, "before_drop", DDL(statement).execute_if(dialect="sqlite"))
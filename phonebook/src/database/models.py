@@ -1,16 +1,33 @@
-from sqlalchemy import Column, Integer, String, Boolean, func, Table, Date, Text 
-from sqlalchemy.orm import relationship
+from datetime import date
+
+from sqlalchemy import Column, Integer, String, Boolean, func, Table, Date, Text, Index, literal_column
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql.schema import ForeignKey
 from sqlalchemy.sql.sqltypes import DateTime
 # from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import declarative_base
 
+from src.database import counters, fts
+
 
 
 # Base = declarative_base()
 Base = declarative_base()
 
 
+def birthday_key(birthday: date | None) -> int | None:
+    """
+    The birthday_key function returns the month-day key (MMDD) of a birthday, e.g. 1231 for 31 December.
+    The key ignores the year, so recurring birthdays can be looked up with a plain integer range.
+
+    :param birthday: date | None: Birthday of the contact
+    :return: The month-day key or None
+    """
+    if birthday is None:
+        return None
+    return birthday.month * 100 + birthday.day
+
+
 class Contact(Base):
     __tablename__ = "contacts"
 
@@ -20,6 +37,7 @@ class Contact(Base):
     email = Column(String)
     phone = Column(String)
     birthday = Column(Date)
+    birthday_key = Column(Integer)
     comments = Column(Text)
     favorite = Column(Boolean, default=False)
     created_at = Column(DateTime, default=func.now())
@@ -27,6 +45,27 @@ class Contact(Base):
     #new
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user = relationship("User", backref="contacts")
+
+    __table_args__ = (
+        Index("ix_contacts_user_id_id", user_id, id),
+        Index("uq_contacts_user_id_email_lower", user_id, func.lower(email), unique=True),
+        Index("ix_contacts_user_id_birthday_key", user_id, birthday_key),
+        # keyset pagination sort orders, see src.repository.pagination.SORT_KEYS
+        Index(
+            "ix_contacts_user_id_name_sort",
+            user_id,
+            func.coalesce(last_name, literal_column("''")),
+            func.coalesce(first_name, literal_column("''")),
+            id,
+        ),
+        Index("ix_contacts_user_id_created_at_id", user_id, created_at, id),
+        Index("ix_contacts_user_id_birthday_sort", user_id, func.coalesce(birthday, literal_column("'9999-12-31'")), id),
+    )
+
+    @validates("birthday")
+    def validate_birthday(self, key, value):
+        self.birthday_key = birthday_key(value)
+        return value
     
 class User(Base):
     __tablename__ = "users"
@@ -38,7 +77,46 @@ class User(Base):
     avatar = Column(String(255), nullable=True)
     refresh_token = Column(String(255), nullable=True)
     confirmed = Column(Boolean, default=False)
-    
 
+    __table_args__ = (
+        Index("ix_users_email_lower", func.lower(email)),
+    )
+
+
+class ContactCounter(Base):
+    """
+    Per-user contact aggregates, one row per (user, counter), see src.database.counters.
+    """
+    __tablename__ = "contact_counters"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    counter = Column(String(20), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+class EmailOutbox(Base):
+    """
+    Emails waiting to be sent, appended by the routes and drained by the sender worker, see src.services.email_outbox.
+    """
+    __tablename__ = "email_outbox"
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False)
+    recipient = Column(String(250), nullable=False)
+    payload = Column(Text, nullable=False, default="{}")
+    status = Column(String(10), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)
+    locked_until = Column(DateTime)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=func.now())
+    sent_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt_at", status, next_attempt_at),
+        # one unsent email of a kind per recipient, repeated requests do not queue copies
+        Index("uq_email_outbox_pending_kind_recipient", kind, recipient, unique=True,
+              sqlite_where=status == "pending", postgresql_where=status == "pending"),
+    )
 
 
+fts.register(Contact.__table__)
+counters.register(Base.metadata)
@@ -1,90 +1,190 @@
+from calendar import isleap
 from datetime import date, timedelta
 
-from sqlalchemy.orm import Session
+from sqlalchemy import Integer, String, and_, any_, bindparam, case, delete as sql_delete, false, func, insert, lambda_stmt, \
+    literal, or_, select, text, tuple_, update as sql_update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.schemas import ContactModel,ContactFavoriteModel
-from src.database.models import Contact, User
+from src.schemas import ContactBulkSelection, ContactModel, ContactFavoriteModel, ContactSort
+from src.database import counters, fts
+from src.database.db import hot_query
+from src.database.models import Contact, ContactCounter, User, birthday_key
+from src.repository import pagination
+from src.services.autocomplete import autocomplete
 
 
+# INSERT constructs that support ON CONFLICT DO NOTHING
+CONFLICT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
 
-async def get_contacts(db: Session, user_id: int,  skip: int, limit: int, favorite: bool|None = None):
+EXPORT_FIELDS = ("id", "first_name", "last_name", "email", "phone", "birthday", "comments", "favorite",
+                 "created_at", "updated_at")
+
+
+
+def paginate(stmt, db: AsyncSession, sort: ContactSort, after: list | None, skip: int | None, limit: int):
+    """
+    The paginate function orders a contacts query by the sort order and cuts one page out of it.
+        With a decoded cursor the page starts right after the cursor row (keyset pagination),
+        otherwise the legacy skip offset is used.
+
+    :param stmt: Select: Query to paginate
+    :param db: AsyncSession: Session the query will run on, used to detect the dialect
+    :param sort: ContactSort: Sort order
+    :param after: list | None: Decoded cursor values
+    :param skip: int | None: Offset used when there is no cursor
+    :param limit: int: Page size
+    :return: The paginated query
+    """
+    stmt = stmt.order_by(*pagination.order_by(sort))
+    if after is not None:
+        stmt = stmt.filter(pagination.after(sort, after, db.bind.dialect.name))
+    elif skip:
+        stmt = stmt.offset(skip)
+    return stmt.limit(limit)
+
+
+async def get_contacts(db: AsyncSession, user_id: int,  skip: int, limit: int, favorite: bool|None = None,
+                       sort: ContactSort = ContactSort.id, after: list | None = None):
     """
     The get_contacts function returns a list of contacts for the user.
         
     
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :param user_id: int: Filter the contacts by user_id
     :param skip: int: Skip the first n contacts
     :param limit: int: Limit the number of contacts returned
     :param favorite: bool|None: Filter the contacts by favorite
+    :param sort: ContactSort: Sort order of the contacts
+    :param after: list | None: Decoded cursor, return the contacts that follow it
     :return: A list of contacts
     :doc-author: Trelent
     """
-    query = db.query(Contact).filter_by(user_id=user_id)
+    stmt = select(Contact).filter_by(user_id=user_id)
     if favorite is not None:
-        query = query.filter_by(user_id=user_id)
-    contacts = query.offset(skip).limit(limit).all()
-    return contacts
+        stmt = stmt.filter_by(favorite=favorite)
+    contacts = await db.execute(paginate(stmt, db, sort, after, skip, limit))
+    return contacts.scalars().all()
 
 
-async def get_contact_by_id(contact_id: int, user_id: int, db: Session):
+async def get_contact_by_id(contact_id: int, user_id: int, db: AsyncSession):
     """
     The get_contact_by_id function returns a contact object from the database based on the id of that contact.
         Args:
             contact_id (int): The id of the desired Contact object.
             user_id (int): The id of the User who owns this Contact.
-            db (Session): A connection to our database, used for querying and updating data in our tables.
+            db (AsyncSession): A connection to our database, used for querying and updating data in our tables.
     
     :param contact_id: int: Filter the database query by id
     :param user_id: int: Filter the contacts by user_id
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A contact object
     :doc-author: Trelent
     """
-    contact = db.query(Contact).filter_by(id=contact_id, user_id=user_id).first()
-    return contact
+    stmt = lambda_stmt(lambda: select(Contact).filter_by(id=contact_id, user_id=user_id))
+    contact = await db.execute(stmt, execution_options=hot_query("get_contact_by_id"))
+    return contact.scalar_one_or_none()
 
 
-async def get_contact_by_email(email: str, user_id: int, db: Session):
+async def get_contact_by_email(email: str, user_id: int, db: AsyncSession):
     """
     The get_contact_by_email function returns a contact object from the database based on the email address and user_id.
         Args:
             email (str): The email address of the contact to be retrieved.
             user_id (int): The id of the user who owns this contact.
-            db (Session, optional): SQLAlchemy Session instance. Defaults to None.
+            db (AsyncSession, optional): SQLAlchemy AsyncSession instance. Defaults to None.
     
     :param email: str: Filter the query by email
     :param user_id: int: Filter the results of the query by user_id
-    :param db: Session: Pass in the database session
+    :param db: AsyncSession: Pass in the database session
     :return: The first contact that matches the email and user_id
     :doc-author: Trelent
     """
-    contact = db.query(Contact).filter_by(email=email, user_id=user_id).first()
-    return contact
+    email = email.lower()
+    stmt = lambda_stmt(lambda: select(Contact).filter(Contact.user_id == user_id, func.lower(Contact.email) == email))
+    contact = await db.execute(stmt, execution_options=hot_query("get_contact_by_email"))
+    return contact.scalar_one_or_none()
 
 
-async def create(body: ContactModel, user_id: int, db: Session):
+async def create(body: ContactModel, user_id: int, db: AsyncSession):
     """
     The create function creates a new contact in the database.
-        
+        A single INSERT ... ON CONFLICT DO NOTHING RETURNING statement both inserts the contact
+        and tells whether the email was already taken, even under concurrent requests.
     
     :param body: ContactModel: Get the data from the request body
     :param user_id: int: Get the user_id from the database
-    :param db: Session: Access the database
-    :return: A contact object
+    :param db: AsyncSession: Access the database
+    :return: A contact object, or None if the user already has a contact with this email
     :doc-author: Trelent
     """
-    contact = Contact(**body.model_dump())
-    contact.user_id = user_id
-    db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    values = {**body.model_dump(), "birthday_key": birthday_key(body.birthday), "user_id": user_id}
+    conflict_insert = CONFLICT_INSERTS.get(db.bind.dialect.name)
+    if conflict_insert is not None:
+        # the (user_id, lower(email)) unique index decides, no pre-check and no refresh
+        stmt = conflict_insert(Contact).values(values).on_conflict_do_nothing(
+            index_elements=[Contact.user_id, func.lower(Contact.email)]
+        ).returning(Contact)
+        contact = (await db.execute(stmt)).scalar_one_or_none()
+        await db.commit()
+    else:
+        contact = Contact(**values)
+        db.add(contact)
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            return None
+        await db.refresh(contact)
+    if contact is not None:
+        autocomplete.contact_saved(contact)
     return contact
 
 
-async def update(contact_id: int, body: ContactModel, user_id: int, db: Session):
+async def insert_contacts(contacts: list[tuple[int, ContactModel]], user_id: int, db: AsyncSession):
+    """
+    The insert_contacts function inserts a batch of contacts in one multi-row INSERT, skipping
+    the ones whose email the user already has, either in the database or earlier in the batch.
+    Existing emails are found with a single query over the whole batch.
+
+    :param contacts: list[tuple[int, ContactModel]]: Row numbers and validated contacts
+    :param user_id: int: Owner of the contacts
+    :param db: AsyncSession: Access the database
+    :return: The number of inserted contacts and the row numbers skipped as duplicates
+    """
+    fresh, duplicates = {}, []
+    for row, body in contacts:
+        email = body.email.lower()
+        if email in fresh:
+            duplicates.append(row)
+        else:
+            fresh[email] = (row, body)
+    if fresh:
+        stmt = select(func.lower(Contact.email)).filter(Contact.user_id == user_id,
+                                                        func.lower(Contact.email).in_(list(fresh)))
+        for email in (await db.execute(stmt)).scalars():
+            duplicates.append(fresh.pop(email)[0])
+    values = [
+        {**body.model_dump(), "birthday_key": birthday_key(body.birthday), "user_id": user_id}
+        for _, body in fresh.values()
+    ]
+    if values:
+        await db.execute(insert(Contact), values)
+    await db.commit()
+    if values:
+        autocomplete.invalidate(user_id)
+    return len(values), sorted(duplicates)
+
+
+async def update(contact_id: int, body: ContactModel, user_id: int, db: AsyncSession):
     """
     The update function updates a contact in the database.
+        One UPDATE ... RETURNING statement changes the row and returns it, ready for ContactResponse.
         Args:
             contact_id (int): The id of the contact to update.
             body (ContactModel): The updated information for the specified contact.
@@ -93,26 +193,29 @@ async def update(contact_id: int, body: ContactModel, user_id: int, db: Session)
     :param contact_id: int: Identify the contact to be updated
     :param body: ContactModel: Get the data from the request body
     :param user_id: int: Make sure that the user is only able to update their own contacts
-    :param db: Session: Create a connection to the database
+    :param db: AsyncSession: Create a connection to the database
     :return: A contact object
+    :raises IntegrityError: If the user already has another contact with the new email
     :doc-author: Trelent
     """
-    contact = await get_contact_by_id(contact_id, user_id, db)
+    values = {**body.model_dump(), "birthday_key": birthday_key(body.birthday)}
+    stmt = sql_update(Contact).where(Contact.id == contact_id, Contact.user_id == user_id) \
+        .values(values).returning(Contact)
+    try:
+        contact = (await db.execute(stmt)).scalar_one_or_none()
+    except IntegrityError:
+        await db.rollback()
+        raise
+    await db.commit()
     if contact:
-        contact.first_name = body.first_name
-        contact.last_name = body.last_name
-        contact.email = body.email
-        contact.phone = body.phone
-        contact.birthday = body.birthday
-        contact.comments = body.comments
-        contact.favorite = body.favorite
-        db.commit()
+        autocomplete.contact_saved(contact)
     return contact
 
 
-async def favorite_update(contact_id: int, body: ContactFavoriteModel, user_id: int, db: Session):
+async def favorite_update(contact_id: int, body: ContactFavoriteModel, user_id: int, db: AsyncSession):
     """
     The favorite_update function updates the favorite field of a contact.
+        One UPDATE ... RETURNING statement changes the row and returns it, ready for ContactResponse.
         Args:
             contact_id (int): The id of the contact to update.
             body (ContactFavoriteModel): A ContactFavoriteModel object containing the new value for favorite.
@@ -123,81 +226,338 @@ async def favorite_update(contact_id: int, body: ContactFavoriteModel, user_id:
     :param contact_id: int: Get the contact by id
     :param body: ContactFavoriteModel: Get the favorite value from the request body
     :param user_id: int: Make sure that the user is only updating their own contact information
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A contactmodel object
     :doc-author: Trelent
     """
-    contact = await get_contact_by_id(contact_id, user_id, db)
-    if contact:
-        contact.favorite = body.favorite
-        db.commit()
+    stmt = sql_update(Contact).where(Contact.id == contact_id, Contact.user_id == user_id) \
+        .values(favorite=body.favorite).returning(Contact)
+    contact = (await db.execute(stmt)).scalar_one_or_none()
+    await db.commit()
     return contact
 
 
-async def delete(contact_id: int, user_id: int, db: Session):
+async def delete(contact_id: int, user_id: int, db: AsyncSession):
     """
     The delete function deletes a contact from the database.
-        
+        One DELETE ... RETURNING statement removes the row and returns what it contained.
     
     :param contact_id: int: Specify the contact to delete
     :param user_id: int: Ensure that the user is only deleting their own contacts
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A contact object, which is what we want to test
     :doc-author: Trelent
     """
-    contact = await get_contact_by_id(contact_id, user_id, db)
+    stmt = sql_delete(Contact).where(Contact.id == contact_id, Contact.user_id == user_id).returning(Contact)
+    contact = (await db.execute(stmt)).scalar_one_or_none()
+    await db.commit()
     if contact:
-        db.delete(contact)
-        db.commit()
+        autocomplete.contact_deleted(contact)
     return contact
 
 
-async def search_contacts(param: dict, user_id: int, db: Session):
+def bulk_condition(selection: ContactBulkSelection, user_id: int, dialect_name: str):
+    """
+    The bulk_condition function returns the WHERE clause selecting the contacts of a bulk operation.
+        Ids are sent to PostgreSQL as one array parameter (id = ANY(:ids)), other databases get IN.
+        A filter matches like the search endpoint: substrings of the fields, favorite, full-text q.
+
+    :param selection: ContactBulkSelection: Ids or filter of the contacts
+    :param user_id: int: Owner of the contacts
+    :param dialect_name: str: Name of the database dialect
+    :return: A boolean clause
+    """
+    conditions = [Contact.user_id == user_id]
+    if selection.ids is not None:
+        if dialect_name == "postgresql":
+            conditions.append(Contact.id == any_(bindparam("ids", selection.ids, type_=ARRAY(Integer))))
+        else:
+            conditions.append(Contact.id.in_(selection.ids))
+        return and_(*conditions)
+    criteria = selection.filter
+    if criteria.first_name:
+        conditions.append(Contact.first_name.ilike(f"%{criteria.first_name}%"))
+    if criteria.last_name:
+        conditions.append(Contact.last_name.ilike(f"%{criteria.last_name}%"))
+    if criteria.email:
+        conditions.append(Contact.email.ilike(f"%{criteria.email}%"))
+    if criteria.favorite is not None:
+        conditions.append(Contact.favorite == criteria.favorite)
+    if criteria.q:
+        matches = full_text(select(Contact.id).filter(Contact.user_id == user_id), criteria.q, dialect_name)
+        conditions.append(Contact.id.in_(matches.order_by(None)))
+    return and_(*conditions)
+
+
+async def bulk_favorite_update(selection: ContactBulkSelection, favorite: bool, user_id: int, db: AsyncSession):
+    """
+    The bulk_favorite_update function sets the favorite field of many contacts with a single UPDATE.
+
+    :param selection: ContactBulkSelection: Ids or filter of the contacts
+    :param favorite: bool: New value of favorite
+    :param user_id: int: Owner of the contacts, contacts of other users are never touched
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The ids of the updated contacts
+    """
+    stmt = sql_update(Contact).where(bulk_condition(selection, user_id, db.bind.dialect.name)) \
+        .values(favorite=favorite).returning(Contact.id).execution_options(synchronize_session=False)
+    ids = (await db.execute(stmt)).scalars().all()
+    await db.commit()
+    return sorted(ids)
+
+
+async def bulk_delete(selection: ContactBulkSelection, user_id: int, db: AsyncSession):
+    """
+    The bulk_delete function deletes many contacts with a single DELETE.
+
+    :param selection: ContactBulkSelection: Ids or filter of the contacts
+    :param user_id: int: Owner of the contacts, contacts of other users are never touched
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The ids of the deleted contacts
+    """
+    stmt = sql_delete(Contact).where(bulk_condition(selection, user_id, db.bind.dialect.name)) \
+        .returning(Contact.id).execution_options(synchronize_session=False)
+    ids = (await db.execute(stmt)).scalars().all()
+    await db.commit()
+    if ids:
+        autocomplete.invalidate(user_id)
+    return sorted(ids)
+
+
+async def stream_contacts(user_id: int, db: AsyncSession, batch_size: int):
+    """
+    The stream_contacts function reads all contacts of a user through a server-side cursor.
+        Rows are fetched batch_size at a time and handed out as soon as each batch arrives,
+        so memory use does not depend on the size of the address book.
+
+    :param user_id: int: Owner of the contacts
+    :param db: AsyncSession: Session to stream on, it must stay open until the iteration ends
+    :param batch_size: int: Rows fetched per round trip
+    :return: An async iterator of lists of row mappings
+    """
+    columns = [getattr(Contact, field) for field in EXPORT_FIELDS]
+    stmt = select(*columns).filter(Contact.user_id == user_id).order_by(Contact.user_id, Contact.id)
+    result = await db.stream(stmt.execution_options(yield_per=batch_size))
+    async for partition in result.mappings().partitions():
+        yield partition
+
+
+async def get_counters(user_id: int, db: AsyncSession) -> dict[str, int]:
+    """
+    The get_counters function reads the contact counters of a user, see src.database.counters.
+        It is a primary key lookup on contact_counters, the contacts table is not scanned.
+
+    :param user_id: int: Owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A dictionary of counter name: value, counters that were never set are missing
+    """
+    stmt = lambda_stmt(lambda: select(ContactCounter.counter, ContactCounter.value)
+                       .filter(ContactCounter.user_id == user_id))
+    rows = await db.execute(stmt, execution_options=hot_query("get_counters"))
+    return {counter: value for counter, value in rows.all()}
+
+
+async def count_contacts(user_id: int, db: AsyncSession, favorite: bool | None = None) -> int:
+    """
+    The count_contacts function returns the number of contacts of a user from the counters.
+
+    :param user_id: int: Owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param favorite: bool | None: Count only favorite (True) or only other (False) contacts
+    :return: The number of contacts
+    """
+    values = await get_counters(user_id, db)
+    total, favorites = values.get(counters.TOTAL, 0), values.get(counters.FAVORITE, 0)
+    if favorite is None:
+        return total
+    return favorites if favorite else total - favorites
+
+
+async def get_stats(user_id: int, db: AsyncSession) -> dict:
+    """
+    The get_stats function returns the aggregates of a user's address book from the counters.
+
+    :param user_id: int: Owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A dictionary with total, favorites and birthdays_by_month (months 1 to 12)
+    """
+    values = await get_counters(user_id, db)
+    return {
+        "total": values.get(counters.TOTAL, 0),
+        "favorites": values.get(counters.FAVORITE, 0),
+        "birthdays_by_month": {month: values.get(f"{counters.BIRTHDAY_MONTH}{month}", 0) for month in range(1, 13)},
+    }
+
+
+def counter_rows(user_id: int | None = None):
+    """
+    The counter_rows function builds the query that computes the counters from the contacts table.
+
+    :param user_id: int | None: Compute the counters of one user, all users by default
+    :return: A select of (user_id, counter, value) rows
+    """
+    owner = Contact.user_id == user_id if user_id is not None else Contact.user_id.is_not(None)
+    month = Contact.birthday_key // 100
+    return select(Contact.user_id, literal(counters.TOTAL, String), func.count()) \
+        .filter(owner).group_by(Contact.user_id) \
+        .union_all(
+            select(Contact.user_id, literal(counters.FAVORITE, String), func.count())
+            .filter(owner, Contact.favorite.is_(True)).group_by(Contact.user_id),
+            select(Contact.user_id, literal(counters.BIRTHDAY_MONTH, String) + month.cast(String), func.count())
+            .filter(owner, Contact.birthday_key.is_not(None)).group_by(Contact.user_id, month),
+        )
+
+
+async def rebuild_counters(db: AsyncSession, user_id: int | None = None) -> int:
+    """
+    The rebuild_counters function recomputes the contact counters in bulk and replaces the stored ones.
+        On PostgreSQL contacts are locked against writes until the commit, so no change slips in
+        between the count and the replace.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :param user_id: int | None: Rebuild the counters of one user, all users by default
+    :return: The number of counter rows written
+    """
+    if db.bind.dialect.name == "postgresql":
+        await db.execute(text("LOCK TABLE contacts IN SHARE MODE"))
+    stale = sql_delete(ContactCounter)
+    if user_id is not None:
+        stale = stale.where(ContactCounter.user_id == user_id)
+    await db.execute(stale)
+    result = await db.execute(
+        insert(ContactCounter).from_select(["user_id", "counter", "value"], counter_rows(user_id))
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def search_contacts(param: dict, user_id: int, db: AsyncSession):
     """
     The search_contacts function searches for contacts in the database.
         Args:
-            param (dict): A dictionary containing search parameters.  The keys are &quot;first_name&quot;, &quot;last_name&quot;, and &quot;email&quot;.  The values are strings to be searched for in the corresponding fields of a contact record.
+            param (dict): A dictionary containing search parameters.  The keys are &quot;q&quot;, &quot;first_name&quot;, &quot;last_name&quot;, and &quot;email&quot;.  The values are strings to be searched for in the corresponding fields of a contact record.
             user_id (int): An integer representing the id of a user who owns contacts being searched for.  
-            db (Session): A SQLAlchemy Session object used to query the database with an ORM model class called Contact, which is defined below this function definition as a subclass of Base, which is also defined
+            db (AsyncSession): A SQLAlchemy Session object used to query the database with an ORM model class called Contact, which is defined below this function definition as a subclass of Base, which is also defined
+        With &quot;q&quot; the contacts are matched by full-text search over name, email, phone and comments
+        and returned by relevance; the skip offset pages through them.
     
-    :param param: dict: Pass in a dictionary of parameters that will be used to filter the contacts
+    :param param: dict: Pass in a dictionary of parameters that will be used to filter the contacts, plus sort, after (decoded cursor), skip and limit
     :param user_id: int: Filter the contacts by user_id
-    :param db: Session: Pass the database session to the function
-    :return: A query object, not a list of contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A list of contacts
     :doc-author: Trelent
     """
-    query = db.query(Contact).filter_by(user_id=user_id)
+    stmt = select(Contact).filter_by(user_id=user_id)
     first_name = param.get("first_name")
     last_name = param.get("last_name")
     email = param.get("email")
     if first_name:
-        query = query.filter(Contact.first_name.ilike(f"%{first_name}%"))
+        stmt = stmt.filter(Contact.first_name.ilike(f"%{first_name}%"))
     if last_name:
-        query = query.filter(Contact.last_name.ilike(f"%{last_name}%"))   
+        stmt = stmt.filter(Contact.last_name.ilike(f"%{last_name}%"))
     if email:
-        query = query.filter(Contact.email.ilike(f"%{email}%"))   
-    contacts = query.offset(param.get("skip")).limit(param.get("limit"))
-    return contacts
+        stmt = stmt.filter(Contact.email.ilike(f"%{email}%"))
+    if param.get("q"):
+        stmt = full_text(stmt, param["q"], db.bind.dialect.name)
+        if param.get("skip"):
+            stmt = stmt.offset(param["skip"])
+        contacts = await db.execute(stmt.limit(param.get("limit")))
+        return contacts.scalars().all()
+    sort = param.get("sort", ContactSort.id)
+    contacts = await db.execute(paginate(stmt, db, sort, param.get("after"), param.get("skip"), param.get("limit")))
+    return contacts.scalars().all()
+
+
+def full_text(stmt, q: str, dialect_name: str):
+    """
+    The full_text function narrows a contacts query to the rows matching a full-text search
+    and orders them by relevance, best match first.
+        PostgreSQL matches the generated search_vector column (GIN index) and ranks with ts_rank,
+        SQLite matches the contacts_fts FTS5 table and ranks with bm25.
+
+    :param stmt: Select: Contacts query
+    :param q: str: Search string, every word must match the beginning of a word of the contact
+    :param dialect_name: str: Name of the database dialect
+    :return: The filtered and ordered query
+    """
+    terms = fts.search_terms(q)
+    if not terms:
+        return stmt.filter(false())
+    if dialect_name == "postgresql":
+        query = fts.tsquery(terms)
+        return stmt.filter(fts.search_vector.op("@@")(query)).order_by(
+            func.ts_rank(fts.search_vector, query).desc(), Contact.id
+        )
+    if dialect_name == "sqlite":
+        return stmt.join(fts.contacts_fts, fts.contacts_fts.c.rowid == Contact.id).filter(
+            fts.contacts_fts.c.contacts_fts.match(fts.fts5_query(terms))
+        ).order_by(fts.contacts_fts.c.rank, Contact.id)
+    # no full-text support, fall back to matching every word anywhere in the searched fields
+    for term in terms:
+        stmt = stmt.filter(or_(*(getattr(Contact, field).ilike(f"%{term}%") for field in fts.SEARCH_FIELDS)))
+    return stmt.order_by(Contact.id)
+
+
+def birthday_ranges(today: date, days: int) -> list[tuple[int, int]]:
+    """
+    The birthday_ranges function converts a window of days into ranges of month-day keys.
+        A window that crosses New Year is split in two ranges: from the start to 1231 and from 101 to the end.
+        In a non-leap year people born on 29 February celebrate on 28 February, so a window
+        that ends on 28 February also covers key 229.
+
+    :param today: date: First day of the window
+    :param days: int: Number of days after today to include
+    :return: A list of (first_key, last_key) ranges, both inclusive
+    """
+    if days >= 365:
+        return [(101, 1231)]
+    last_day = today + timedelta(days=days)
+    first_key = birthday_key(today)
+    last_key = birthday_key(last_day)
+    if last_key == 228 and not isleap(last_day.year):
+        last_key = 229
+    if last_day.year != today.year:
+        return [(first_key, 1231), (101, last_key)]
+    return [(first_key, last_key)]
 
 
-async def search_birthday(param: dict, user_id: int, db: Session):
+async def search_birthday(param: dict, user_id: int, db: AsyncSession):
     """
-    The search_birthday function searches for contacts with birthdays in the next 7 days.
+    The search_birthday function searches for contacts with birthdays in the next days (7 by default).
+        The search runs on the month-day key, so it matches birthdays of every year, handles
+        the December to January wraparound and is answered from the (user_id, birthday_key) index.
         Args:
             param (dict): The parameters to filter by.
             user_id (int): The id of the user who is making this request.
-            db (Session, optional): SQLAlchemy Session instance. Defaults to None.&lt;/code&gt;
+            db (AsyncSession, optional): SQLAlchemy AsyncSession instance. Defaults to None.
     
-    :param param: dict: Pass in the query parameters from the url
+    :param param: dict: Pass in the query parameters from the url: days, after (decoded cursor), skip and limit
     :param user_id: int: Filter the contacts by user_id
-    :param db: Session: Pass the database connection to the function
-    :return: A query object, not a list of contacts
+    :param db: AsyncSession: Pass the database connection to the function
+    :return: A list of contacts ordered by the upcoming birthday
     :doc-author: Trelent
     """
-    days:int = int(param.get("days", 7)) + 1
-    filter_afetr = date.today()
-    filter_before = date.today() + timedelta(days = days)
-    query = db.query(Contact).filter_by(user_id=user_id)
-    query = query.filter(Contact.birthday > filter_afetr, Contact.birthday <= filter_before)
-    contacts = query.offset(param.get("skip")).limit(param.get("limit"))
-    return contacts
\ No newline at end of file
+    days: int = int(param.get("days", 7))
+    ranges = birthday_ranges(date.today(), days)
+    after = param.get("after")
+    if after is not None:
+        # continue inside the range the cursor row belongs to and keep the ranges after it
+        position = tuple_(Contact.birthday_key, Contact.id) > tuple_(*after)
+        current = next((i for i, (first, last) in enumerate(ranges) if first <= after[0] <= last), len(ranges))
+        ranges_filter = [
+            and_(Contact.birthday_key.between(first, last), position) if i == current
+            else Contact.birthday_key.between(first, last)
+            for i, (first, last) in enumerate(ranges) if i >= current
+        ]
+    else:
+        ranges_filter = [Contact.birthday_key.between(first, last) for first, last in ranges]
+    stmt = select(Contact).filter_by(user_id=user_id)
+    stmt = stmt.filter(or_(false(), *ranges_filter))
+    if len(ranges) > 1:
+        stmt = stmt.order_by(case((Contact.birthday_key >= ranges[0][0], 0), else_=1), Contact.birthday_key, Contact.id)
+    else:
+        stmt = stmt.order_by(Contact.birthday_key, Contact.id)
+    if after is None and param.get("skip"):
+        stmt = stmt.offset(param.get("skip"))
+    contacts = await db.execute(stmt.limit(param.get("limit")))
+    return contacts.scalars().all()
@@ -0,0 +1,114 @@
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import EmailOutbox
+
+PENDING = "pending"
+SENT = "sent"
+DEAD = "dead"
+
+
+async def enqueue(kind: str, recipient: str, payload: dict, db: AsyncSession) -> bool:
+    """
+    The enqueue function appends an email to the outbox, to be sent by the sender worker.
+        The caller commits, so the email is stored in the same transaction as the change it is about.
+        While an email of the same kind is still waiting for the recipient, nothing is added,
+        so a repeated request does not send the same email twice.
+
+    :param kind: str: Kind of the email, selects its subject and template
+    :param recipient: str: Email address to send to
+    :param payload: dict: Values for the template
+    :param db: AsyncSession: Pass the database session to the function
+    :return: True if the email was added, False if one was already waiting
+    :doc-author: Trelent
+    """
+    try:
+        # a savepoint, so a duplicate only rolls back this row and not the caller's transaction
+        async with db.begin_nested():
+            db.add(EmailOutbox(kind=kind, recipient=recipient, payload=json.dumps(payload), status=PENDING,
+                               next_attempt_at=datetime.utcnow()))
+    except IntegrityError:
+        return False
+    return True
+
+
+async def claim(limit: int, lease: float, db: AsyncSession) -> list[EmailOutbox]:
+    """
+    The claim function takes the emails that are due for sending, for lease seconds.
+        A claimed email is not handed to another worker until the lease runs out, so a worker
+        that dies while sending only delays its emails. Every claim counts as an attempt.
+
+    :param limit: int: Maximum number of emails to claim
+    :param lease: float: Seconds the worker has to send them
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The claimed emails
+    :doc-author: Trelent
+    """
+    now = datetime.utcnow()
+    due = (EmailOutbox.status == PENDING, EmailOutbox.next_attempt_at <= now,
+           or_(EmailOutbox.locked_until.is_(None), EmailOutbox.locked_until < now))
+    ids = select(EmailOutbox.id).where(*due).order_by(EmailOutbox.next_attempt_at).limit(limit)
+    stmt = (
+        update(EmailOutbox)
+        # the conditions are checked again on the rows themselves, two workers cannot claim the same email
+        .where(EmailOutbox.id.in_(ids.scalar_subquery()), *due)
+        .values(locked_until=now + timedelta(seconds=lease), attempts=EmailOutbox.attempts + 1)
+        .returning(EmailOutbox)
+        # the returned locked_until identifies the claim, it must not come from an object loaded earlier
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    messages = (await db.execute(stmt)).scalars().all()
+    await db.commit()
+    return list(messages)
+
+
+async def mark_sent(message: EmailOutbox, db: AsyncSession) -> bool:
+    """
+    The mark_sent function records that an email was handed to the mail server.
+        Only the worker that still holds the claim may record it: once its lease ran out and
+        another worker claimed the email again, the write is skipped.
+
+    :param message: EmailOutbox: The email as returned by claim
+    :param db: AsyncSession: Pass the database session to the function
+    :return: True if the outcome was recorded, False if the claim was lost
+    :doc-author: Trelent
+    """
+    return await _finish(message, {"status": SENT, "sent_at": datetime.utcnow(), "locked_until": None,
+                                   "last_error": None}, db)
+
+
+async def mark_failed(message: EmailOutbox, error: str, retry_at: datetime | None, db: AsyncSession) -> bool:
+    """
+    The mark_failed function records a failed attempt to send an email.
+        As with mark_sent, nothing is written once the claim was lost.
+
+    :param message: EmailOutbox: The email as returned by claim
+    :param error: str: Why the attempt failed
+    :param retry_at: datetime | None: When to try again, None to give up on the email
+    :param db: AsyncSession: Pass the database session to the function
+    :return: True if the outcome was recorded, False if the claim was lost
+    :doc-author: Trelent
+    """
+    values = {"locked_until": None, "last_error": error[:1000]}
+    if retry_at is None:
+        values["status"] = DEAD
+    else:
+        values["next_attempt_at"] = retry_at
+    return await _finish(message, values, db)
+
+
+async def _finish(message: EmailOutbox, values: dict, db: AsyncSession) -> bool:
+    # the locked_until a claim sets identifies it: a later claim of the same email sets another one
+    stmt = (
+        update(EmailOutbox)
+        .where(EmailOutbox.id == message.id, EmailOutbox.locked_until == message.locked_until)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(stmt)
+    await db.commit()
+    return result.rowcount == 1
@@ -0,0 +1,129 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from sqlalchemy import func, literal, literal_column, tuple_
+
+from src.database.models import Contact
+from src.schemas import ContactSort
+
+
+BIRTHDAY_SORT = "birthday_key,id"
+
+# Nullable sort columns are wrapped in coalesce() so every row has a comparable key.
+# The expressions are repeated verbatim by the composite indexes on Contact,
+# which lets both PostgreSQL and SQLite seek straight to the cursor position.
+SORT_KEYS = {
+    ContactSort.id: (
+        (Contact.id, int),
+    ),
+    ContactSort.name: (
+        (func.coalesce(Contact.last_name, literal_column("''")), str),
+        (func.coalesce(Contact.first_name, literal_column("''")), str),
+        (Contact.id, int),
+    ),
+    ContactSort.created_at: (
+        (Contact.created_at, datetime.fromisoformat),
+        (Contact.id, int),
+    ),
+    ContactSort.birthday: (
+        (func.coalesce(Contact.birthday, literal_column("'9999-12-31'")), date.fromisoformat),
+        (Contact.id, int),
+    ),
+    # upcoming birthdays, only used by search_birthday
+    BIRTHDAY_SORT: (
+        (Contact.birthday_key, int),
+        (Contact.id, int),
+    ),
+}
+
+SORT_DEFAULTS = {
+    "last_name": "",
+    "first_name": "",
+    "birthday": date(9999, 12, 31),
+}
+
+SORT_ATTRIBUTES = {
+    ContactSort.id: ("id",),
+    ContactSort.name: ("last_name", "first_name", "id"),
+    ContactSort.created_at: ("created_at", "id"),
+    ContactSort.birthday: ("birthday", "id"),
+    BIRTHDAY_SORT: ("birthday_key", "id"),
+}
+
+
+def encode_cursor(sort: str, values: list) -> str:
+    """
+    The encode_cursor function packs the sort key of the last row of a page into an opaque token.
+
+    :param sort: str: Sort order the cursor belongs to
+    :param values: list: Sort key values of the last row
+    :return: A url-safe cursor string
+    """
+    payload = json.dumps({"s": sort, "v": [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]},
+                         separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: ContactSort | str) -> list:
+    """
+    The decode_cursor function unpacks a cursor produced by encode_cursor for the given sort order.
+
+    :param cursor: str: Cursor received from the client
+    :param sort: ContactSort | str: Sort order of the current request
+    :return: The sort key values of the row to continue after
+    :raises ValueError: If the cursor is malformed or was issued for another sort order
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        values = payload["v"]
+        if payload["s"] != getattr(sort, "value", sort) or len(values) != len(SORT_KEYS[sort]):
+            raise ValueError("Cursor does not match the sort order")
+        return [parse(value) for (_, parse), value in zip(SORT_KEYS[sort], values)]
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, KeyError, TypeError) as err:
+        raise ValueError("Invalid cursor") from err
+
+
+def cursor_for(contact: Contact, sort: ContactSort | str) -> str:
+    """
+    The cursor_for function returns the cursor pointing right after the given contact.
+
+    :param contact: Contact: Last contact of the page
+    :param sort: ContactSort | str: Sort order of the page
+    :return: A cursor string
+    """
+    values = []
+    for attribute in SORT_ATTRIBUTES[sort]:
+        value = getattr(contact, attribute)
+        values.append(SORT_DEFAULTS.get(attribute) if value is None else value)
+    return encode_cursor(getattr(sort, "value", sort), values)
+
+
+def order_by(sort: ContactSort) -> list:
+    """
+    The order_by function returns the ORDER BY expressions of a sort order.
+
+    :param sort: ContactSort: Sort order
+    :return: A list of column expressions
+    """
+    return [column for column, _ in SORT_KEYS[sort]]
+
+
+def _bind(value, dialect_name: str):
+    if dialect_name == "sqlite" and isinstance(value, datetime):
+        # SQLite keeps func.now() defaults as "YYYY-MM-DD HH:MM:SS" text, compare against the same format
+        return literal(value.isoformat(sep=" ", timespec="microseconds" if value.microsecond else "seconds"))
+    return value
+
+
+def after(sort: ContactSort, values: list, dialect_name: str):
+    """
+    The after function returns the keyset condition selecting rows that follow the cursor position.
+
+    :param sort: ContactSort: Sort order
+    :param values: list: Decoded cursor values
+    :param dialect_name: str: Name of the database dialect
+    :return: A row-value comparison
+    """
+    return tuple_(*order_by(sort)) > tuple_(*(_bind(value, dialect_name) for value in values))
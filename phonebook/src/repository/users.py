@@ -1,38 +1,45 @@
 from libgravatar import Gravatar
-from sqlalchemy.orm import Session
+from sqlalchemy import func, lambda_stmt, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.database.db import hot_query
 from src.database.models import User
 from src.schemas import UserModel
+from src.services.user_cache import user_cache
 
 
-async def get_user_by_email(email: str, db: Session) -> User:
+async def get_user_by_email(email: str, db: AsyncSession) -> User:
     """
     The get_user_by_email function returns a user object from the database based on the email address provided.
         Args:
             email (str): The email address of the user to be retrieved.
-            db (Session): A connection to a database session.
+            db (AsyncSession): A connection to a database session.
         Returns:
             User: A single user object matching the provided email address.
     
     :param email: str: Specify the type of data that is being passed in
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A single user object that matches the email address provided
     :doc-author: Trelent
     """
-    return db.query(User).filter(User.email == email).first()
+    email = email.lower()
+    stmt = lambda_stmt(lambda: select(User).filter(func.lower(User.email) == email))
+    user = await db.execute(stmt, execution_options=hot_query("get_user_by_email"))
+    return user.scalar_one_or_none()
 
 
-async def create_user(body: UserModel, db: Session) -> User:
+async def create_user(body: UserModel, db: AsyncSession, commit: bool = True) -> User:
     """
     The create_user function creates a new user in the database.
         Args:
             body (UserModel): The UserModel object containing the data to be inserted into the database.
-            db (Session): The SQLAlchemy Session object used to interact with the database.
+            db (AsyncSession): The SQLAlchemy Session object used to interact with the database.
         Returns:
             User: A newly created user from the provided data.
     
     :param body: UserModel: Pass in the user object that is created when a new user registers
-    :param db: Session: Create a new user in the database
+    :param db: AsyncSession: Create a new user in the database
+    :param commit: bool: Commit the user, False leaves the commit to the caller
     :return: A user object
     :doc-author: Trelent
     """
@@ -45,55 +52,74 @@ async def create_user(body: UserModel, db: Session) -> User:
     # new_user = User(**body.dict(), avatar=avatar)
     new_user = User(**body.dict(), avatar=avatar)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    if commit:
+        await db.commit()
+    else:
+        await db.flush()
+    await db.refresh(new_user)
     return new_user
 
 
-async def update_token(user: User, token: str | None, db: Session) -> None:
+async def update_token(user: User, token: str | None, db: AsyncSession) -> None:
     """
     The update_token function updates the refresh_token field of a user in the database.
     
     :param user: User: Get the user's id
     :param token: str | None: Set the refresh_token field in the user table
-    :param db: Session: Commit the changes to the database
+    :param db: AsyncSession: Commit the changes to the database
     :return: None
     :doc-author: Trelent
     """
     user.refresh_token = token
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(user.email)
 
-async def confirmed_email(email: str, db: Session) -> None:
+async def update_password(user: User, password_hash: str, db: AsyncSession) -> None:
+    """
+    The update_password function stores a new password hash of a user.
+    
+    :param user: User: The user to update
+    :param password_hash: str: Hash made by auth_service
+    :param db: AsyncSession: Commit the changes to the database
+    :return: None
+    :doc-author: Trelent
+    """
+    user.password = password_hash
+    await db.commit()
+
+async def confirmed_email(email: str, db: AsyncSession) -> None:
     """
     The confirmed_email function sets the confirmed field of a user to True.
     
     :param email: str: Get the email of the user who is trying to confirm their account
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: None
     :doc-author: Trelent
     """
     user = await get_user_by_email(email, db)
     user.confirmed = True
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(email)
     
-async def update_avatar(email, url: str | None, db: Session) -> User:
+async def update_avatar(email, url: str | None, db: AsyncSession) -> User:
     """
     The update_avatar function updates the avatar of a user.
     
     Args:
         email (str): The email address of the user to update.
         url (str | None): The URL to set as the new avatar for this user, or None if no change is desired.
-        db (Session): A database session object used for querying and updating data in our database.  This is passed in by FastAPI so we don't have to create it ourselves!  See https://fastapi.tiangolo.com/advanced/dependencies/#database-access-with-sqlalchemycore for
+        db (AsyncSession): A database session object used for querying and updating data in our database.  This is passed in by FastAPI so we don't have to create it ourselves!  See https://fastapi.tiangolo.com/advanced/dependencies/#database-access-with-sqlalchemycore for
     
     :param email: Find the user in the database
     :param url: str | None: Specify the type of the url parameter
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A user object
     :doc-author: Trelent
     """
     user = await get_user_by_email(email, db)
     user.avatar = url
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(email)
     return user
 
 
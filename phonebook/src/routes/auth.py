@@ -1,14 +1,19 @@
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request, Response,Cookie
+from fastapi import APIRouter, HTTPException, Depends, status, Security, Request, Response,Cookie
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.conf.config import settings
 from src.database.db import get_db
-from src.schemas import UserModel, UserResponse, TokenModel,RequestEmail
+from src.schemas import Principal, UserModel, UserResponse, TokenModel,RequestEmail
+from src.repository import outbox as repository_outbox
 from src.repository import users as repository_users
 from src.services.auth import auth_service
-from src.services.email import send_email
+from src.services.refresh_tokens import refresh_token_store
+from src.services.revocation import revocation_list
+from src.services.email import CONFIRM_EMAIL
+from src.services.login_throttle import LoginThrottled, login_throttle
 
 
 router = APIRouter(prefix='/auth', tags=["auth"])
@@ -16,80 +21,145 @@ security = HTTPBearer()
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def signup(body: UserModel, request: Request, db: AsyncSession = Depends(get_db)):
     """
     The signup function creates a new user in the database.
-        It also sends an email to the user's email address for confirmation.
+        It also queues an email to the user's email address for confirmation in the outbox,
+        which the email sender worker delivers.
         The function returns a JSON object containing the newly created user and a message.
     
     :param body: UserModel: Get the data from the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base url of the application
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A dictionary with the user and a message
     :doc-author: Trelent
     """
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
-    new_user = await repository_users.create_user(body, db)
-    background_tasks.add_task(send_email, new_user.email, new_user.username, request.base_url)
+    body.password = await auth_service.hash_password(body.password)
+    # the user and its confirmation email are committed together, neither is stored without the other
+    new_user = await repository_users.create_user(body, db, commit=False)
+    await repository_outbox.enqueue(CONFIRM_EMAIL, new_user.email,
+                                    {"username": new_user.username, "host": str(request.base_url)}, db)
+    await db.commit()
     return {"user": new_user, "detail": "User successfully created. Check your email for confirmation."}
 
 
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(request: Request, body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
     The login function is used to authenticate a user.
+        Every login starts a new refresh token family in Redis, so each device keeps its own session.
+        Attempts are throttled per client address and per account before the user is read or the
+        password is checked, so a credential-stuffing run is turned away without database or bcrypt work.
     
+    :param request: Request: Get the client address and the User-Agent the session is recorded with
     :param body: OAuth2PasswordRequestForm: Get the username and password from the request body
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A dict with the access_token, refresh_token and token_type
     :doc-author: Trelent
     """
+    try:
+        await login_throttle.check(request.client.host if request.client else "", body.username)
+    except LoginThrottled as error:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many login attempts",
+                            headers={"Retry-After": str(error.retry_after)})
     user = await repository_users.get_user_by_email(body.username, db)
     if user is None:
+        await login_throttle.failed(body.username)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    valid, new_hash = await auth_service.verify_password_and_update(body.password, user.password)
+    if not valid:
+        await login_throttle.failed(body.username)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
+    await login_throttle.succeeded(body.username)
+    if new_hash:
+        await repository_users.update_password(user, new_hash, db)
     # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-    await repository_users.update_token(user, refresh_token, db)
+    family = await refresh_token_store.issue(user.id, request.headers.get("user-agent"))
+    access_token = await auth_service.create_access_token(data={**auth_service.access_claims(user),
+                                                                "fam": family["fam"]})
+    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email, "uid": user.id, **family},
+                                                            expires_delta=settings.refresh_token_ttl)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def refresh_token(request: Request, credentials: HTTPAuthorizationCredentials = Security(security),
+                        db: AsyncSession = Depends(get_db)):
     """
     The refresh_token function is used to refresh the access token.
     It takes in a refresh token and returns a new access_token, refresh_token, and token type.
+    The token family of the refresh token is rotated in Redis; a token that was already rotated
+    away is a stolen or replayed one, and its whole family is revoked.
     
-    
+    :param request: Request: Get the User-Agent of the client
     :param credentials: HTTPAuthorizationCredentials: Get the token from the request header
-    :param db: Session: Connect to the database
+    :param db: AsyncSession: Connect to the database
     :return: A dictionary with the access_token, refresh_token and token_type
     :doc-author: Trelent
     """
     token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
-    user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await repository_users.update_token(user, None, db)
+    payload = await auth_service.decode_refresh_token(token)
+    user = await repository_users.get_user_by_email(payload["sub"], db)
+    if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
-
-    access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    await repository_users.update_token(user, refresh_token, db)
+    if payload.get("fam") is None:
+        # issued before the tokens moved to Redis: accepted once against users.refresh_token
+        if user.refresh_token != token:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+        await repository_users.update_token(user, None, db)
+        family = await refresh_token_store.issue(user.id, request.headers.get("user-agent"))
+    else:
+        _, family = await refresh_token_store.rotate(user.id, payload["fam"], payload.get("jti", ""))
+        if family is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+
+    access_token = await auth_service.create_access_token(data={**auth_service.access_claims(user),
+                                                                "fam": family["fam"]})
+    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email, "uid": user.id, **family},
+                                                            expires_delta=settings.refresh_token_ttl)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
+@router.post('/logout')
+async def logout(token: str = Depends(auth_service.oauth2_scheme)):
+    """
+    The logout function ends the session the access token belongs to:
+    the access token is revoked on every worker and the refresh token family it was issued with is revoked.
+    
+    :param token: str: Get the access token from the authorization header
+    :return: A dictionary with a message
+    :doc-author: Trelent
+    """
+    payload = await auth_service.verify_access_token(token)
+    await auth_service.revoke_access_token(token)
+    if payload.get("fam"):
+        await refresh_token_store.revoke(payload["fam"])
+    return {"message": "Logged out"}
+
+
+@router.post('/logout_all')
+async def logout_all(current_user: Principal = Depends(auth_service.get_current_principal)):
+    """
+    The logout_all function ends every session of the user: no refresh token or access token issued
+    so far can be used again, on any device.
+    
+    :param current_user: Principal: Get the user id from the token
+    :return: A dictionary with a message
+    :doc-author: Trelent
+    """
+    await refresh_token_store.revoke_all(current_user.id)
+    await revocation_list.revoke_user(current_user.id, settings.access_token_ttl)
+    return {"message": "All sessions ended"}
+
+
 
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     """
     The confirmed_email function is used to confirm a user's email address.
         It takes the token from the URL and uses it to get the user's email address.
@@ -100,7 +170,7 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
          with that email as its
     
     :param token: str: Get the token from the url
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A dict with a message key and the value is either &quot;your email is already confirmed&quot; or &quot;email confirmed&quot;
     :doc-author: Trelent
     """
@@ -114,29 +184,28 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
     return {"message": "Email confirmed"}
       
 @router.post('/request_email')
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+async def request_email(body: RequestEmail, request: Request, db: AsyncSession = Depends(get_db)):
     """
     The request_email function is used to send an email to the user with a link that will allow them
     to confirm their email address. The function takes in a RequestEmail object, which contains the
     email of the user who wants to confirm their account. It then checks if there is already a confirmed
-    user with that email address, and if so returns an error message saying as much. If not, it sends 
-    an asynchronous task (using FastAPI's BackgroundTasks) to send_email(), which sends out an actual 
-    confirmation email.
+    user with that email address, and if so returns an error message saying as much. If not, it adds 
+    a confirmation email to the outbox, which the email sender worker delivers.
     
     :param body: RequestEmail: Pass the email from the request body to this function
-    :param background_tasks: BackgroundTasks: Add a task to the background
     :param request: Request: Get the base url of the application
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A dictionary with a message
     :doc-author: Trelent
     """
     user = await repository_users.get_user_by_email(body.email, db)
 
-    if user.confirmed:
+    if user and user.confirmed:
         return {"message": "Your email is already confirmed"}
     if user:
-        background_tasks.add_task(send_email, user.email, user.username, request.base_url)
+        await repository_outbox.enqueue(CONFIRM_EMAIL, user.email,
+                                        {"username": user.username, "host": str(request.base_url)}, db)
+        await db.commit()
     return {"message": "Check your email for confirmation."}
 
 
@@ -1,72 +1,129 @@
 from typing import List
 
-from fastapi import Path, Depends, HTTPException, Query, status, APIRouter
+import csv
+
+from fastapi import Path, Depends, HTTPException, Query, status, APIRouter, Response, UploadFile, File
+from fastapi.responses import StreamingResponse
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
-from src.schemas import ContactFavoriteModel, ContactModel, ContactResponse
+from src.database.db import get_db, get_read_db, get_read_sessionmaker
+from src.conf.config import settings
+from src.schemas import ContactBulkFavorite, ContactBulkResult, ContactBulkSelection, ContactFavoriteModel, \
+    ContactModel, ContactResponse, ContactSort, ContactStats, ContactSuggestion, ImportReport, Principal
 from src.repository import contacts as repository_contacts
+from src.repository import pagination
 from src.services.auth import auth_service
-from src.database.models import User
-from fastapi_limiter.depends import RateLimiter
+from src.services.autocomplete import autocomplete
+from src.services import contacts_io
+from src.services.rate_limiter import RateLimit
 
 
 router = APIRouter(prefix="/contacts", tags=["contacts"])
 
 
-@router.get("/search", response_model=List[ContactResponse])
+def decode_cursor(cursor: str | None, sort: ContactSort | str) -> list | None:
+    """
+    The decode_cursor function turns the cursor query parameter into sort key values.
+
+    :param cursor: str | None: Cursor from the previous page
+    :param sort: ContactSort | str: Sort order of the request
+    :return: Decoded cursor values or None for the first page
+    :raises HTTPException: 400 if the cursor is invalid
+    """
+    if not cursor:
+        return None
+    try:
+        return pagination.decode_cursor(cursor, sort)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def set_next_cursor(response: Response, contacts: list, limit: int, sort: ContactSort | str) -> None:
+    """
+    The set_next_cursor function adds the X-Next-Cursor header when the page is full.
+
+    :param response: Response: Outgoing response
+    :param contacts: list: Contacts of the current page
+    :param limit: int: Page size
+    :param sort: ContactSort | str: Sort order of the page
+    :return: None
+    """
+    if contacts and len(contacts) == limit:
+        response.headers["X-Next-Cursor"] = pagination.cursor_for(contacts[-1], sort)
+
+
+@router.get("/search", response_model=List[ContactResponse], dependencies=[Depends(RateLimit(cost=5))])
 async def search_contacts(
+    q: str = Query(default=None, max_length=100),
     first_name: str = None,
     last_name: str = None,
     email: str = None,
     skip: int = 0,
     limit: int = Query(default=10, le=100, ge=10),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    sort: ContactSort = ContactSort.id,
+    cursor: str | None = None,
+    response: Response = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(auth_service.get_current_principal),
 ):
     """
     The search_contacts function searches for contacts in the database.
         Args:
+            q (str): Full-text search over name, email, phone and comments, results are ranked by relevance.
             first_name (str): The first name of the contact to search for.
             last_name (str): The last name of the contact to search for.
             email (str): The email address of the contact to search for.
     
+    :param q: str: Full-text search, every word must match the beginning of a word of the contact
     :param first_name: str: Search for a contact by first name
     :param last_name: str: Search for a contact by last name
     :param email: str: Search for contacts by email
-    :param skip: int: Skip the first n records in the database
+    :param skip: int: Skip the first n records in the database, ignored when a cursor is given
     :param limit: int: Limit the number of contacts returned
     :param le: Limit the number of results returned
     :param ge: Set the minimum value of the limit parameter
-    :param db: Session: Get the database session
-    :param current_user: User: Get the current user from the database
+    :param sort: ContactSort: Sort order of the results, not used with q
+    :param cursor: str | None: X-Next-Cursor of the previous page, not used with q
+    :param response: Response: Carries the X-Next-Cursor header
+    :param db: AsyncSession: Get the database session
+    :param current_user: Principal: Get the current user from the token
     :param : Filter the contacts by first name, last name or email
     :return: A list of contacts
     :doc-author: Trelent
     """
     contacts = None
-    if first_name or last_name or email:
+    if q and cursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Full-text results are ranked, page them with skip instead of a cursor")
+    if q or first_name or last_name or email:
         param = {
+            "q": q,
             "first_name": first_name,
             "last_name": last_name,
             "email": email,
+            "sort": sort,
+            "after": decode_cursor(cursor, sort),
             "skip": skip,
             "limit": limit,
         }
         user_id = current_user.id
-        contacts = await repository_contacts.search_contacts(param, db, user_id,)
+        contacts = await repository_contacts.search_contacts(param, user_id, db)
     if contacts is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+    if not q:
+        set_next_cursor(response, contacts, limit, sort)
     return contacts
 
-@router.get("/search/birtdays", response_model=List[ContactResponse])
+@router.get("/search/birtdays", response_model=List[ContactResponse], dependencies=[Depends(RateLimit(cost=5))])
 async def search_contacts(
     days: int = Query(default=7, le=30, ge=1),
     skip: int = 0,
     limit: int = Query(default=10, le=100, ge=10),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    cursor: str | None = None,
+    response: Response = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(auth_service.get_current_principal),
 ):
     """
     The search_contacts function searches for contacts that have birthdays within the next 7 days.
@@ -77,12 +134,14 @@ async def search_contacts(
     :param days: int: Set the number of days to search for birthdays
     :param le: Set the maximum value for a parameter
     :param ge: Set a minimum value for the parameter
-    :param skip: int: Skip the first n records
+    :param skip: int: Skip the first n records, ignored when a cursor is given
     :param limit: int: Limit the number of results returned
     :param le: Set a maximum value for the parameter
     :param ge: Set the minimum value of the parameter
-    :param db: Session: Get the database session
-    :param current_user: User: Get the user id of the current user
+    :param cursor: str | None: X-Next-Cursor of the previous page
+    :param response: Response: Carries the X-Next-Cursor header
+    :param db: AsyncSession: Get the database session
+    :param current_user: Principal: Get the user id of the current user
     :param : Get the current user from the database
     :return: A list of contacts
     :doc-author: Trelent
@@ -91,21 +150,26 @@ async def search_contacts(
     if days:
         param = {
             "days": days,
+            "after": decode_cursor(cursor, pagination.BIRTHDAY_SORT),
             "skip": skip,
             "limit": limit,
         }
         contacts = await repository_contacts.search_birthday(param, current_user.id, db)
     if contacts is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+    set_next_cursor(response, contacts, limit, pagination.BIRTHDAY_SORT)
     return contacts
 
-@router.get("", response_model=List[ContactResponse])
+@router.get("", response_model=List[ContactResponse], dependencies=[Depends(RateLimit())])
 async def get_contacts(
     skip: int = 0,
     limit: int = Query(default=10, le=100, ge=10),
     favorite: bool = None, 
-    db: Session = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    sort: ContactSort = ContactSort.id,
+    cursor: str | None = None,
+    response: Response = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(auth_service.get_current_principal),
 ):
     """
     The get_contacts function returns a list of contacts.
@@ -119,28 +183,109 @@ async def get_contacts(
     :param le: Limit the maximum number of results that can be returned
     :param ge: Specify the minimum value of a number
     :param favorite: bool: Filter the contacts by favorite
-    :param db: Session: Pass the database session to the repository layer
-    :param current_user: User: Get the user id from the token
+    :param sort: ContactSort: Sort order: id, last_name,first_name,id, created_at,id or birthday,id
+    :param cursor: str | None: X-Next-Cursor of the previous page; deep pages cost the same as the first one
+    :param response: Response: Carries the X-Next-Cursor and X-Total-Count headers
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :param current_user: Principal: Get the user id from the token
     :param : Skip the first n contacts
     :return: A list of contacts
     :doc-author: Trelent
     """
-    contacts = await repository_contacts.get_contacts(db=db, skip=skip, user_id=current_user.id, limit=limit, favorite=favorite)
+    after = decode_cursor(cursor, sort)
+    contacts = await repository_contacts.get_contacts(db=db, skip=skip, user_id=current_user.id, limit=limit,
+                                                      favorite=favorite, sort=sort, after=after)
+    set_next_cursor(response, contacts, limit, sort)
+    total = await repository_contacts.count_contacts(current_user.id, db, favorite)
+    response.headers["X-Total-Count"] = str(total)
     return contacts
 
 
-@router.get("/{contact_id}", response_model=ContactResponse)
-async def get_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_db),current_user: User = Depends(auth_service.get_current_user),):
+@router.get("/stats", response_model=ContactStats, dependencies=[Depends(RateLimit())])
+async def get_contact_stats(
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(auth_service.get_current_principal),
+):
+    """
+    The get_contact_stats function returns the aggregates of the user's address book:
+        the number of contacts, of favorite contacts and of birthdays in every month.
+        The numbers come from the maintained counters, the contacts are not counted on request.
+    
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :param current_user: Principal: Get the user id from the token
+    :return: The contact statistics
+    :doc-author: Trelent
+    """
+    return await repository_contacts.get_stats(current_user.id, db)
+
+
+@router.get("/autocomplete", response_model=List[ContactSuggestion], dependencies=[Depends(RateLimit())])
+async def autocomplete_contacts(
+    prefix: str = Query(min_length=1, max_length=50),
+    limit: int = Query(default=10, ge=1, le=50),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(auth_service.get_current_principal),
+):
+    """
+    The autocomplete_contacts function suggests contacts for type-ahead lookup.
+        The contacts are matched from an in-memory prefix index of the user's names, emails and phones,
+        the database is only read when the index of the user has to be built. The index is built from
+        the primary, so it never misses contacts the replica has not received yet.
+    
+    :param prefix: str: Text typed so far, matches the beginning of a name, email, phone or a word of them
+    :param limit: int: Maximum number of suggestions
+    :param db: AsyncSession: Get the database session
+    :param current_user: Principal: Get the current user from the token
+    :return: A list of suggestions
+    :doc-author: Trelent
+    """
+    return await autocomplete.lookup(current_user.id, prefix, limit, db)
+
+
+@router.get("/export", response_class=StreamingResponse,
+description='No more than 2 exports per minute',
+            dependencies=[Depends(RateLimit(times=2, seconds=60, scope="export")), Depends(RateLimit(cost=50))])
+async def export_contacts(
+    format: str = Query(default=contacts_io.NDJSON, pattern="^(ndjson|csv|vcf)$"),
+    session_maker=Depends(get_read_sessionmaker),
+    current_user: Principal = Depends(auth_service.get_current_principal),
+):
+    """
+    The export_contacts function streams the whole address book of the user as NDJSON, CSV or vCard.
+        Rows are read through a server-side cursor and written out batch by batch. The session is
+        opened inside the stream, because request dependencies are closed before the body is sent.
+    
+    :param format: str: ndjson, csv or vcf
+    :param session_maker: async_sessionmaker: Opens the session the rows are streamed from
+    :param current_user: Principal: Get the user id from the token
+    :return: A streaming response with the contacts
+    :doc-author: Trelent
+    """
+    media_type, extension = contacts_io.EXPORT_FORMATS[format]
+    user_id = current_user.id
+
+    async def content():
+        async with session_maker() as db:
+            batches = repository_contacts.stream_contacts(user_id, db, settings.export_batch_size)
+            async for chunk in contacts_io.export_contacts(batches, format):
+                yield chunk
+
+    return StreamingResponse(content(), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="contacts.{extension}"'})
+
+
+@router.get("/{contact_id}", response_model=ContactResponse, dependencies=[Depends(RateLimit())])
+async def get_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_read_db),current_user: Principal = Depends(auth_service.get_current_principal),):
     """
     The get_contact function returns a contact by id.
         Args:
             contact_id (int): The id of the contact to be returned.
-            db (Session, optional): SQLAlchemy Session. Defaults to Depends(get_db).
-            current_user (User, optional): User object from auth middleware. Defaults to Depends(auth_service.get_current_user).
+            db (AsyncSession, optional): SQLAlchemy AsyncSession. Defaults to Depends(get_read_db).
+            current_user (Principal, optional): Principal from the access token. Defaults to Depends(auth_service.get_current_principal).
     
     :param contact_id: int: Get the contact_id from the url
-    :param db: Session: Pass a database session to the function
-    :param current_user: User: Get the current user from the database
+    :param db: AsyncSession: Pass a database session to the function
+    :param current_user: Principal: Get the current user from the token
     :param : Get the contact id from the url
     :return: A contact object
     :doc-author: Trelent
@@ -152,63 +297,140 @@ async def get_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_db
 
 
 @router.post("", response_model=ContactResponse, status_code=status.HTTP_201_CREATED,
-description='No more than 10 requests per minute', dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def create_contact(body: ContactModel, db: Session = Depends(get_db),current_user: User = Depends(auth_service.get_current_user),):
+description='No more than 10 requests per minute',
+             dependencies=[Depends(RateLimit(times=10, seconds=60, scope="create")), Depends(RateLimit())])
+async def create_contact(body: ContactModel, db: AsyncSession = Depends(get_db),current_user: Principal = Depends(auth_service.get_current_principal),):
     """
     The create_contact function creates a new contact in the database.
         Args:
             body (ContactModel): The contact to create.
-            db (Session, optional): SQLAlchemy Session. Defaults to Depends(get_db).
+            db (AsyncSession, optional): SQLAlchemy AsyncSession. Defaults to Depends(get_db).
     
     :param body: ContactModel: Pass the contact model to the function
-    :param db: Session: Pass the database session to the repository
-    :param current_user: User: Get the user id from the token
+    :param db: AsyncSession: Pass the database session to the repository
+    :param current_user: Principal: Get the user id from the token
     :param : Get the contact by id
     :return: A contactmodel
     :doc-author: Trelent
     """
-    contact = await repository_contacts.get_contact_by_email(body.email, current_user.id, db)
-    if contact:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT, detail=f"Email is exist!"
-        )
     try:
         contact = await repository_contacts.create(body, current_user.id, db)
     except IntegrityError as err:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail=f"Error: {err}"
         )
+    if contact is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=f"Email is exist!"
+        )
     return contact
 
 
-@router.put("/{contact_id}", response_model=ContactResponse)
+@router.post("/import", response_model=ImportReport,
+description='No more than 2 imports per minute',
+             dependencies=[Depends(RateLimit(times=2, seconds=60, scope="import")), Depends(RateLimit(cost=100))])
+async def import_contacts(
+    file: UploadFile = File(),
+    format: str | None = Query(default=None, pattern="^(csv|vcard)$"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(auth_service.get_current_principal),
+):
+    """
+    The import_contacts function imports contacts from an uploaded CSV or vCard file.
+        The file is read as a stream and inserted in batches, rows with errors and emails
+        that already exist are skipped and listed in the report.
+    
+    :param file: UploadFile: CSV with a header of ContactModel fields, or vCard
+    :param format: str | None: csv or vcard, detected from the file name or content type when omitted
+    :param db: AsyncSession: Pass the database session to the repository
+    :param current_user: Principal: Get the user id from the token
+    :return: The import report
+    :doc-author: Trelent
+    """
+    file_format = format or contacts_io.detect_format(file.filename, file.content_type)
+    if file_format is None:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Upload a CSV or vCard file")
+    rows = contacts_io.read_csv(file.file) if file_format == contacts_io.CSV else contacts_io.read_vcard(file.file)
+    try:
+        return await contacts_io.import_contacts(rows, current_user.id, db)
+    except csv.Error as err:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Malformed CSV: {err}")
+
+
+@router.patch("/bulk", response_model=ContactBulkResult, dependencies=[Depends(RateLimit(cost=5))])
+async def bulk_favorite_update(
+    body: ContactBulkFavorite,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(auth_service.get_current_principal),
+):
+    """
+    The bulk_favorite_update function sets the favorite status of many contacts at once.
+        The contacts are given by a list of ids or by a filter, the change is one UPDATE in one transaction.
+    
+    :param body: ContactBulkFavorite: Ids or filter of the contacts and the new favorite value
+    :param db: AsyncSession: Get the database session
+    :param current_user: Principal: Get the user information from the token
+    :return: The ids of the updated contacts
+    :doc-author: Trelent
+    """
+    ids = await repository_contacts.bulk_favorite_update(body, body.favorite, current_user.id, db)
+    return {"ids": ids}
+
+
+@router.delete("/bulk", response_model=ContactBulkResult, dependencies=[Depends(RateLimit(cost=5))])
+async def bulk_remove_contacts(
+    body: ContactBulkSelection,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(auth_service.get_current_principal),
+):
+    """
+    The bulk_remove_contacts function removes many contacts at once.
+        The contacts are given by a list of ids or by a filter, the removal is one DELETE in one transaction.
+    
+    :param body: ContactBulkSelection: Ids or filter of the contacts
+    :param db: AsyncSession: Get the database session
+    :param current_user: Principal: Get the user information from the token
+    :return: The ids of the removed contacts
+    :doc-author: Trelent
+    """
+    ids = await repository_contacts.bulk_delete(body, current_user.id, db)
+    return {"ids": ids}
+
+
+@router.put("/{contact_id}", response_model=ContactResponse, dependencies=[Depends(RateLimit())])
 async def update_contact(
-    body: ContactModel, contact_id: int = Path(ge=1), db: Session = Depends(get_db),current_user: User = Depends(auth_service.get_current_user),
+    body: ContactModel, contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),current_user: Principal = Depends(auth_service.get_current_principal),
 ):
     """
     The update_contact function updates a contact in the database.
         The function takes an id and a body as input, and returns the updated contact.
-        If no contact is found with that id, it raises an HTTPException.
+        If no contact is found with that id, it raises an HTTPException, and a 409 one if
+        another contact of the user already has the new email.
     
     :param body: ContactModel: Get the data from the request body
     :param contact_id: int: Find the contact to update
-    :param db: Session: Pass the database session into the function
-    :param current_user: User: Get the user_id from the token
+    :param db: AsyncSession: Pass the database session into the function
+    :param current_user: Principal: Get the user_id from the token
     :param : Get the contact id from the path
     :return: A contactmodel object
     :doc-author: Trelent
     """
-    contact = await repository_contacts.update(contact_id, body,current_user.id, db)
+    try:
+        contact = await repository_contacts.update(contact_id, body,current_user.id, db)
+    except IntegrityError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=f"Email is exist!"
+        )
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
     return contact
 
 
-@router.patch("/{contact_id}/favorite", response_model=ContactResponse)
+@router.patch("/{contact_id}/favorite", response_model=ContactResponse, dependencies=[Depends(RateLimit())])
 async def favorite_update(
     body: ContactFavoriteModel,
     contact_id: int = Path(ge=1),
-    db: Session = Depends(get_db),current_user: User = Depends(auth_service.get_current_user),
+    db: AsyncSession = Depends(get_db),current_user: Principal = Depends(auth_service.get_current_principal),
 ):
     """
     The favorite_update function updates the favorite status of a contact.
@@ -218,30 +440,30 @@ async def favorite_update(
     
     :param body: ContactFavoriteModel: Get the data from the request body
     :param contact_id: int: Get the contact id from the path
-    :param db: Session: Get the database session
-    :param current_user: User: Get the user information from the token
+    :param db: AsyncSession: Get the database session
+    :param current_user: Principal: Get the user information from the token
     :param : Get the contact id from the url
     :return: A contactfavoritemodel object
     :doc-author: Trelent
     """
-    contact = await repository_contacts.favorite_update(contact_id,current_user.id, body, db)
+    contact = await repository_contacts.favorite_update(contact_id, body, current_user.id, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
     return contact
 
 
-@router.delete("/{contact_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def remove_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_db),current_user: User = Depends(auth_service.get_current_user),):
+@router.delete("/{contact_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(RateLimit())])
+async def remove_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),current_user: Principal = Depends(auth_service.get_current_principal),):
     """
     The remove_contact function removes a contact from the database.
         Args:
             contact_id (int): The id of the contact to be removed.
-            db (Session, optional): SQLAlchemy Session. Defaults to Depends(get_db).
-            current_user (User, optional): User object for authentication purposes. Defaults to Depends(auth_service.get_current_user).
+            db (AsyncSession, optional): SQLAlchemy AsyncSession. Defaults to Depends(get_db).
+            current_user (Principal, optional): Principal for authentication purposes. Defaults to Depends(auth_service.get_current_principal).
     
     :param contact_id: int: Get the contact id from the url
-    :param db: Session: Get the database session
-    :param current_user: User: Get the current user from the auth_service
+    :param db: AsyncSession: Get the database session
+    :param current_user: Principal: Get the current user from the auth_service
     :param : Specify the contact id
     :return: None, but i want to return the contact that was deleted
     :doc-author: Trelent
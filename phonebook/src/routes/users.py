@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, status, UploadFile, File
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import cloudinary
 import cloudinary.uploader
 
@@ -34,17 +34,17 @@ async def read_users_me(current_user: User = Depends(auth_service.get_current_us
 
 @router.patch('/avatar', response_model=UserDb)
 async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)):
+                             db: AsyncSession = Depends(get_db)):
     """
     The update_avatar_user function updates the avatar of a user.
         Args:
             file (UploadFile): The file to be uploaded.
             current_user (User): The currently logged in user.
-            db (Session): A database session object for interacting with the database.
+            db (AsyncSession): A database session object for interacting with the database.
     
     :param file: UploadFile: Get the file from the request body
     :param current_user: User: Get the current user from the database
-    :param db: Session: Connect to the database
+    :param db: AsyncSession: Connect to the database
     :return: A user
     :doc-author: Trelent
     """
@@ -1,5 +1,8 @@
 from datetime import date, datetime
-from pydantic import BaseModel, Field, EmailStr
+from enum import Enum
+from typing import Dict, List
+
+from pydantic import BaseModel, Field, EmailStr, model_validator
 
 
 class ContactModel(BaseModel):
@@ -13,9 +16,51 @@ class ContactModel(BaseModel):
     comments: str | None = Field(default=None, title="Додаткові дані")
     favorite: bool = False
 
+class ContactSort(str, Enum):
+    id = "id"
+    name = "last_name,first_name,id"
+    created_at = "created_at,id"
+    birthday = "birthday,id"
+
+class ContactSuggestion(BaseModel):
+    id: int
+    first_name: str | None
+    last_name: str | None
+    email: str | None
+    phone: str | None
+
 class ContactFavoriteModel(BaseModel):
     favorite: bool = False
 
+class ContactFilter(BaseModel):
+    q: str | None = Field(default=None, max_length=100)
+    first_name: str | None = None
+    last_name: str | None = None
+    email: str | None = None
+    favorite: bool | None = None
+
+    @model_validator(mode="after")
+    def not_empty(self):
+        if all(value is None or value == "" for value in self.model_dump().values()):
+            raise ValueError("Filter needs at least one condition")
+        return self
+
+class ContactBulkSelection(BaseModel):
+    ids: List[int] | None = Field(default=None, min_length=1, max_length=10000)
+    filter: ContactFilter | None = None
+
+    @model_validator(mode="after")
+    def ids_or_filter(self):
+        if (self.ids is None) == (self.filter is None):
+            raise ValueError("Give either ids or filter")
+        return self
+
+class ContactBulkFavorite(ContactBulkSelection):
+    favorite: bool
+
+class ContactBulkResult(BaseModel):
+    ids: List[int]
+
 class ContactResponse(BaseModel):
     id: int
     first_name: str | None
@@ -31,6 +76,23 @@ class ContactResponse(BaseModel):
     class Config:
         from_attributes = True
         
+
+class ImportRowError(BaseModel):
+    row: int
+    errors: List[str]
+
+class ImportReport(BaseModel):
+    imported: int = 0
+    duplicates: int = 0
+    failed: int = 0
+    errors: List[ImportRowError] = []
+    errors_truncated: bool = False
+
+class ContactStats(BaseModel):
+    total: int
+    favorites: int
+    birthdays_by_month: Dict[int, int]
+        
         
 #new
         
@@ -55,6 +117,12 @@ class UserResponse(BaseModel):
     detail: str = "User successfully created"
 
 
+class Principal(BaseModel):
+    id: int
+    email: str
+    confirmed: bool = False
+
+
 class TokenModel(BaseModel):
     access_token: str
     refresh_token: str
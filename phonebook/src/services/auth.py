@@ -1,3 +1,4 @@
+import uuid
 from typing import Optional
 
 from jose import JWTError, jwt
@@ -5,14 +6,25 @@ from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from time import time
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.conf.config import settings
+from src.database.db import get_read_db
+from src.database.models import User
 from src.repository import users as repository_users
+from src.schemas import Principal
+from src.services.revocation import revocation_list
+from src.services.token_cache import token_cache
+from src.services.password_hasher import PasswordHasher, PasswordHasherBusy
+from src.services.user_cache import user_cache
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    # hashes made with fewer rounds than bcrypt_rounds are outdated and get rehashed on login
+    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds,
+                               bcrypt__min_rounds=settings.bcrypt_rounds)
+    password_hasher = PasswordHasher(pwd_context, settings.password_hash_workers, settings.password_hash_max_pending)
     SECRET_KEY = "secret_key"
     ALGORITHM = "HS256"
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
@@ -21,7 +33,8 @@ class Auth:
         """
         The verify_password function takes a plain-text password and the hashed version of that password,
             and returns True if they match, False otherwise. This is used to verify that the user's login
-            credentials are correct.
+            credentials are correct. It blocks for the whole bcrypt run, request handlers
+            use verify_password_and_update instead.
         
         :param self: Represent the instance of the class
         :param plain_password: Pass in the password that is being checked
@@ -35,6 +48,7 @@ class Auth:
         """
         The get_password_hash function takes a password as input and returns the hash of that password.
             The function uses the pwd_context object to generate a hash from the given password.
+            It blocks for the whole bcrypt run, request handlers use hash_password instead.
         
         :param self: Represent the instance of the class
         :param password: str: Get the password from the user
@@ -43,6 +57,53 @@ class Auth:
         """
         return self.pwd_context.hash(password)
 
+    async def hash_password(self, password: str) -> str:
+        """
+        The hash_password function hashes a password on the password hasher pool,
+            so the event loop keeps serving other requests while bcrypt runs.
+        
+        :param self: Represent the instance of the class
+        :param password: str: Get the password from the user
+        :return: A hash of the password
+        :doc-author: Trelent
+        """
+        try:
+            return await self.password_hasher.hash(password)
+        except PasswordHasherBusy:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server busy, try again",
+                                headers={"Retry-After": "1"})
+
+    async def verify_password_and_update(self, plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+        """
+        The verify_password_and_update function checks a password on the password hasher pool.
+            When the password is valid but the stored hash uses outdated parameters,
+            it also returns a new hash made with the current ones.
+        
+        :param self: Represent the instance of the class
+        :param plain_password: str: Pass in the password that is being checked
+        :param hashed_password: str: Check the password that is stored in the database
+        :return: (password is valid, new hash to store or None)
+        :doc-author: Trelent
+        """
+        try:
+            return await self.password_hasher.verify_and_update(plain_password, hashed_password)
+        except PasswordHasherBusy:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server busy, try again",
+                                headers={"Retry-After": "1"})
+
+    def access_claims(self, user: User) -> dict:
+        """
+        The access_claims function returns the claims an access token of the user carries:
+            the email as sub, the user id as uid and the confirmed flag. With them
+            get_current_principal needs no database access.
+        
+        :param self: Represent the instance of the class
+        :param user: User: The user the token is issued to
+        :return: The claims to pass to create_access_token
+        :doc-author: Trelent
+        """
+        return {"sub": user.email, "uid": user.id, "confirmed": bool(user.confirmed)}
+
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         """
@@ -59,8 +120,12 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(minutes=15)
-        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token"})
+            expire = datetime.utcnow() + timedelta(seconds=settings.access_token_ttl)
+        # jti identifies the token in the revocation list; iat_ms places it before or after a
+        # revocation of all the user's tokens, which iat, in whole seconds, cannot within the same second
+        to_encode.setdefault("jti", uuid.uuid4().hex)
+        to_encode.update({"iat": datetime.utcnow(), "iat_ms": int(time() * 1000), "exp": expire,
+                          "scope": "access_token"})
         encoded_access_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_access_token
 
@@ -90,33 +155,32 @@ class Auth:
     async def decode_refresh_token(self, refresh_token: str):
         """
         The decode_refresh_token function takes a refresh token and decodes it.
-            If the scope is 'refresh_token', then we return the email address of the user.
+            If the scope is 'refresh_token', then we return its claims: the email address of the user as sub
+            and, for tokens issued by the refresh token store, the user id, token family and token id.
             Otherwise, we raise an HTTPException with status code 401 (UNAUTHORIZED) and detail message 'Invalid scope for token'.
         
         
         :param self: Represent the instance of the class
         :param refresh_token: str: Pass the refresh token to the function
-        :return: The email of the user
+        :return: The claims of the token
         :doc-author: Trelent
         """
         try:
             payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'refresh_token':
-                email = payload['sub']
-                return email
+            if payload.get('scope') == 'refresh_token' and payload.get('sub'):
+                return payload
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    def decode_access_token(self, token: str) -> dict:
         """
-        The get_current_user function is a dependency that will be used in the UserResource class.
-        It takes an access token as input and returns the user object associated with it.
+        The decode_access_token function checks an access token and returns its claims.
+        The signature of a token is checked once, later calls with it take the payload from token_cache.
         
-        :param self: Represent the instance of a class
-        :param token: str: Get the token from the authorization header
-        :param db: Session: Get the database session
-        :return: A user object
+        :param self: Represent the instance of the class
+        :param token: str: The access token
+        :return: The claims of the token
         :doc-author: Trelent
         """
         credentials_exception = HTTPException(
@@ -125,23 +189,95 @@ class Auth:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-        try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
+        payload = token_cache.get(token)
+        if payload is None:
+            if token_cache.is_revoked(token):
+                raise credentials_exception
+            try:
+                # Decode JWT
+                payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+                if payload.get('scope') != 'access_token' or payload.get("sub") is None:
                     raise credentials_exception
-            else:
+            except JWTError as e:
                 raise credentials_exception
-        except JWTError as e:
-            raise credentials_exception
+            token_cache.put(token, payload)
+        return payload
 
-        user = await repository_users.get_user_by_email(email, db)
+    async def verify_access_token(self, token: str) -> dict:
+        """
+        The verify_access_token function checks an access token and that neither it nor its user was revoked.
+            The revocation check asks Redis only when the token hits the worker's Bloom filter.
+        
+        :param self: Represent the instance of the class
+        :param token: str: The access token
+        :return: The claims of the token
+        :doc-author: Trelent
+        """
+        payload = self.decode_access_token(token)
+        if await revocation_list.is_revoked(payload):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked",
+                                headers={"WWW-Authenticate": "Bearer"})
+        return payload
+
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_read_db)):
+        """
+        The get_current_user function is a dependency that will be used in the UserResource class.
+        It takes an access token as input and returns the user object associated with it.
+        The user comes from user_cache, the database is only read on a cache miss.
+        The returned user is detached and carries no password or refresh token.
+        Routes that only need the user id use get_current_principal instead.
+        
+        :param self: Represent the instance of a class
+        :param token: str: Get the token from the authorization header
+        :param db: AsyncSession: Get the database session
+        :return: A user object
+        :doc-author: Trelent
+        """
+        email = (await self.verify_access_token(token))["sub"]
+        user = await user_cache.get_or_load(email, lambda: repository_users.get_user_by_email(email, db))
         if user is None:
-            raise credentials_exception
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials",
+                                headers={"WWW-Authenticate": "Bearer"})
         return user
+
+    async def get_current_principal(self, token: str = Depends(oauth2_scheme),
+                                    db: AsyncSession = Depends(get_read_db)) -> Principal:
+        """
+        The get_current_principal function is a dependency that returns who made the request
+        straight from the claims of the access token, without reading the users table.
+        Tokens issued before the uid claim existed are resolved through get_current_user until they expire;
+        the session opens no connection unless it is used.
+        
+        :param self: Represent the instance of a class
+        :param token: str: Get the token from the authorization header
+        :param db: AsyncSession: Used only for tokens without the uid claim
+        :return: The principal with the user id, email and confirmed flag
+        :doc-author: Trelent
+        """
+        payload = await self.verify_access_token(token)
+        if payload.get("uid") is not None:
+            return Principal(id=payload["uid"], email=payload["sub"], confirmed=payload.get("confirmed", False))
+        user = await self.get_current_user(token, db)
+        return Principal(id=user.id, email=user.email, confirmed=bool(user.confirmed))
     
+    async def revoke_access_token(self, token: str) -> None:
+        """
+        The revoke_access_token function makes every worker reject an access token before it expires.
+            Tokens that do not decode are rejected anyway and are ignored here.
+        
+        :param self: Represent the instance of the class
+        :param token: str: The access token to revoke
+        :return: None
+        :doc-author: Trelent
+        """
+        try:
+            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+        except JWTError:
+            return
+        token_cache.revoke(token, payload.get("exp", float("inf")))
+        if payload.get("jti"):
+            await revocation_list.revoke_token(payload["jti"], payload.get("exp", time() + settings.access_token_ttl))
+
     def create_email_token(self, data: dict):
         """
         The create_email_token function takes a dictionary of data and returns a JWT token.
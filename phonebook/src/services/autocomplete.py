@@ -0,0 +1,180 @@
+import re
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from time import monotonic
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.models import Contact
+
+
+SUGGESTION_FIELDS = ("id", "first_name", "last_name", "email", "phone")
+PHONE_PATTERN = re.compile(r"[\d\s()+-]+")
+
+
+def normalize_prefix(prefix: str) -> str:
+    """
+    The normalize_prefix function brings typed text to the form the index keys are stored in:
+    lowercase, and digits only when it looks like a phone number.
+
+    :param prefix: str: Text typed by the user
+    :return: The normalized prefix
+    """
+    prefix = prefix.strip().lower()
+    if PHONE_PATTERN.fullmatch(prefix) and any(char.isdigit() for char in prefix):
+        return re.sub(r"\D", "", prefix)
+    return prefix
+
+
+def contact_keys(contact) -> set[str]:
+    """
+    The contact_keys function returns the strings a contact can be found by:
+    every field as a whole, every word of it, both orders of the full name and the phone digits.
+
+    :param contact: Contact or row with the SUGGESTION_FIELDS attributes
+    :return: A set of lowercase keys
+    """
+    keys = set()
+    for value in (contact.first_name, contact.last_name, contact.email):
+        if value:
+            keys.add(value.lower())
+            keys.update(re.findall(r"\w+", value.lower()))
+    if contact.first_name and contact.last_name:
+        keys.add(f"{contact.first_name} {contact.last_name}".lower())
+        keys.add(f"{contact.last_name} {contact.first_name}".lower())
+    if contact.phone:
+        keys.add(re.sub(r"\D", "", contact.phone))
+        keys.update(re.findall(r"\d+", contact.phone))
+    keys.discard("")
+    return keys
+
+
+class PrefixIndex:
+    """
+    Sorted array of (key, contact id) pairs of one user. A lookup is a binary search
+    for the prefix followed by a scan over the keys that start with it.
+    """
+
+    def __init__(self, contacts=()):
+        pairs = []
+        self.suggestions = {}
+        self.contact_keys = {}
+        for contact in contacts:
+            self.suggestions[contact.id] = {field: getattr(contact, field) for field in SUGGESTION_FIELDS}
+            self.contact_keys[contact.id] = contact_keys(contact)
+            pairs.extend((key, contact.id) for key in self.contact_keys[contact.id])
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.ids = [contact_id for _, contact_id in pairs]
+        self.built_at = monotonic()
+
+    def __len__(self):
+        return len(self.suggestions)
+
+    def add(self, contact) -> None:
+        self.remove(contact.id)
+        self.suggestions[contact.id] = {field: getattr(contact, field) for field in SUGGESTION_FIELDS}
+        self.contact_keys[contact.id] = contact_keys(contact)
+        for key in self.contact_keys[contact.id]:
+            position = bisect_right(self.keys, key)
+            self.keys.insert(position, key)
+            self.ids.insert(position, contact.id)
+
+    def remove(self, contact_id: int) -> None:
+        self.suggestions.pop(contact_id, None)
+        for key in self.contact_keys.pop(contact_id, ()):
+            position = bisect_left(self.keys, key)
+            while position < len(self.keys) and self.keys[position] == key:
+                if self.ids[position] == contact_id:
+                    del self.keys[position]
+                    del self.ids[position]
+                    break
+                position += 1
+
+    def lookup(self, prefix: str, limit: int) -> list[dict]:
+        found = []
+        seen = set()
+        position = bisect_left(self.keys, prefix)
+        while position < len(self.keys) and len(found) < limit and self.keys[position].startswith(prefix):
+            contact_id = self.ids[position]
+            if contact_id not in seen:
+                seen.add(contact_id)
+                found.append(self.suggestions[contact_id])
+            position += 1
+        return found
+
+
+class AutocompleteCache:
+    """
+    Prefix indexes of the most recently active users, kept in process memory.
+        An index is built from the contacts table on the first lookup of its user and then updated
+        by the contacts repository; the least recently used one is evicted when the cache is full.
+        Indexes older than ttl seconds are rebuilt, so changes made by other workers show up too.
+    """
+
+    def __init__(self, max_users: int, ttl: float):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.indexes: OrderedDict[int, PrefixIndex] = OrderedDict()
+        # bumped by a write while a build of the user's index is in flight; both are dropped when the last build ends
+        self.generations: dict[int, int] = {}
+        self.loading: dict[int, int] = {}
+
+    async def index_for(self, user_id: int, db: AsyncSession) -> PrefixIndex:
+        index = self.indexes.get(user_id)
+        if index is not None and monotonic() - index.built_at < self.ttl:
+            self.indexes.move_to_end(user_id)
+            return index
+        generation = self.generations.get(user_id, 0)
+        self.loading[user_id] = self.loading.get(user_id, 0) + 1
+        try:
+            columns = [getattr(Contact, field) for field in SUGGESTION_FIELDS]
+            rows = await db.execute(select(*columns).filter(Contact.user_id == user_id))
+            index = PrefixIndex(rows.all())
+            # a write that landed while the rows were loading may be missing from them, keep such an index uncached
+            if self.generations.get(user_id, 0) == generation:
+                self.indexes[user_id] = index
+                self.indexes.move_to_end(user_id)
+                while len(self.indexes) > self.max_users:
+                    self.indexes.popitem(last=False)
+            return index
+        finally:
+            self.loading[user_id] -= 1
+            if not self.loading[user_id]:
+                del self.loading[user_id]
+                self.generations.pop(user_id, None)
+
+    async def lookup(self, user_id: int, prefix: str, limit: int, db: AsyncSession) -> list[dict]:
+        prefix = normalize_prefix(prefix)
+        if not prefix:
+            return []
+        index = await self.index_for(user_id, db)
+        return index.lookup(prefix, limit)
+
+    def _written(self, user_id: int) -> None:
+        if user_id in self.loading:
+            self.generations[user_id] = self.generations.get(user_id, 0) + 1
+
+    def contact_saved(self, contact: Contact) -> None:
+        self._written(contact.user_id)
+        index = self.indexes.get(contact.user_id)
+        if index is not None:
+            index.add(contact)
+
+    def contact_deleted(self, contact: Contact) -> None:
+        self._written(contact.user_id)
+        index = self.indexes.get(contact.user_id)
+        if index is not None:
+            index.remove(contact.id)
+
+    def invalidate(self, user_id: int) -> None:
+        self._written(user_id)
+        self.indexes.pop(user_id, None)
+
+    def clear(self) -> None:
+        self.indexes.clear()
+
+
+autocomplete = AutocompleteCache(settings.autocomplete_max_users, settings.autocomplete_ttl)
@@ -0,0 +1,304 @@
+import codecs
+import csv
+import io
+import json
+import re
+from datetime import date, datetime
+from itertools import islice
+from typing import AsyncIterator, BinaryIO, Iterable, Iterator
+
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactModel, ImportReport, ImportRowError
+
+
+CSV = "csv"
+VCARD = "vcard"
+NDJSON = "ndjson"
+FORMATS = (CSV, VCARD)
+
+# export format name: (media type, file extension)
+EXPORT_FORMATS = {
+    NDJSON: ("application/x-ndjson", "ndjson"),
+    CSV: ("text/csv; charset=utf-8", "csv"),
+    "vcf": ("text/vcard; charset=utf-8", "vcf"),
+}
+
+CSV_FIELDS = ("first_name", "last_name", "email", "phone", "birthday", "comments", "favorite")
+OPTIONAL_FIELDS = ("phone", "birthday", "comments", "favorite")
+
+
+def detect_format(filename: str | None, content_type: str | None) -> str | None:
+    """
+    The detect_format function tells CSV and vCard uploads apart by file extension or content type.
+
+    :param filename: str | None: Name of the uploaded file
+    :param content_type: str | None: Content type sent by the client
+    :return: CSV, VCARD or None when the format is unknown
+    """
+    name = (filename or "").lower()
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if name.endswith((".vcf", ".vcard")) or content_type in ("text/vcard", "text/x-vcard", "text/directory"):
+        return VCARD
+    if name.endswith(".csv") or content_type in ("text/csv", "application/csv"):
+        return CSV
+    return None
+
+
+def _text_lines(file: BinaryIO) -> Iterator[str]:
+    # decode incrementally, the upload is never read into memory as a whole
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    for line in file:
+        yield decoder.decode(line)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def read_csv(file: BinaryIO) -> Iterator[tuple[int, dict]]:
+    """
+    The read_csv function streams the rows of a CSV file with a header line.
+        Columns are matched to ContactModel fields by name, unknown columns are ignored.
+
+    :param file: BinaryIO: Uploaded file
+    :return: An iterator of (row number, fields) pairs, the first data row is row 1
+    """
+    reader = csv.DictReader(_text_lines(file))
+    for row_number, row in enumerate(reader, start=1):
+        yield row_number, {
+            field: (row.get(field) or "").strip()
+            for field in CSV_FIELDS
+            if row.get(field) is not None
+        }
+
+
+_VCARD_ESCAPES = re.compile(r"\\([\\,;nN])")
+
+
+def _vcard_value(value: str) -> str:
+    return _VCARD_ESCAPES.sub(lambda match: "\n" if match.group(1) in "nN" else match.group(1), value).strip()
+
+
+def _vcard_card(properties: list[tuple[str, str]]) -> dict:
+    card = {}
+    for name, value in properties:
+        if name == "N" and "last_name" not in card:
+            parts = value.split(";")
+            card["last_name"] = _vcard_value(parts[0])
+            if len(parts) > 1:
+                card["first_name"] = _vcard_value(parts[1])
+        elif name == "FN" and "first_name" not in card:
+            first, _, last = _vcard_value(value).partition(" ")
+            card["first_name"] = first
+            card.setdefault("last_name", last)
+        elif name == "EMAIL" and "email" not in card:
+            card["email"] = _vcard_value(value)
+        elif name == "TEL" and "phone" not in card:
+            card["phone"] = _vcard_value(value).removeprefix("tel:")
+        elif name == "BDAY" and "birthday" not in card:
+            birthday = _vcard_value(value)
+            if re.fullmatch(r"\d{8}", birthday):
+                birthday = f"{birthday[:4]}-{birthday[4:6]}-{birthday[6:]}"
+            card["birthday"] = birthday
+        elif name == "NOTE" and "comments" not in card:
+            card["comments"] = _vcard_value(value)
+    return card
+
+
+def read_vcard(file: BinaryIO) -> Iterator[tuple[int, dict]]:
+    """
+    The read_vcard function streams the cards of a vCard (3.0/4.0) file.
+        N or FN give the name; the first EMAIL, TEL, BDAY and NOTE give the other fields.
+        Folded lines are joined and escaped characters are restored.
+
+    :param file: BinaryIO: Uploaded file
+    :return: An iterator of (card number, fields) pairs, the first card is 1
+    """
+    card_number = 0
+    properties = None
+    previous = None
+
+    def flush(line):
+        nonlocal card_number, properties
+        if line is None:
+            return None
+        name, _, value = line.partition(":")
+        name = name.split(";")[0].split(".")[-1].upper()
+        if name == "BEGIN" and value.strip().upper() == "VCARD":
+            properties = []
+        elif name == "END" and value.strip().upper() == "VCARD" and properties is not None:
+            card_number += 1
+            card = (card_number, _vcard_card(properties))
+            properties = None
+            return card
+        elif properties is not None:
+            properties.append((name, value))
+        return None
+
+    for line in _text_lines(file):
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and previous is not None:
+            previous += line[1:]
+            continue
+        card = flush(previous)
+        if card:
+            yield card
+        previous = line
+    card = flush(previous)
+    if card:
+        yield card
+
+
+def validate(row: dict) -> ContactModel:
+    """
+    The validate function turns the fields of an imported row into a ContactModel.
+        Empty optional fields are treated as missing.
+
+    :param row: dict: Fields read from the file
+    :return: A validated contact
+    :raises ValidationError: If the row is not a valid contact
+    """
+    fields = {key: value for key, value in row.items() if not (key in OPTIONAL_FIELDS and value == "")}
+    return ContactModel(**fields)
+
+
+def _next_batch(rows: Iterator[tuple[int, dict]], batch_size: int) -> tuple[list, list]:
+    valid, invalid = [], []
+    for row_number, row in islice(rows, batch_size):
+        try:
+            valid.append((row_number, validate(row)))
+        except ValidationError as err:
+            invalid.append((row_number, [f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in err.errors()]))
+    return valid, invalid
+
+
+def _add_error(report: ImportReport, row: int, errors: list[str]) -> None:
+    if len(report.errors) < settings.import_max_errors:
+        report.errors.append(ImportRowError(row=row, errors=errors))
+    else:
+        report.errors_truncated = True
+
+
+async def import_contacts(rows: Iterable[tuple[int, dict]], user_id: int, db: AsyncSession,
+                          batch_size: int | None = None) -> ImportReport:
+    """
+    The import_contacts function validates and inserts streamed rows batch by batch.
+        Each batch is committed on its own, so memory use depends on the batch size and not on
+        the size of the file. At most import_max_errors row errors are reported in detail.
+
+    :param rows: Iterable[tuple[int, dict]]: Rows produced by read_csv or read_vcard
+    :param user_id: int: Owner of the imported contacts
+    :param db: AsyncSession: Access the database
+    :param batch_size: int | None: Rows per INSERT, defaults to settings.import_batch_size
+    :return: The import report
+    """
+    report = ImportReport()
+    rows = iter(rows)
+    batch_size = batch_size or settings.import_batch_size
+    while True:
+        # reading and validating (email checks above all) is CPU work, keep it off the event loop
+        valid, invalid = await run_in_threadpool(_next_batch, rows, batch_size)
+        if not valid and not invalid:
+            break
+        for row_number, errors in invalid:
+            report.failed += 1
+            _add_error(report, row_number, errors)
+        if not valid:
+            continue
+        try:
+            imported, duplicates = await repository_contacts.insert_contacts(valid, user_id, db)
+        except IntegrityError:
+            # another request added one of the emails after the duplicate check, check again
+            await db.rollback()
+            imported, duplicates = await repository_contacts.insert_contacts(valid, user_id, db)
+        report.imported += imported
+        report.duplicates += len(duplicates)
+        for row_number in duplicates:
+            _add_error(report, row_number, ["email: Contact already exists"])
+    return report
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def _ndjson(rows: list) -> str:
+    return "".join(
+        json.dumps({key: _json_value(value) for key, value in row.items()}, ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+
+def _csv(rows: list) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([_json_value(value) for value in row.values()] for row in rows)
+    return buffer.getvalue()
+
+
+def _vcard_escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace(",", "\\,").replace(";", "\\;").replace("\n", "\\n")
+
+
+def _vcard_line(line: str) -> str:
+    # fold long lines at 75 octets of UTF-8, never inside a character; continuation lines
+    # start with a space, which counts towards their 75 octets (RFC 6350, 3.2)
+    parts, part, size = [], "", 0
+    for char in line:
+        width = len(char.encode())
+        if size + width > 75:
+            parts.append(part)
+            part, size = " ", 1
+        part += char
+        size += width
+    parts.append(part)
+    return "\r\n".join(parts) + "\r\n"
+
+
+def _vcard(rows: list) -> str:
+    cards = []
+    for row in rows:
+        first_name, last_name = row["first_name"] or "", row["last_name"] or ""
+        lines = [
+            "BEGIN:VCARD",
+            "VERSION:3.0",
+            f"N:{_vcard_escape(last_name)};{_vcard_escape(first_name)};;;",
+            f"FN:{_vcard_escape(f'{first_name} {last_name}'.strip())}",
+        ]
+        if row["email"]:
+            lines.append(f"EMAIL;TYPE=INTERNET:{_vcard_escape(row['email'])}")
+        if row["phone"]:
+            lines.append(f"TEL:{_vcard_escape(row['phone'])}")
+        if row["birthday"]:
+            lines.append(f"BDAY:{row['birthday'].isoformat()}")
+        if row["comments"]:
+            lines.append(f"NOTE:{_vcard_escape(row['comments'])}")
+        lines.append("END:VCARD")
+        cards.append("".join(_vcard_line(line) for line in lines))
+    return "".join(cards)
+
+
+async def export_contacts(batches: AsyncIterator[list], file_format: str) -> AsyncIterator[str]:
+    """
+    The export_contacts function serializes batches of contact rows as they arrive.
+        Every batch becomes one chunk of the response, so the first chunk is sent
+        while the rest of the rows are still being read.
+
+    :param batches: AsyncIterator[list]: Batches of row mappings from repository_contacts.stream_contacts
+    :param file_format: str: ndjson, csv or vcf
+    :return: An async iterator of text chunks
+    """
+    if file_format == CSV:
+        yield _csv([{field: field for field in repository_contacts.EXPORT_FIELDS}])
+    async for rows in batches:
+        if file_format == NDJSON:
+            yield _ndjson(rows)
+        elif file_format == CSV:
+            yield _csv(rows)
+        else:
+            yield _vcard(rows)
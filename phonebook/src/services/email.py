@@ -3,7 +3,6 @@ from dotenv import load_dotenv
 import os
 
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
 from pydantic import EmailStr
 
 from src.services.auth import auth_service
@@ -25,33 +24,50 @@ conf = ConnectionConfig(
 )
 
 
-async def send_email(email: EmailStr, username: str, host: str):
+CONFIRM_EMAIL = "confirm_email"
+
+
+class EmailSender:
     """
-    The send_email function sends an email to the user with a link to confirm their email address.
-        The function takes in three arguments:
-            -email: the user's email address, which is used as a unique identifier for them.
-            -username: the username of the user who is registering. This will be displayed in 
-                their confirmation message so they know it was sent to them and not someone else.
-            -host: this is where we are hosting our application, which will be used as part of 
-                our confirmation link.
-    
-    :param email: EmailStr: Validate the email address
-    :param username: str: Pass the username to the template
-    :param host: str: Create the link for the user to confirm their email address
-    :return: A coroutine object
-    :doc-author: Trelent
+    Sends the emails of the outbox. One FastMail is kept for all messages;
+    connection errors are raised to the caller, which decides whether to try again.
     """
-    try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
 
+    def __init__(self, config: ConnectionConfig = conf):
+        self.mail = FastMail(config)
+
+    def build_message(self, kind: str, recipient: EmailStr, payload: dict, outbox_id: int) -> tuple[MessageSchema, str]:
+        """
+        The build_message method renders an outbox email into a message and the name of its template.
+            The confirmation token is created here, at sending time, so a retried email carries a fresh one.
+
+        :param kind: str: Kind of the email
+        :param recipient: EmailStr: Email address to send to
+        :param payload: dict: Values for the template
+        :param outbox_id: int: Id of the email in the outbox, sent as the X-Outbox-Id header
+        :return: The message and its template name
+        """
+        if kind == CONFIRM_EMAIL:
+            token_verification = auth_service.create_email_token({"sub": recipient})
+            message = MessageSchema(
+                subject="Confirm your email ",
+                recipients=[recipient],
+                template_body={"host": payload["host"], "username": payload["username"], "token": token_verification},
+                subtype=MessageType.html,
+                headers={"X-Outbox-Id": str(outbox_id)},
+            )
+            return message, "email_template.html"
+        raise ValueError(f"Unknown email kind: {kind}")
+
+    async def send(self, kind: str, recipient: EmailStr, payload: dict, outbox_id: int) -> None:
+        """
+        The send method sends one outbox email.
+
+        :param kind: str: Kind of the email
+        :param recipient: EmailStr: Email address to send to
+        :param payload: dict: Values for the template
+        :param outbox_id: int: Id of the email in the outbox
+        :raises ConnectionErrors: If the mail server cannot be reached or refuses the login
+        """
+        message, template_name = self.build_message(kind, recipient, payload, outbox_id)
+        await self.mail.send_message(message, template_name=template_name)
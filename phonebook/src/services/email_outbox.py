@@ -0,0 +1,167 @@
+"""
+Sender worker for the email outbox.
+
+    python -m src.services.email_outbox [--once]
+
+The routes only append emails to the email_outbox table; this worker, run as its own process
+next to the web workers, claims the due emails in batches and sends up to email_workers of them
+at a time. A failed email is tried again after a delay that doubles with every attempt, up to
+email_max_attempts. Claims are leases: if the worker dies, its emails are sent by the next
+worker once the lease runs out, so an email may reach the mail server twice but is never lost;
+a worker whose lease ran out cannot record an outcome over the one of the worker that took over.
+Every message carries the X-Outbox-Id header to tell such copies apart. An error of the database
+is logged and the worker carries on: an outcome it could not record is left to the lease, and
+a batch it could not claim is claimed again after a pause that doubles while the errors last.
+With --once the worker sends what is due and exits, for cron.
+"""
+import asyncio
+import json
+import logging
+import random
+import signal
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.conf.config import settings
+from src.database.db import SessionLocal, engine
+from src.database.models import EmailOutbox
+from src.repository import outbox as repository_outbox
+from src.services.email import EmailSender
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxWorker:
+    """
+    Drains the email outbox with bounded parallelism.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker[AsyncSession], sender: EmailSender, concurrency: int,
+                 batch_size: int, lease: float, send_timeout: float, max_attempts: int, backoff_base: float,
+                 backoff_max: float, poll_interval: float):
+        self.session_maker = session_maker
+        self.sender = sender
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.lease = lease
+        self.send_timeout = send_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.sent = 0
+        self.failed = 0
+        self.dead = 0
+
+    def retry_delay(self, attempts: int) -> float:
+        # exponential backoff with jitter, so emails that failed together do not retry together
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1)
+
+    async def deliver(self, message: EmailOutbox) -> None:
+        """
+        The deliver method sends one claimed email and records the outcome in the outbox.
+
+        :param message: EmailOutbox: The claimed email
+        """
+        async with self.semaphore:
+            try:
+                await asyncio.wait_for(
+                    self.sender.send(message.kind, message.recipient, json.loads(message.payload), message.id),
+                    self.send_timeout,
+                )
+            except Exception as error:
+                retry_at = None
+                if message.attempts < self.max_attempts:
+                    retry_at = datetime.utcnow() + timedelta(seconds=self.retry_delay(message.attempts))
+                    self.failed += 1
+                else:
+                    self.dead += 1
+                await self.record(repository_outbox.mark_failed, message, repr(error), retry_at)
+                return
+            self.sent += 1
+            await self.record(repository_outbox.mark_sent, message)
+
+    async def record(self, mark, message: EmailOutbox, *args) -> None:
+        """
+        The record method stores the outcome of a delivery with mark, logging an error of the database
+        instead of raising it: the email stays claimed and is tried again when its lease runs out.
+
+        :param mark: The mark_sent or mark_failed function of the outbox repository
+        :param message: EmailOutbox: The delivered email
+        :param args: The other arguments of mark, before the session
+        """
+        try:
+            async with self.session_maker() as db:
+                await mark(message, *args, db)
+        except Exception:
+            logger.exception("email outbox: cannot record the outcome of email %s", message.id)
+
+    async def run_once(self) -> int:
+        """
+        The run_once method claims the emails that are due and sends them.
+
+        :return: The number of emails claimed
+        """
+        async with self.session_maker() as db:
+            messages = await repository_outbox.claim(self.batch_size, self.lease, db)
+        await asyncio.gather(*(self.deliver(message) for message in messages))
+        return len(messages)
+
+    async def run(self, stop: asyncio.Event | None = None) -> None:
+        """
+        The run method sends emails until stop is set, sleeping poll_interval seconds whenever nothing is due.
+        A batch that fails is logged and the worker sleeps before the next one, twice as long after every
+        failure in a row, up to backoff_max seconds.
+
+        :param stop: asyncio.Event | None: Set to stop the worker after the current batch
+        """
+        stop = stop or asyncio.Event()
+        errors = 0
+        while not stop.is_set():
+            try:
+                claimed = await self.run_once()
+                errors = 0
+            except Exception:
+                logger.exception("email outbox: batch failed")
+                errors += 1
+                claimed = 0
+            if claimed < self.batch_size:
+                try:
+                    await asyncio.wait_for(stop.wait(),
+                                           min(self.backoff_max, self.poll_interval * 2 ** errors))
+                except asyncio.TimeoutError:
+                    pass
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "failed": self.failed, "dead": self.dead}
+
+
+def create_worker(session_maker: async_sessionmaker[AsyncSession] = SessionLocal,
+                  sender: EmailSender | None = None) -> OutboxWorker:
+    return OutboxWorker(session_maker, sender or EmailSender(), settings.email_workers, settings.email_batch_size,
+                        settings.email_lease, settings.email_send_timeout, settings.email_max_attempts,
+                        settings.email_backoff_base, settings.email_backoff_max, settings.email_poll_interval)
+
+
+async def main(once: bool = False) -> None:
+    worker = create_worker()
+    stop = asyncio.Event()
+    # finish the current batch on SIGTERM instead of leaving its emails to the lease
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    try:
+        if once:
+            while await worker.run_once() == worker.batch_size:
+                pass
+        else:
+            await worker.run(stop)
+    finally:
+        print(f"email outbox: {worker.stats()}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main("--once" in sys.argv[1:]))
@@ -0,0 +1,145 @@
+import uuid
+from math import ceil
+from time import time
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.services.redis_client import get_redis
+
+
+# Login attempts are throttled before the user is read or a password is hashed:
+#   login:ip:<address>     sliding window of attempts from one client address
+#   login:account:<email>  sliding window of attempts on one account
+#   login:failures:<email> failed attempts in a row and the time the account is blocked until
+# Each step is one script call, so concurrent attempts cannot slip between a check and its update.
+IP_PREFIX = "login:ip:"
+ACCOUNT_PREFIX = "login:account:"
+FAILURES_PREFIX = "login:failures:"
+
+# KEYS[1] ip window, KEYS[2] account window, KEYS[3] failures
+# ARGV[1] now (ms), ARGV[2] window (ms), ARGV[3] ip limit, ARGV[4] account limit, ARGV[5] attempt id
+# returns 0 when the attempt may go ahead, else the milliseconds to wait
+CHECK_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local blocked_until = tonumber(redis.call('HGET', KEYS[3], 'blocked_until') or '0')
+if blocked_until > now then
+    return blocked_until - now
+end
+local limits = {tonumber(ARGV[3]), tonumber(ARGV[4])}
+for i = 1, 2 do
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now - window)
+    if redis.call('ZCARD', KEYS[i]) >= limits[i] then
+        local oldest = redis.call('ZRANGE', KEYS[i], 0, 0, 'WITHSCORES')
+        return math.max(1, tonumber(oldest[2]) + window - now)
+    end
+end
+for i = 1, 2 do
+    redis.call('ZADD', KEYS[i], now, ARGV[5])
+    redis.call('PEXPIRE', KEYS[i], window)
+end
+return 0
+"""
+
+# KEYS[1] failures
+# ARGV[1] now (ms), ARGV[2] free failures, ARGV[3] base delay (ms), ARGV[4] max delay (ms)
+# returns the milliseconds the account is blocked for
+FAIL_SCRIPT = """
+local now = tonumber(ARGV[1])
+local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+local delay = 0
+if failures > tonumber(ARGV[2]) then
+    delay = math.min(tonumber(ARGV[4]), tonumber(ARGV[3]) * 2 ^ (failures - tonumber(ARGV[2]) - 1))
+    redis.call('HSET', KEYS[1], 'blocked_until', now + delay)
+end
+-- failures are forgotten once the account has gone max delay without one after its block
+redis.call('PEXPIRE', KEYS[1], delay + tonumber(ARGV[4]))
+return delay
+"""
+
+
+class LoginThrottled(Exception):
+    """
+    Raised when a login attempt has to wait; retry_after is in whole seconds.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class LoginThrottle:
+    """
+    Per-address and per-account sliding-window limits on login attempts, plus a delay after
+    repeated failures on an account that doubles with every further failure. When Redis
+    is unreachable logins are let through, the throttle must not lock everybody out.
+    """
+
+    def __init__(self, window: float, ip_limit: int, account_limit: int, free_failures: int, delay_base: float,
+                 delay_max: float, client: redis.Redis | None = None):
+        self.window = window
+        self.ip_limit = ip_limit
+        self.account_limit = account_limit
+        self.free_failures = free_failures
+        self.delay_base = delay_base
+        self.delay_max = delay_max
+        self.client = client
+        self.throttled = 0
+        self.redis_errors = 0
+
+    @property
+    def redis(self) -> redis.Redis:
+        return self.client if self.client is not None else get_redis()
+
+    async def check(self, address: str, email: str) -> None:
+        """
+        The check method records a login attempt, or refuses it when a limit is reached.
+
+        :param address: str: Client address
+        :param email: str: Account the attempt is for
+        :raises LoginThrottled: If the attempt has to wait
+        """
+        email = email.lower()
+        try:
+            wait = await self.redis.eval(
+                CHECK_SCRIPT, 3, f"{IP_PREFIX}{address}", f"{ACCOUNT_PREFIX}{email}", f"{FAILURES_PREFIX}{email}",
+                int(time() * 1000), int(self.window * 1000), self.ip_limit, self.account_limit, uuid.uuid4().hex,
+            )
+        except RedisError:
+            self.redis_errors += 1
+            return
+        if wait:
+            self.throttled += 1
+            raise LoginThrottled(ceil(int(wait) / 1000))
+
+    async def failed(self, email: str) -> None:
+        """
+        The failed method counts a failed login on an account and blocks it once the free failures are used up.
+
+        :param email: str: Account of the failed attempt
+        """
+        try:
+            await self.redis.eval(FAIL_SCRIPT, 1, f"{FAILURES_PREFIX}{email.lower()}", int(time() * 1000),
+                                  self.free_failures, int(self.delay_base * 1000), int(self.delay_max * 1000))
+        except RedisError:
+            self.redis_errors += 1
+
+    async def succeeded(self, email: str) -> None:
+        """
+        The succeeded method forgets the failures of an account after a successful login.
+
+        :param email: str: Account that logged in
+        """
+        try:
+            await self.redis.delete(f"{FAILURES_PREFIX}{email.lower()}")
+        except RedisError:
+            self.redis_errors += 1
+
+    def stats(self) -> dict:
+        return {"throttled": self.throttled, "redis_errors": self.redis_errors}
+
+
+login_throttle = LoginThrottle(settings.login_window, settings.login_ip_limit, settings.login_account_limit,
+                               settings.login_free_failures, settings.login_delay_base, settings.login_delay_max)
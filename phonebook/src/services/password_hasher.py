@@ -0,0 +1,67 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+
+class PasswordHasherBusy(Exception):
+    """
+    Raised when max_pending hashing jobs are already running or queued.
+    """
+
+
+class PasswordHasher:
+    """
+    Runs the bcrypt work of a CryptContext on a bounded thread pool instead of the event loop.
+        bcrypt releases the GIL while it hashes, so the threads hash in parallel and the event loop
+        keeps serving other requests. At most max_pending jobs may run or wait at a time; beyond that
+        new jobs are rejected at once instead of queueing for seconds.
+    """
+
+    def __init__(self, context: CryptContext, workers: int, max_pending: int):
+        self.context = context
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hasher")
+        self.pending = 0
+        self.rejected = 0
+
+    async def _run(self, function, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """
+        The hash method hashes a password with the current cost factor of the context.
+
+        :param password: str: Plain text password
+        :return: The hash
+        :raises PasswordHasherBusy: If the pool is full
+        """
+        return await self._run(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> tuple[bool, str | None]:
+        """
+        The verify_and_update method checks a password and rehashes it when the stored hash
+        was made with outdated parameters, e.g. a lower cost factor than the current one.
+
+        :param password: str: Plain text password
+        :param hashed: str: Stored hash
+        :return: (password is valid, new hash to store or None)
+        :raises PasswordHasherBusy: If the pool is full
+        """
+        return await self._run(self.context.verify_and_update, password, hashed)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,218 @@
+import asyncio
+from math import ceil
+from time import monotonic
+
+import redis.asyncio as redis
+from fastapi import Depends, HTTPException, status
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.schemas import Principal
+from src.services.auth import auth_service
+from src.services.redis_client import get_redis
+
+
+# Every limit is a fixed window in Redis, ratelimit:<scope>:<user id>, holding the units handed out
+# in the current window. Workers do not spend units one request at a time: each one leases a batch
+# into a local token bucket and answers from it until the batch is used up or the window ends.
+KEY_PREFIX = "ratelimit:"
+
+# KEYS[1] window
+# ARGV[1] limit, ARGV[2] window (ms), ARGV[3] units wanted, ARGV[4] units needed at least
+# returns {units granted, milliseconds left in the window}; nothing is granted below the units needed
+LEASE_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local ttl = redis.call('PTTL', KEYS[1])
+local used = 0
+if ttl < 0 then
+    ttl = tonumber(ARGV[2])
+else
+    used = tonumber(redis.call('GET', KEYS[1]) or '0')
+end
+local granted = math.min(tonumber(ARGV[3]), limit - used)
+if granted < tonumber(ARGV[4]) then
+    return {0, ttl}
+end
+redis.call('SET', KEYS[1], used + granted, 'PX', ttl)
+return {granted, ttl}
+"""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a dependency after failure_threshold failures in a row, for reset_timeout seconds;
+    then one call is let through, and its outcome closes the breaker or opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if monotonic() - self.opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self.trial:
+            self.trial = True
+            return True
+        return False
+
+    def success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        self.trial = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = monotonic()
+
+
+class Bucket:
+    __slots__ = ("tokens", "expires_at", "denied", "local")
+
+    def __init__(self, tokens: int, expires_at: float):
+        self.tokens = tokens
+        self.expires_at = expires_at
+        self.denied = False
+        self.local = False
+
+
+class HybridRateLimiter:
+    """
+    Rate limits shared by all workers through Redis, with a local token bucket in every worker.
+        A request costs a Redis round trip only when the bucket cannot pay for it: then the worker
+        leases lease_fraction of the limit, or the cost if that is more. A refusal is kept until the
+        window ends, so a client over its limit is turned away without asking Redis again.
+        Redis calls that fail or take longer than redis_timeout count against a circuit breaker;
+        while it is open, requests are let through and every worker enforces the limit on its own.
+    """
+
+    def __init__(self, lease_fraction: float, redis_timeout: float, breaker: CircuitBreaker, max_buckets: int,
+                 client: redis.Redis | None = None):
+        self.lease_fraction = lease_fraction
+        self.max_buckets = max_buckets
+        self.redis_timeout = redis_timeout
+        self.breaker = breaker
+        self.client = client
+        self.buckets: dict[str, Bucket] = {}
+        self.local_hits = 0
+        self.leases = 0
+        self.denied = 0
+        self.redis_errors = 0
+
+    @property
+    def redis(self) -> redis.Redis:
+        return self.client if self.client is not None else get_redis()
+
+    def clear(self) -> None:
+        self.buckets.clear()
+
+    async def _lease(self, key: str, limit: int, window: float, wanted: int, needed: int) -> tuple[int, float] | None:
+        if not self.breaker.allow():
+            return None
+        try:
+            granted, ttl = await asyncio.wait_for(
+                self.redis.eval(LEASE_SCRIPT, 1, key, limit, int(window * 1000), wanted, needed), self.redis_timeout
+            )
+        except (RedisError, asyncio.TimeoutError):
+            self.redis_errors += 1
+            self.breaker.failure()
+            return None
+        self.breaker.success()
+        self.leases += 1
+        return int(granted), int(ttl) / 1000
+
+    async def acquire(self, key: str, cost: int, limit: int, window: float) -> float:
+        """
+        The acquire method spends cost units of a limit.
+
+        :param key: str: Redis key of the limit
+        :param cost: int: Units the request costs
+        :param limit: int: Units allowed per window
+        :param window: float: Length of the window in seconds
+        :return: 0 if the units were spent, else the seconds until the window ends
+        """
+        now = monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None or bucket.expires_at <= now:
+            if len(self.buckets) >= self.max_buckets:
+                self.buckets = {name: kept for name, kept in self.buckets.items() if kept.expires_at > now}
+            bucket = self.buckets[key] = Bucket(0, now + window)
+        if bucket.tokens >= cost:
+            bucket.tokens -= cost
+            self.local_hits += 1
+            return 0
+        if bucket.denied:
+            self.denied += 1
+            return bucket.expires_at - now
+
+        needed = cost - bucket.tokens
+        lease = await self._lease(key, limit, window, max(needed, ceil(limit * self.lease_fraction)), needed)
+        if lease is None:
+            # Redis is out of reach: for the rest of the window the worker hands out the whole limit on its own
+            if not bucket.local:
+                bucket.local = True
+                bucket.tokens += limit
+        else:
+            granted, ttl = lease
+            bucket.tokens += granted
+            bucket.expires_at = now + ttl
+            bucket.denied = granted == 0
+        if bucket.tokens >= cost:
+            bucket.tokens -= cost
+            return 0
+        self.denied += 1
+        return bucket.expires_at - now
+
+    def stats(self) -> dict:
+        return {
+            "buckets": len(self.buckets),
+            "local_hits": self.local_hits,
+            "leases": self.leases,
+            "denied": self.denied,
+            "redis_errors": self.redis_errors,
+            "breaker": self.breaker.state,
+        }
+
+
+rate_limiter = HybridRateLimiter(settings.rate_limit_lease_fraction, settings.rate_limit_redis_timeout,
+                                 CircuitBreaker(settings.rate_limit_breaker_failures, settings.rate_limit_breaker_reset),
+                                 settings.rate_limit_max_buckets)
+
+
+class RateLimit:
+    """
+    Route dependency that charges a request to a per-user limit of the rate limiter.
+        Routes that share a scope share one budget and are weighted by their cost; by default
+        that is the API budget of settings.rate_limit_budget units per settings.rate_limit_window seconds.
+    """
+
+    def __init__(self, cost: int = 1, times: int | None = None, seconds: float | None = None, scope: str = "api"):
+        self.cost = cost
+        self.times = times if times is not None else settings.rate_limit_budget
+        self.seconds = seconds if seconds is not None else settings.rate_limit_window
+        self.scope = scope
+
+    async def __call__(self, current_user: Principal = Depends(auth_service.get_current_principal)) -> None:
+        retry_after = await rate_limiter.acquire(f"{KEY_PREFIX}{self.scope}:{current_user.id}", self.cost,
+                                                 self.times, self.seconds)
+        if retry_after:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too Many Requests",
+                                headers={"Retry-After": str(max(1, ceil(retry_after)))})
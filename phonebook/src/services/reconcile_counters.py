@@ -0,0 +1,37 @@
+"""
+Reconciliation job for the per-user contact counters.
+
+    python -m src.services.reconcile_counters [user_id]
+
+The counters are kept current by triggers on contacts; this job recomputes them from the
+contacts table in bulk and replaces the stored values, repairing drift from manual edits
+or data restored without the triggers. Run it from cron or after a restore.
+"""
+import asyncio
+import sys
+
+from src.database.db import SessionLocal, engine
+from src.repository import contacts as repository_contacts
+
+
+async def reconcile(user_id: int | None = None) -> int:
+    """
+    The reconcile function rebuilds the contact counters of one user or of all users.
+
+    :param user_id: int | None: Rebuild the counters of this user only
+    :return: The number of counter rows written
+    """
+    async with SessionLocal() as db:
+        return await repository_contacts.rebuild_counters(db, user_id)
+
+
+async def main(user_id: int | None = None) -> None:
+    try:
+        rows = await reconcile(user_id)
+        print(f"rebuilt {rows} contact counters")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else None))
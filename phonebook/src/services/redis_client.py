@@ -0,0 +1,112 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import redis.asyncio as redis
+
+from src.conf.config import settings
+
+
+class CountingConnectionPool(redis.BlockingConnectionPool):
+    """
+    BlockingConnectionPool that counts the connections it opened and the ones checked out.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.opened = 0
+        self.checked_out = set()
+        super().__init__(*args, **kwargs)
+
+    def make_connection(self):
+        connection = super().make_connection()
+        self.opened += 1
+        return connection
+
+    async def get_connection(self, command_name, *keys, **options):
+        connection = await super().get_connection(command_name, *keys, **options)
+        self.checked_out.add(connection)
+        return connection
+
+    async def release(self, connection) -> None:
+        # get_connection also releases a connection that failed its check before handing it out
+        self.checked_out.discard(connection)
+        await super().release(connection)
+
+
+_pool: CountingConnectionPool | None = None
+_redis: redis.Redis | None = None
+
+
+def get_pool() -> CountingConnectionPool:
+    """
+    The get_pool function returns the connection pool every Redis client of the process shares.
+        When all redis_max_connections are in use, a command waits up to redis_pool_timeout
+        seconds for one to be released instead of opening another.
+
+    :return: The connection pool, created on first use
+    """
+    global _pool
+    if _pool is None:
+        _pool = CountingConnectionPool(
+            host=settings.redis_host, port=settings.redis_port, db=0, encoding="utf-8", decode_responses=True,
+            max_connections=settings.redis_max_connections, timeout=settings.redis_pool_timeout,
+            socket_timeout=settings.redis_socket_timeout, socket_connect_timeout=settings.redis_connect_timeout,
+            health_check_interval=settings.redis_health_check_interval, socket_keepalive=True,
+        )
+    return _pool
+
+
+def get_redis() -> redis.Redis:
+    """
+    The get_redis function returns the Redis client of the process, created on first use.
+        Connections are opened lazily by the shared pool, so calling it costs nothing
+        when Redis is not used.
+
+    :return: An asyncio Redis client that decodes responses to str
+    """
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis(connection_pool=get_pool())
+    return _redis
+
+
+async def close_redis() -> None:
+    """
+    The close_redis function closes the client and every connection of the pool; the next
+    get_redis call starts a new pool.
+    """
+    global _pool, _redis
+    if _redis is not None:
+        await _redis.aclose()
+    if _pool is not None:
+        await _pool.disconnect()
+    _pool = _redis = None
+
+
+@asynccontextmanager
+async def pipeline(client: redis.Redis | None = None, transaction: bool = False) -> AsyncIterator[redis.client.Pipeline]:
+    """
+    The pipeline function queues the commands issued inside the block and sends them in one round trip
+    when the block exits; an exception inside the block discards them.
+
+    :param client: redis.Redis | None: Client to pipeline on, the shared one by default
+    :param transaction: bool: Wrap the commands in MULTI/EXEC
+    :return: The pipeline to queue commands on
+    """
+    async with (client if client is not None else get_redis()).pipeline(transaction=transaction) as pipe:
+        yield pipe
+        await pipe.execute()
+
+
+def pool_stats() -> dict:
+    """
+    The pool_stats function reports how the connections of the shared pool are used.
+
+    :return: A dict with max_connections, in_use and idle
+    """
+    if _pool is None:
+        return {"max_connections": settings.redis_max_connections, "in_use": 0, "idle": 0}
+    return {
+        "max_connections": _pool.max_connections,
+        "in_use": len(_pool.checked_out),
+        "idle": _pool.opened - len(_pool.checked_out),
+    }
@@ -0,0 +1,108 @@
+import uuid
+from time import time
+
+import redis.asyncio as redis
+
+from src.conf.config import settings
+from src.services.redis_client import get_redis, pipeline
+
+
+# A token family is one login on one device. Every refresh rotates the family to a new token id;
+# presenting a token id that was already rotated away means the token leaked, and the family is
+# revoked. Families expire with the refresh token; all families of a user are revoked at once by
+# bumping the user's epoch, which every family records when it is created.
+FAMILY_PREFIX = "refresh:family:"
+EPOCH_PREFIX = "refresh:epoch:"
+
+ROTATED = 1
+UNKNOWN = 0
+REUSED = -1
+
+# KEYS[1] family, KEYS[2] epoch of the user
+# ARGV[1] presented token id, ARGV[2] new token id, ARGV[3] ttl, ARGV[4] current time
+ROTATE_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'jti')
+if not current then
+    return 0
+end
+if redis.call('HGET', KEYS[1], 'epoch') ~= (redis.call('GET', KEYS[2]) or '0') then
+    redis.call('DEL', KEYS[1])
+    return 0
+end
+if current ~= ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return -1
+end
+redis.call('HSET', KEYS[1], 'jti', ARGV[2], 'rotated_at', ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+class RefreshTokenStore:
+    """
+    Refresh-token families in Redis, in place of the users.refresh_token column.
+        Logins and refreshes write only to Redis, so the users table stays read-only on the token path,
+        and a user may have any number of sessions, one family per device.
+    """
+
+    def __init__(self, ttl: int, client: redis.Redis | None = None):
+        self.ttl = ttl
+        self.client = client
+
+    @property
+    def redis(self) -> redis.Redis:
+        return self.client if self.client is not None else get_redis()
+
+    async def issue(self, user_id: int, device: str | None = None) -> dict:
+        """
+        The issue method starts a new token family for a login.
+
+        :param user_id: int: Id of the user who logged in
+        :param device: str | None: Description of the client, e.g. its User-Agent
+        :return: The fam and jti claims of the first refresh token of the family
+        """
+        family, token_id = uuid.uuid4().hex, uuid.uuid4().hex
+        epoch = await self.redis.get(f"{EPOCH_PREFIX}{user_id}") or "0"
+        key = f"{FAMILY_PREFIX}{family}"
+        async with pipeline(self.redis, transaction=True) as pipe:
+            pipe.hset(key, mapping={"uid": user_id, "jti": token_id, "epoch": epoch, "device": (device or "")[:200],
+                                    "created_at": int(time())})
+            pipe.expire(key, self.ttl)
+        return {"fam": family, "jti": token_id}
+
+    async def rotate(self, user_id: int, family: str, token_id: str) -> tuple[int, dict | None]:
+        """
+        The rotate method replaces the current token of a family with a new one.
+
+        :param user_id: int: Id of the user the token was issued to
+        :param family: str: fam claim of the presented token
+        :param token_id: str: jti claim of the presented token
+        :return: (ROTATED, new fam and jti claims) or (UNKNOWN or REUSED, None)
+        """
+        new_token_id = uuid.uuid4().hex
+        result = await self.redis.eval(ROTATE_SCRIPT, 2, f"{FAMILY_PREFIX}{family}", f"{EPOCH_PREFIX}{user_id}",
+                                       token_id, new_token_id, self.ttl, int(time()))
+        if result != ROTATED:
+            return int(result), None
+        return ROTATED, {"fam": family, "jti": new_token_id}
+
+    async def revoke(self, family: str) -> None:
+        """
+        The revoke method ends one session.
+
+        :param family: str: fam claim of the session's refresh token
+        """
+        await self.redis.delete(f"{FAMILY_PREFIX}{family}")
+
+    async def revoke_all(self, user_id: int) -> None:
+        """
+        The revoke_all method ends every session of a user with a single INCR, however many there are.
+            The families left behind are rejected on their next refresh and expire with their ttl.
+
+        :param user_id: int: Id of the user
+        """
+        await self.redis.incr(f"{EPOCH_PREFIX}{user_id}")
+
+
+refresh_token_store = RefreshTokenStore(settings.refresh_token_ttl)
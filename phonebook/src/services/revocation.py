@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+from time import monotonic, time
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.services.redis_client import get_redis, pipeline
+
+
+# Revoked access tokens, shared by all workers through Redis:
+#   revoked:entries   sorted set of "jti:<token id>" and "user:<user id>" entries, scored by when they can be forgotten
+#   revoked:user:<id> tokens of the user issued at or before this time, in milliseconds, are revoked
+#   revoked           pub/sub channel announcing new entries
+# Every worker mirrors the entries into a Bloom filter, so tokens that were never revoked,
+# nearly all of them, are accepted without a Redis round trip.
+ENTRIES_KEY = "revoked:entries"
+USER_PREFIX = "revoked:user:"
+CHANNEL = "revoked"
+
+
+def token_entry(jti: str) -> str:
+    return f"jti:{jti}"
+
+
+def user_entry(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def issued_ms(payload: dict) -> int:
+    # tokens issued before iat_ms was added only have iat, the start of their second
+    if "iat_ms" in payload:
+        return int(payload["iat_ms"])
+    return int(payload.get("iat", 0)) * 1000
+
+
+class BloomFilter:
+    """
+    Set membership in a fixed bit array: no false negatives, false positives at a rate that depends
+    on the number of entries, the size and the number of hashes.
+    """
+
+    def __init__(self, size: int, hashes: int):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bytearray((size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    """
+    Revoked access tokens and users, checked on every authenticated request.
+        A check that misses the worker's Bloom filter costs a few hashes; only a hit asks Redis,
+        which tells real revocations from false positives. Entries reach other workers by pub/sub
+        and the filter is rebuilt from Redis every rebuild_interval seconds, which also drops
+        expired entries and catches up on messages missed while disconnected.
+    """
+
+    def __init__(self, bloom_size: int, bloom_hashes: int, rebuild_interval: float, client: redis.Redis | None = None):
+        self.bloom_size = bloom_size
+        self.bloom_hashes = bloom_hashes
+        self.rebuild_interval = rebuild_interval
+        self.client = client
+        self.bloom = BloomFilter(bloom_size, bloom_hashes)
+        self.task: asyncio.Task | None = None
+        self.checks = 0
+        self.bloom_hits = 0
+        self.false_positives = 0
+        self.redis_errors = 0
+
+    @property
+    def redis(self) -> redis.Redis:
+        return self.client if self.client is not None else get_redis()
+
+    async def _publish(self, entry: str, until: float) -> None:
+        self.bloom.add(entry)
+        async with pipeline(self.redis, transaction=True) as pipe:
+            pipe.zadd(ENTRIES_KEY, {entry: until})
+            pipe.publish(CHANNEL, entry)
+
+    async def revoke_token(self, jti: str, exp: float) -> None:
+        """
+        The revoke_token method rejects an access token from now until its exp.
+
+        :param jti: str: jti claim of the token
+        :param exp: float: exp claim of the token
+        """
+        await self._publish(token_entry(jti), exp)
+
+    async def revoke_user(self, user_id: int, token_ttl: float) -> None:
+        """
+        The revoke_user method rejects every access token of a user issued up to now.
+
+        :param user_id: int: Id of the user
+        :param token_ttl: float: Lifetime of access tokens, the longest an issued token can stay valid
+        """
+        now = time()
+        await self.redis.set(f"{USER_PREFIX}{user_id}", int(now * 1000), ex=int(token_ttl) + 1)
+        await self._publish(user_entry(user_id), now + token_ttl)
+
+    async def is_revoked(self, payload: dict) -> bool:
+        """
+        The is_revoked method checks the claims of a verified access token against the list.
+            When Redis cannot be asked after a filter hit, the token is treated as revoked.
+
+        :param payload: dict: Claims of the token
+        :return: True if the token or its user was revoked
+        """
+        self.checks += 1
+        jti, user_id = payload.get("jti"), payload.get("uid")
+        token_hit = jti is not None and token_entry(jti) in self.bloom
+        user_hit = user_id is not None and user_entry(user_id) in self.bloom
+        if not token_hit and not user_hit:
+            return False
+        self.bloom_hits += 1
+        try:
+            if token_hit and await self.redis.zscore(ENTRIES_KEY, token_entry(jti)) is not None:
+                return True
+            if user_hit:
+                revoked_before = await self.redis.get(f"{USER_PREFIX}{user_id}")
+                if revoked_before is not None and issued_ms(payload) <= int(revoked_before):
+                    return True
+        except RedisError:
+            self.redis_errors += 1
+            return True
+        self.false_positives += 1
+        return False
+
+    async def rebuild(self) -> None:
+        """
+        The rebuild method replaces the Bloom filter with one built from the live entries in Redis.
+        """
+        now = time()
+        await self.redis.zremrangebyscore(ENTRIES_KEY, "-inf", now)
+        bloom = BloomFilter(self.bloom_size, self.bloom_hashes)
+        for entry in await self.redis.zrangebyscore(ENTRIES_KEY, now, "+inf"):
+            bloom.add(entry)
+        self.bloom = bloom
+
+    async def listen(self) -> None:
+        """
+        The listen method keeps the Bloom filter of the worker current until it is cancelled.
+        """
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(CHANNEL)
+                    # rebuilt after subscribing, so no entry falls between the snapshot and the messages
+                    await self.rebuild()
+                    rebuilt_at = monotonic()
+                    while True:
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                        if message is not None and message["data"] not in self.bloom:
+                            self.bloom.add(message["data"])
+                        if monotonic() - rebuilt_at >= self.rebuild_interval:
+                            await self.rebuild()
+                            rebuilt_at = monotonic()
+            except RedisError:
+                self.redis_errors += 1
+                await asyncio.sleep(1)
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self.listen())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def stats(self) -> dict:
+        return {
+            "entries": self.bloom.count,
+            "checks": self.checks,
+            "bloom_hits": self.bloom_hits,
+            "false_positives": self.false_positives,
+            "redis_errors": self.redis_errors,
+        }
+
+
+revocation_list = RevocationList(settings.revocation_bloom_size, settings.revocation_bloom_hashes,
+                                 settings.revocation_rebuild_interval)
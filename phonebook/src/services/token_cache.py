@@ -0,0 +1,100 @@
+import hashlib
+from collections import OrderedDict
+from time import time
+
+from src.conf.config import settings
+
+
+def token_digest(token: str) -> str:
+    """
+    The token_digest function returns the key a token is cached under, so raw tokens are never kept.
+
+    :param token: str: Encoded JWT
+    :return: Hex SHA-256 digest of the token
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    """
+    Payloads of access tokens whose signature and claims were already verified, keyed by token digest.
+        An entry is dropped when the token's exp passes, so a cached token is never accepted for longer
+        than a decoded one would be. Revoked tokens are remembered until their exp as well and are
+        rejected even if they are presented again later.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries: OrderedDict[str, dict] = OrderedDict()
+        self.revoked: dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> dict | None:
+        """
+        The get method returns the verified payload of a token, or None when the token has to be decoded.
+
+        :param token: str: Encoded JWT
+        :return: The payload or None
+        """
+        digest = token_digest(token)
+        payload = self.entries.get(digest)
+        if payload is not None and payload["exp"] > time():
+            self.entries.move_to_end(digest)
+            self.hits += 1
+            return payload
+        if payload is not None:
+            del self.entries[digest]
+        self.misses += 1
+        return None
+
+    def put(self, token: str, payload: dict) -> None:
+        """
+        The put method caches the payload of a token that has just been verified.
+
+        :param token: str: Encoded JWT
+        :param payload: dict: Its decoded claims, exp included
+        """
+        digest = token_digest(token)
+        # a token without exp would stay cached for good, such tokens are decoded on every request
+        if digest in self.revoked or "exp" not in payload:
+            return
+        self.entries[digest] = payload
+        self.entries.move_to_end(digest)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def is_revoked(self, token: str) -> bool:
+        return token_digest(token) in self.revoked
+
+    def revoke(self, token: str, exp: float) -> None:
+        """
+        The revoke method rejects a token from now until it expires.
+
+        :param token: str: Encoded JWT
+        :param exp: float: Its exp claim; after that the signature check rejects it anyway
+        """
+        now = time()
+        # forget revocations of tokens that have expired since
+        self.revoked = {digest: until for digest, until in self.revoked.items() if until > now}
+        digest = token_digest(token)
+        self.entries.pop(digest, None)
+        if exp > now:
+            self.revoked[digest] = exp
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.revoked.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "revoked": len(self.revoked),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+token_cache = TokenCache(settings.token_cache_size)
@@ -0,0 +1,149 @@
+import json
+from collections import OrderedDict
+from datetime import datetime
+from time import monotonic
+from typing import Awaitable, Callable
+
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.database.models import User
+from src.services.redis_client import get_redis
+
+
+# credentials never leave the database, request handlers only need the profile fields
+SECRET_FIELDS = ("password", "refresh_token")
+CACHED_FIELDS = tuple(attr.key for attr in User.__mapper__.column_attrs if attr.key not in SECRET_FIELDS)
+REDIS_PREFIX = "user:"
+
+
+def _dump(fields: dict) -> str:
+    return json.dumps({key: value.isoformat() if isinstance(value, datetime) else value
+                       for key, value in fields.items()})
+
+
+def _load(data: str) -> dict:
+    fields = json.loads(data)
+    if fields.get("created_at"):
+        fields["created_at"] = datetime.fromisoformat(fields["created_at"])
+    return fields
+
+
+class UserCache:
+    """
+    Users of the authenticated requests by email, kept for ttl seconds.
+        The first tier is an LRU dictionary in process memory, the optional second tier is Redis,
+        shared by all workers. Every cache hit returns a new detached User, so request handlers
+        never share an instance. The users repository invalidates an email whenever it changes the row;
+        other workers drop their first-tier copy when its ttl runs out.
+    """
+
+    def __init__(self, max_size: int, ttl: float, redis_enabled: bool = False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.redis_enabled = redis_enabled
+        self.entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        # bumped by invalidate while a fill of the email is in flight; both are dropped when the last fill ends
+        self.generations: dict[str, int] = {}
+        self.loading: dict[str, int] = {}
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.redis_errors = 0
+
+    async def get_or_load(self, email: str, load: Callable[[], Awaitable[User | None]]) -> User | None:
+        """
+        The get_or_load method returns the user with the email, from the cache when possible.
+
+        :param email: str: Email of the user
+        :param load: Callable[[], Awaitable[User | None]]: Reads the user from the database on a miss
+        :return: The user or None
+        """
+        email = email.lower()
+        entry = self.entries.get(email)
+        if entry is not None and monotonic() < entry[0]:
+            self.entries.move_to_end(email)
+            self.hits += 1
+            return User(**entry[1])
+
+        generation = self.generations.get(email, 0)
+        self.loading[email] = self.loading.get(email, 0) + 1
+        try:
+            fields = await self._redis_get(email)
+            if fields is not None:
+                self.redis_hits += 1
+            else:
+                self.misses += 1
+                user = await load()
+                if user is None:
+                    return None
+                fields = {key: getattr(user, key) for key in CACHED_FIELDS}
+                if self.generations.get(email, 0) == generation:
+                    await self._redis_set(email, fields)
+            # a change that landed while the user was loading may be missing from it, keep such a user uncached
+            if self.generations.get(email, 0) == generation:
+                self._store(email, fields)
+            return User(**fields)
+        finally:
+            self.loading[email] -= 1
+            if not self.loading[email]:
+                del self.loading[email]
+                self.generations.pop(email, None)
+
+    async def invalidate(self, email: str) -> None:
+        """
+        The invalidate method drops the cached copies of a user after the row has changed.
+
+        :param email: str: Email of the user
+        """
+        email = email.lower()
+        if email in self.loading:
+            self.generations[email] = self.generations.get(email, 0) + 1
+        self.entries.pop(email, None)
+        if self.redis_enabled:
+            try:
+                await get_redis().delete(REDIS_PREFIX + email)
+            except RedisError:
+                self.redis_errors += 1
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.redis_hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "redis_errors": self.redis_errors,
+            "hit_rate": round((self.hits + self.redis_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+    def _store(self, email: str, fields: dict) -> None:
+        self.entries[email] = (monotonic() + self.ttl, fields)
+        self.entries.move_to_end(email)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def _redis_get(self, email: str) -> dict | None:
+        if not self.redis_enabled:
+            return None
+        try:
+            data = await get_redis().get(REDIS_PREFIX + email)
+        except RedisError:
+            # Redis is an optimization here, the database still answers
+            self.redis_errors += 1
+            return None
+        return _load(data) if data else None
+
+    async def _redis_set(self, email: str, fields: dict) -> None:
+        if not self.redis_enabled:
+            return
+        try:
+            await get_redis().set(REDIS_PREFIX + email, _dump(fields), ex=max(1, round(self.ttl)))
+        except RedisError:
+            self.redis_errors += 1
+
+
+user_cache = UserCache(settings.user_cache_size, settings.user_cache_ttl, settings.user_cache_redis)
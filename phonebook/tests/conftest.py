@@ -1,7 +1,10 @@
+import fakeredis.aioredis
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 import sys
 import os
@@ -10,12 +13,25 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from main import app
 from src.database.models import Base
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
+from src.services.login_throttle import login_throttle
+from src.services.rate_limiter import rate_limiter
+from src.services.refresh_tokens import refresh_token_store
+from src.services.revocation import revocation_list
+from src.services.token_cache import token_cache
+from src.services.user_cache import user_cache
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
+
+# The application runs on the async engine; the sync engine on the same file is
+# only used by the tests themselves to prepare and inspect data.
+async_engine = create_async_engine(SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+AsyncTestingSessionLocal = async_sessionmaker(
+    autocommit=False, autoflush=False, bind=async_engine, expire_on_commit=False
+)
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    "sqlite:///./test.db", connect_args={"check_same_thread": False}
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -25,6 +41,9 @@ def session():
 
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    # users of a previous module may have had the same emails
+    user_cache.clear()
+    token_cache.clear()
 
     db = TestingSessionLocal()
     try:
@@ -36,16 +55,19 @@ def session():
 def client(session):
     # Dependency override
 
-    def override_get_db():
-        try:
-            yield session
-        finally:
-            session.close()
+    async def override_get_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    refresh_token_store.client = revocation_list.client = login_throttle.client = rate_limiter.client = \
+        fakeredis.aioredis.FakeRedis(decode_responses=True)
+    rate_limiter.clear()
 
 
     yield TestClient(app)
+    refresh_token_store.client = revocation_list.client = login_throttle.client = rate_limiter.client = None
     
 @pytest.fixture(scope="module")
 def user():
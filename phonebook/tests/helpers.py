@@ -0,0 +1,60 @@
+import tempfile
+import unittest
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from src.database.models import Base, User
+
+
+async def create_database(url: str = "sqlite+aiosqlite://") -> tuple[AsyncEngine, async_sessionmaker[AsyncSession]]:
+    """
+    The create_database function creates the tables of the models in a new database.
+
+    :param url: str: Database url, an in-memory SQLite database by default
+    :return: The engine and a session factory with the settings of src.database.db.SessionLocal
+    """
+    engine = create_async_engine(url)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    return engine, async_sessionmaker(engine, autocommit=False, autoflush=False, expire_on_commit=False)
+
+
+def owner(**fields) -> User:
+    return User(**{"id": 1, "username": "owner", "email": "owner@example.com", "password": "secret", **fields})
+
+
+def other(**fields) -> User:
+    return User(**{"id": 2, "username": "other", "email": "other@example.com", "password": "secret", **fields})
+
+
+class AsyncDatabaseTestCase(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case with a new database for every test, filled by seed.
+        The database is in memory unless in_memory is False. In memory, every session shares
+        one connection, so tests whose sessions run concurrently need the file database.
+    """
+
+    in_memory = True
+
+    async def asyncSetUp(self):
+        url = "sqlite+aiosqlite://"
+        self.directory = None
+        if not self.in_memory:
+            self.directory = tempfile.TemporaryDirectory()
+            url = f"sqlite+aiosqlite:///{self.directory.name}/test.db"
+        self.engine, self.session_maker = await create_database(url)
+        async with self.session_maker() as session:
+            await self.seed(session)
+            await session.commit()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        if self.directory is not None:
+            self.directory.cleanup()
+
+    async def seed(self, session: AsyncSession) -> None:
+        """
+        The seed method adds the rows every test of the case starts with; the session is committed after it.
+
+        :param session: AsyncSession: Session on the test database
+        """
@@ -0,0 +1,121 @@
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.database.models import Contact, User
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactModel
+from src.services.autocomplete import AutocompleteCache, PrefixIndex, autocomplete, normalize_prefix
+from tests.helpers import AsyncDatabaseTestCase
+
+
+def make_contact(id, first_name, last_name, email, phone=None, user_id=1):
+    return Contact(id=id, first_name=first_name, last_name=last_name, email=email, phone=phone, user_id=user_id)
+
+
+class TestPrefixIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = PrefixIndex([
+            make_contact(1, "Borys", "Kuchyn", "borys@uu.cc", "+380 53 123-4567"),
+            make_contact(2, "Nadiia", "Volkova", "nadiia.volkova@uu.cc"),
+            make_contact(3, "Bohdan", "Bor", "b.bor@example.com"),
+        ])
+
+    def ids(self, prefix, limit=10):
+        return [suggestion["id"] for suggestion in self.index.lookup(normalize_prefix(prefix), limit)]
+
+    def test_matches_names_email_and_phone(self):
+        self.assertEqual(self.ids("bor"), [3, 1])
+        self.assertEqual(self.ids("Kuchyn B"), [1])
+        self.assertEqual(self.ids("borys k"), [1])
+        self.assertEqual(self.ids("volk"), [2])
+        self.assertEqual(self.ids("nadiia.v"), [2])
+        self.assertEqual(self.ids("+380 53"), [1])
+        self.assertEqual(self.ids("4567"), [1])
+        self.assertEqual(self.ids("zz"), [])
+
+    def test_limit_counts_contacts(self):
+        self.assertEqual(self.ids("b", limit=2), [3, 1])
+
+    def test_add_and_remove(self):
+        self.index.add(make_contact(1, "Zenon", "Kuchyn", "zenon@uu.cc"))
+        self.assertEqual(self.ids("bor"), [3])
+        self.assertEqual(self.ids("zen"), [1])
+        self.index.remove(3)
+        self.assertEqual(self.ids("bo"), [])
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(len(self.index.keys), len(self.index.ids))
+
+
+class TestAutocompleteCache(AsyncDatabaseTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        autocomplete.clear()
+
+    async def asyncTearDown(self):
+        autocomplete.clear()
+        await super().asyncTearDown()
+
+    async def seed(self, session):
+        session.add_all([User(id=user_id, username=f"u{user_id}", email=f"u{user_id}@example.com", password="x")
+                         for user_id in (1, 2, 3)])
+        session.add_all([
+            make_contact(1, "Borys", "Kuchyn", "borys@uu.cc"),
+            make_contact(2, "Bohdan", "Other", "bohdan@uu.cc", user_id=2),
+        ])
+
+    async def test_repository_keeps_index_current(self):
+        async with self.session_maker() as session:
+            self.assertEqual([s["id"] for s in await autocomplete.lookup(1, "bo", 10, session)], [1])
+            body = ContactModel(first_name="Bogdana", last_name="New", email="bogdana@uu.cc")
+            created = await repository_contacts.create(body, 1, session)
+            self.assertEqual([s["id"] for s in await autocomplete.lookup(1, "bog", 10, session)], [created.id])
+
+            body = ContactModel(first_name="Zenon", last_name="Kuchyn", email="zenon@uu.cc")
+            await repository_contacts.update(1, body, 1, session)
+            self.assertEqual([s["first_name"] for s in await autocomplete.lookup(1, "zen", 10, session)], ["Zenon"])
+            self.assertEqual(await autocomplete.lookup(1, "borys", 10, session), [])
+
+            await repository_contacts.delete(created.id, 1, session)
+            self.assertEqual(await autocomplete.lookup(1, "bog", 10, session), [])
+
+    async def test_users_are_isolated_and_evicted(self):
+        cache = AutocompleteCache(max_users=2, ttl=300)
+        async with self.session_maker() as session:
+            self.assertEqual([s["id"] for s in await cache.lookup(2, "bo", 10, session)], [2])
+            await cache.lookup(1, "bo", 10, session)
+            await cache.lookup(3, "bo", 10, session)
+        self.assertEqual(list(cache.indexes), [1, 3])
+
+    async def test_write_during_build_is_not_cached(self):
+        cache = AutocompleteCache(max_users=10, ttl=300)
+        async with self.session_maker() as session:
+            execute = session.execute
+
+            async def execute_then_write(*args, **kwargs):
+                result = await execute(*args, **kwargs)
+                cache.contact_saved(make_contact(9, "Late", "Write", "late@uu.cc"))
+                return result
+
+            session.execute = execute_then_write
+            await cache.lookup(1, "bo", 10, session)
+        self.assertNotIn(1, cache.indexes)
+        self.assertEqual((cache.generations, cache.loading), ({}, {}))
+
+    async def test_generations_are_not_kept(self):
+        cache = AutocompleteCache(max_users=10, ttl=300)
+        for user_id in range(100):
+            cache.contact_saved(make_contact(user_id, "Borys", "Kuchyn", "borys@uu.cc", user_id=user_id))
+            cache.invalidate(user_id)
+        self.assertEqual(cache.generations, {})
+        async with self.session_maker() as session:
+            await cache.lookup(1, "bo", 10, session)
+            cache.invalidate(1)
+            await cache.lookup(2, "bo", 10, session)
+        self.assertEqual((cache.generations, cache.loading), ({}, {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import os
+import sys
+from datetime import date
+
+from sqlalchemy import event, update
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.database.models import Contact, ContactCounter
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactBulkSelection, ContactFavoriteModel, ContactModel
+from tests.helpers import AsyncDatabaseTestCase, owner, other
+
+
+class TestContactCounters(AsyncDatabaseTestCase):
+    async def seed(self, session):
+        session.add_all([owner(), other()])
+        session.add(Contact(id=1, first_name="Other", email="other@uu.cc", birthday=date(1990, 3, 1), user_id=2))
+
+    async def stats(self, user_id=1):
+        async with self.session_maker() as session:
+            return await repository_contacts.get_stats(user_id, session)
+
+    async def create(self, email, **fields):
+        async with self.session_maker() as session:
+            return await repository_contacts.create(ContactModel(email=email, **fields), 1, session)
+
+    async def test_empty(self):
+        stats = await self.stats()
+        self.assertEqual(stats["total"], 0)
+        self.assertEqual(stats["favorites"], 0)
+        self.assertEqual(stats["birthdays_by_month"], {month: 0 for month in range(1, 13)})
+
+    async def test_single_writes(self):
+        first = await self.create("a@uu.cc", birthday=date(1990, 12, 31), favorite=True)
+        second = await self.create("b@uu.cc", birthday=date(1985, 12, 1))
+        await self.create("c@uu.cc")
+        stats = await self.stats()
+        self.assertEqual((stats["total"], stats["favorites"]), (3, 1))
+        self.assertEqual(stats["birthdays_by_month"][12], 2)
+
+        async with self.session_maker() as session:
+            await repository_contacts.update(second.id, ContactModel(email="b@uu.cc", birthday=date(1985, 5, 5)),
+                                             1, session)
+            await repository_contacts.favorite_update(second.id, ContactFavoriteModel(favorite=True), 1, session)
+            await repository_contacts.delete(first.id, 1, session)
+        stats = await self.stats()
+        self.assertEqual((stats["total"], stats["favorites"]), (2, 1))
+        self.assertEqual((stats["birthdays_by_month"][12], stats["birthdays_by_month"][5]), (0, 1))
+        self.assertEqual((await self.stats(user_id=2))["total"], 1)
+
+    async def test_duplicate_is_not_counted(self):
+        await self.create("a@uu.cc")
+        self.assertIsNone(await self.create("A@uu.cc"))
+        self.assertEqual((await self.stats())["total"], 1)
+
+    async def test_bulk_writes(self):
+        async with self.session_maker() as session:
+            contacts = [(row, ContactModel(email=f"c{row}@uu.cc", birthday=date(2000, row, 1))) for row in range(1, 7)]
+            await repository_contacts.insert_contacts(contacts, 1, session)
+            ids = await repository_contacts.bulk_favorite_update(ContactBulkSelection(filter={"email": "uu.cc"}),
+                                                                 True, 1, session)
+            await repository_contacts.bulk_delete(ContactBulkSelection(ids=ids[:2]), 1, session)
+        stats = await self.stats()
+        self.assertEqual((stats["total"], stats["favorites"]), (4, 4))
+        self.assertEqual([stats["birthdays_by_month"][month] for month in range(1, 8)], [0, 0, 1, 1, 1, 1, 0])
+
+    async def test_count_contacts(self):
+        await self.create("a@uu.cc", favorite=True)
+        await self.create("b@uu.cc")
+        await self.create("c@uu.cc")
+        async with self.session_maker() as session:
+            counts = [await repository_contacts.count_contacts(1, session, favorite) for favorite in (None, True, False)]
+        self.assertEqual(counts, [3, 1, 2])
+
+    async def test_reads_do_not_scan_contacts(self):
+        await self.create("a@uu.cc")
+        statements = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        await self.stats()
+        self.assertEqual(len(statements), 1)
+        self.assertIn("FROM contact_counters", statements[0])
+        self.assertNotIn("contacts ", statements[0].replace("contact_counters", ""))
+
+    async def test_rebuild_repairs_drift(self):
+        await self.create("a@uu.cc", birthday=date(1990, 7, 7), favorite=True)
+        await self.create("b@uu.cc")
+        async with self.session_maker() as session:
+            await session.execute(update(ContactCounter).values(value=42))
+            await session.commit()
+        self.assertEqual((await self.stats())["total"], 42)
+
+        async with self.session_maker() as session:
+            rows = await repository_contacts.rebuild_counters(session)
+        self.assertEqual(rows, 5)
+        stats = await self.stats()
+        self.assertEqual((stats["total"], stats["favorites"], stats["birthdays_by_month"][7]), (2, 1, 1))
+        self.assertEqual((await self.stats(user_id=2))["birthdays_by_month"][3], 1)
+
+    async def test_rebuild_one_user(self):
+        await self.create("a@uu.cc")
+        async with self.session_maker() as session:
+            await session.execute(update(ContactCounter).values(value=42))
+            await session.commit()
+            await repository_contacts.rebuild_counters(session, user_id=1)
+        self.assertEqual((await self.stats())["total"], 1)
+        self.assertEqual((await self.stats(user_id=2))["total"], 42)
+
+
+if __name__ == "__main__":
+    unittest.main()
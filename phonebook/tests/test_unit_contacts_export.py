@@ -0,0 +1,80 @@
+import io
+import json
+import unittest
+import os
+import sys
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.database.models import Contact
+from src.repository import contacts as repository_contacts
+from src.services import contacts_io
+from tests.helpers import AsyncDatabaseTestCase, owner, other
+
+
+class TestExportContacts(AsyncDatabaseTestCase):
+    async def seed(self, session):
+        session.add_all([owner(), other()])
+        session.add(Contact(first_name="Borys", last_name="Kuchyn", email="borys@uu.cc", phone="+380 53 123-4567",
+                            birthday=date(1990, 1, 31), comments="met in Kyiv, at the; conference\n" + "x" * 100,
+                            user_id=1))
+        session.add_all(Contact(first_name=f"First{i}", last_name=f"Last{i}", email=f"c{i}@uu.cc", user_id=1)
+                        for i in range(11))
+        session.add(Contact(first_name="Hidden", last_name="Other", email="hidden@uu.cc", user_id=2))
+
+    async def export(self, file_format, batch_size=5):
+        async with self.session_maker() as session:
+            batches = repository_contacts.stream_contacts(1, session, batch_size)
+            return [chunk async for chunk in contacts_io.export_contacts(batches, file_format)]
+
+    async def test_ndjson_in_batches(self):
+        chunks = await self.export(contacts_io.NDJSON)
+        self.assertEqual(len(chunks), 3)
+        rows = [json.loads(line) for line in "".join(chunks).splitlines()]
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(rows[0]["birthday"], "1990-01-31")
+        self.assertEqual(set(rows[0]), set(repository_contacts.EXPORT_FIELDS))
+        self.assertNotIn("hidden@uu.cc", [row["email"] for row in rows])
+
+    async def test_csv_round_trip(self):
+        data = "".join(await self.export(contacts_io.CSV)).encode()
+        rows = [row for _, row in contacts_io.read_csv(io.BytesIO(data))]
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(contacts_io.validate(rows[0]).birthday, date(1990, 1, 31))
+        self.assertTrue(rows[0]["comments"].startswith("met in Kyiv, at the; conference\n"))
+
+    async def test_vcard_round_trip(self):
+        data = "".join(await self.export("vcf")).encode()
+        self.assertTrue(all(len(line) <= 75 for line in data.split(b"\r\n")))
+        cards = [card for _, card in contacts_io.read_vcard(io.BytesIO(data))]
+        self.assertEqual(len(cards), 12)
+        self.assertEqual(cards[0]["first_name"], "Borys")
+        self.assertEqual(cards[0]["phone"], "+380 53 123-4567")
+        self.assertEqual(cards[0]["comments"], "met in Kyiv, at the; conference\n" + "x" * 100)
+
+    async def test_vcard_folds_on_octets(self):
+        comments = " ".join(["Зустрілися на конференції в Києві, телефонувати після обіду 🙂"] * 3)
+        async with self.session_maker() as session:
+            session.add(Contact(first_name="Борис", last_name="Кучин", email="kuchyn@uu.cc", comments=comments,
+                                user_id=2))
+            await session.commit()
+            batches = repository_contacts.stream_contacts(2, session, 5)
+            data = "".join([chunk async for chunk in contacts_io.export_contacts(batches, "vcf")]).encode()
+        lines = data.split(b"\r\n")
+        self.assertTrue(all(len(line) <= 75 for line in lines))
+        self.assertTrue(any(len(line) > 70 for line in lines))
+        for line in lines:
+            line.decode()
+        card = next(card for _, card in contacts_io.read_vcard(io.BytesIO(data)) if card["email"] == "kuchyn@uu.cc")
+        self.assertEqual((card["first_name"], card["last_name"], card["comments"]), ("Борис", "Кучин", comments))
+
+    async def test_empty_book(self):
+        async with self.session_maker() as session:
+            batches = repository_contacts.stream_contacts(3, session, 5)
+            chunks = [chunk async for chunk in contacts_io.export_contacts(batches, contacts_io.CSV)]
+        self.assertEqual(chunks, [",".join(repository_contacts.EXPORT_FIELDS) + "\r\n"])
+
+
+if __name__ == '__main__':
+    unittest.main()
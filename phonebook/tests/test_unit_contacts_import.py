@@ -0,0 +1,86 @@
+import io
+import unittest
+import os
+import sys
+from unittest.mock import patch
+
+from sqlalchemy import func, select
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.database.models import Contact
+from src.services import contacts_io
+from tests.helpers import AsyncDatabaseTestCase, owner
+
+
+class TestReaders(unittest.TestCase):
+    def test_read_csv(self):
+        data = (
+            "﻿first_name,last_name,email,phone,birthday,extra\r\n"
+            "Borys,Kuchyn,borys@uu.cc,,1990-01-31,x\r\n"
+            '"Nadiia","Volkova","nadiia@uu.cc","+380 53 123","","multi\r\nline"\r\n'
+        ).encode()
+        rows = list(contacts_io.read_csv(io.BytesIO(data)))
+        self.assertEqual(rows[0], (1, {"first_name": "Borys", "last_name": "Kuchyn", "email": "borys@uu.cc",
+                                       "phone": "", "birthday": "1990-01-31"}))
+        self.assertEqual(rows[1][0], 2)
+        self.assertEqual(rows[1][1]["phone"], "+380 53 123")
+
+    def test_read_vcard(self):
+        data = (
+            "BEGIN:VCARD\r\nVERSION:3.0\r\nN:Kuchyn;Borys;;;\r\nFN:Borys Kuchyn\r\n"
+            "EMAIL;TYPE=INTERNET:borys@uu.cc\r\nEMAIL:second@uu.cc\r\nTEL;TYPE=CELL:+380 53 123-4567\r\n"
+            "BDAY:19900131\r\nNOTE:met in Kyiv\\, at the\r\n  conference\\nsecond line\r\nEND:VCARD\r\n"
+            "BEGIN:VCARD\r\nVERSION:4.0\r\nFN:Nadiia Volkova\r\nitem1.EMAIL:nadiia@uu.cc\r\nEND:VCARD\r\n"
+        ).encode()
+        cards = list(contacts_io.read_vcard(io.BytesIO(data)))
+        self.assertEqual(cards[0], (1, {
+            "last_name": "Kuchyn", "first_name": "Borys", "email": "borys@uu.cc", "phone": "+380 53 123-4567",
+            "birthday": "1990-01-31", "comments": "met in Kyiv, at the conference\nsecond line",
+        }))
+        self.assertEqual(cards[1], (2, {"first_name": "Nadiia", "last_name": "Volkova", "email": "nadiia@uu.cc"}))
+
+    def test_detect_format(self):
+        self.assertEqual(contacts_io.detect_format("book.CSV", None), contacts_io.CSV)
+        self.assertEqual(contacts_io.detect_format("upload", "text/vcard; charset=utf-8"), contacts_io.VCARD)
+        self.assertIsNone(contacts_io.detect_format("book.xlsx", "application/octet-stream"))
+
+
+class TestImportContacts(AsyncDatabaseTestCase):
+    async def seed(self, session):
+        session.add(owner())
+        session.add(Contact(first_name="Old", last_name="Contact", email="old@uu.cc", user_id=1))
+
+    async def test_import(self):
+        rows = [
+            (1, {"first_name": "A", "last_name": "B", "email": "a@uu.cc", "birthday": "1990-12-31"}),
+            (2, {"first_name": "C", "last_name": "D", "email": "not an email"}),
+            (3, {"first_name": "E", "last_name": "F", "email": "OLD@uu.cc"}),
+            (4, {"first_name": "G", "last_name": "H", "email": "A@UU.cc"}),
+            (5, {"first_name": "I", "last_name": "J", "email": "i@uu.cc", "phone": "", "favorite": "true"}),
+        ]
+        async with self.session_maker() as session:
+            report = await contacts_io.import_contacts(rows, 1, session, batch_size=2)
+            contacts = (await session.execute(select(Contact).order_by(Contact.id))).scalars().all()
+        self.assertEqual((report.imported, report.duplicates, report.failed), (2, 2, 1))
+        self.assertEqual([error.row for error in report.errors], [2, 3, 4])
+        self.assertTrue(report.errors[0].errors[0].startswith("email:"))
+        self.assertEqual([contact.email for contact in contacts], ["old@uu.cc", "a@uu.cc", "i@uu.cc"])
+        self.assertEqual(contacts[1].birthday_key, 1231)
+        self.assertTrue(contacts[2].favorite)
+        self.assertIsNone(contacts[2].phone)
+
+    async def test_error_report_is_capped(self):
+        rows = ((i, {"first_name": "x", "last_name": "y", "email": "bad"}) for i in range(1, 51))
+        with patch.object(contacts_io.settings, "import_max_errors", 10):
+            async with self.session_maker() as session:
+                report = await contacts_io.import_contacts(rows, 1, session, batch_size=7)
+                count = (await session.execute(select(func.count(Contact.id)))).scalar()
+        self.assertEqual(report.failed, 50)
+        self.assertEqual(len(report.errors), 10)
+        self.assertTrue(report.errors_truncated)
+        self.assertEqual(count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,276 @@
+import asyncio
+import json
+import socket
+import unittest
+import os
+import sys
+from datetime import datetime, timedelta
+from email import message_from_bytes
+from unittest.mock import MagicMock, patch
+
+from aiosmtpd.controller import Controller
+from fastapi_mail import ConnectionConfig
+from sqlalchemy import select, update
+from sqlalchemy.exc import OperationalError
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.database.models import EmailOutbox, User
+from src.repository import outbox as repository_outbox
+from src.routes import auth as auth_routes
+from src.schemas import UserModel
+from src.services import email
+from src.services.email import CONFIRM_EMAIL, EmailSender
+from src.services.email_outbox import OutboxWorker
+from src.services.user_cache import user_cache
+from tests.helpers import AsyncDatabaseTestCase
+
+
+class Mailbox:
+    """
+    aiosmtpd handler that keeps the messages it receives.
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(message_from_bytes(envelope.content))
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def smtp_config(port: int) -> ConnectionConfig:
+    return ConnectionConfig(MAIL_USERNAME="", MAIL_PASSWORD="", MAIL_FROM="noreply@example.com", MAIL_PORT=port,
+                            MAIL_SERVER="127.0.0.1", MAIL_STARTTLS=False, MAIL_SSL_TLS=False, USE_CREDENTIALS=False,
+                            VALIDATE_CERTS=False, TIMEOUT=5, TEMPLATE_FOLDER=email.conf.TEMPLATE_FOLDER)
+
+
+class TestEmailOutbox(AsyncDatabaseTestCase):
+    # the worker sends concurrently; in memory every session shares one connection, and the rollback
+    # of one delivery's session when it closes undoes the outcome another one has not committed yet
+    in_memory = False
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.port = free_port()
+        self.mailbox = Mailbox()
+        self.smtp = Controller(self.mailbox, hostname="127.0.0.1", port=self.port)
+
+    async def asyncTearDown(self):
+        if self.smtp.server is not None:
+            self.smtp.stop()
+        await super().asyncTearDown()
+
+    def worker(self, concurrency=4, max_attempts=3, sender=None) -> OutboxWorker:
+        return OutboxWorker(self.session_maker, sender or EmailSender(smtp_config(self.port)), concurrency=concurrency,
+                            batch_size=50, lease=60, send_timeout=5, max_attempts=max_attempts, backoff_base=30,
+                            backoff_max=3600, poll_interval=0.01)
+
+    async def enqueue(self, recipient: str) -> bool:
+        async with self.session_maker() as db:
+            added = await repository_outbox.enqueue(CONFIRM_EMAIL, recipient,
+                                                    {"username": "owner", "host": "http://testserver/"}, db)
+            await db.commit()
+            return added
+
+    async def outbox(self) -> list[EmailOutbox]:
+        async with self.session_maker() as db:
+            return list((await db.execute(select(EmailOutbox).order_by(EmailOutbox.id))).scalars())
+
+    async def test_sends_and_is_idempotent(self):
+        self.smtp.start()
+        for i in range(5):
+            await self.enqueue(f"user{i}@example.com")
+        worker = self.worker()
+        self.assertEqual(await worker.run_once(), 5)
+        self.assertEqual(await worker.run_once(), 0)
+        self.assertEqual(worker.stats(), {"sent": 5, "failed": 0, "dead": 0})
+
+        self.assertEqual(len(self.mailbox.messages), 5)
+        self.assertEqual(sorted(message["To"] for message in self.mailbox.messages),
+                         [f"user{i}@example.com" for i in range(5)])
+        rows = await self.outbox()
+        self.assertEqual({row.status for row in rows}, {repository_outbox.SENT})
+        self.assertEqual(sorted(int(message["X-Outbox-Id"]) for message in self.mailbox.messages),
+                         [row.id for row in rows])
+        html = next(part for part in self.mailbox.messages[0].walk() if part.get_content_type() == "text/html")
+        self.assertIn(b"http://testserver/api/auth/confirmed_email/", html.get_payload(decode=True))
+
+    async def test_pending_email_is_not_queued_twice(self):
+        self.assertTrue(await self.enqueue("owner@example.com"))
+        self.assertFalse(await self.enqueue("owner@example.com"))
+        self.smtp.start()
+        await self.worker().run_once()
+        self.assertTrue(await self.enqueue("owner@example.com"))
+        self.assertEqual(len(await self.outbox()), 2)
+
+    async def test_retries_with_backoff(self):
+        await self.enqueue("owner@example.com")
+        worker = self.worker()
+        self.assertEqual(await worker.run_once(), 1)
+        [row] = await self.outbox()
+        self.assertEqual((row.status, row.attempts), (repository_outbox.PENDING, 1))
+        self.assertIsNotNone(row.last_error)
+        self.assertGreater(row.next_attempt_at, datetime.utcnow() + timedelta(seconds=10))
+        self.assertEqual(await worker.run_once(), 0)
+
+        self.smtp.start()
+        async with self.session_maker() as db:
+            await db.execute(update(EmailOutbox).values(next_attempt_at=datetime.utcnow()))
+            await db.commit()
+        self.assertEqual(await worker.run_once(), 1)
+        [row] = await self.outbox()
+        self.assertEqual((row.status, row.attempts), (repository_outbox.SENT, 2))
+        self.assertEqual(len(self.mailbox.messages), 1)
+
+    async def test_gives_up_after_max_attempts(self):
+        await self.enqueue("owner@example.com")
+        worker = self.worker(max_attempts=2)
+        for _ in range(2):
+            await worker.run_once()
+            async with self.session_maker() as db:
+                await db.execute(update(EmailOutbox).values(next_attempt_at=datetime.utcnow()))
+                await db.commit()
+        [row] = await self.outbox()
+        self.assertEqual((row.status, row.attempts), (repository_outbox.DEAD, 2))
+        self.assertEqual(worker.stats(), {"sent": 0, "failed": 1, "dead": 1})
+
+    async def test_claim_is_leased(self):
+        await self.enqueue("owner@example.com")
+        async with self.session_maker() as db:
+            self.assertEqual(len(await repository_outbox.claim(10, 60, db)), 1)
+            self.assertEqual(await repository_outbox.claim(10, 60, db), [])
+            await db.execute(update(EmailOutbox).values(locked_until=datetime.utcnow() - timedelta(seconds=1)))
+            await db.commit()
+            # the lease of a worker that died ran out
+            self.assertEqual(len(await repository_outbox.claim(10, 60, db)), 1)
+
+    async def test_lost_claim_does_not_overwrite(self):
+        await self.enqueue("owner@example.com")
+        async with self.session_maker() as db:
+            [first] = await repository_outbox.claim(10, 60, db)
+        async with self.session_maker() as db:
+            await db.execute(update(EmailOutbox).values(locked_until=datetime.utcnow() - timedelta(seconds=1)))
+            await db.commit()
+            [second] = await repository_outbox.claim(10, 60, db)
+        # the first worker comes back after its lease ran out and another worker took the email
+        async with self.session_maker() as db:
+            self.assertFalse(await repository_outbox.mark_sent(first, db))
+            self.assertFalse(await repository_outbox.mark_failed(first, "timeout", None, db))
+        [row] = await self.outbox()
+        self.assertEqual((row.status, row.locked_until), (repository_outbox.PENDING, second.locked_until))
+
+        async with self.session_maker() as db:
+            self.assertTrue(await repository_outbox.mark_sent(second, db))
+            self.assertFalse(await repository_outbox.mark_failed(first, "timeout", None, db))
+        [row] = await self.outbox()
+        self.assertEqual(row.status, repository_outbox.SENT)
+
+    async def test_bounded_parallelism(self):
+        running, peak = 0, 0
+
+        class SlowSender:
+            async def send(self, kind, recipient, payload, outbox_id):
+                nonlocal running, peak
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        for i in range(20):
+            await self.enqueue(f"user{i}@example.com")
+        worker = self.worker(concurrency=3, sender=SlowSender())
+        self.assertEqual(await worker.run_once(), 20)
+        self.assertEqual(peak, 3)
+        self.assertEqual(worker.stats()["sent"], 20)
+
+    async def test_run_survives_a_failed_claim(self):
+        self.smtp.start()
+        await self.enqueue("owner@example.com")
+        worker = self.worker()
+        stop = asyncio.Event()
+        claim = repository_outbox.claim
+        calls = 0
+
+        async def flaky_claim(limit, lease, db):
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise OperationalError("SELECT", {}, Exception("database is locked"))
+            messages = await claim(limit, lease, db)
+            if messages:
+                stop.set()
+            return messages
+
+        with patch.object(repository_outbox, "claim", flaky_claim), \
+                self.assertLogs("src.services.email_outbox", "ERROR") as logs:
+            await asyncio.wait_for(worker.run(stop), 5)
+        self.assertEqual(calls, 2)
+        self.assertIn("batch failed", logs.output[0])
+        self.assertEqual(worker.stats(), {"sent": 1, "failed": 0, "dead": 0})
+        [row] = await self.outbox()
+        self.assertEqual(row.status, repository_outbox.SENT)
+
+    async def test_failed_outcome_is_left_to_the_lease(self):
+        self.smtp.start()
+        await self.enqueue("owner@example.com")
+        worker = self.worker()
+
+        async def broken_mark_sent(message, db):
+            raise OperationalError("UPDATE", {}, Exception("database is locked"))
+
+        with patch.object(repository_outbox, "mark_sent", broken_mark_sent), \
+                self.assertLogs("src.services.email_outbox", "ERROR"):
+            self.assertEqual(await worker.run_once(), 1)
+        self.assertEqual(worker.stats()["sent"], 1)
+        [row] = await self.outbox()
+        self.assertEqual(row.status, repository_outbox.PENDING)
+        self.assertGreater(row.locked_until, datetime.utcnow())
+
+    async def test_signup_queues_the_email(self):
+        user_cache.clear()
+        request = MagicMock()
+        request.base_url = "http://testserver/"
+        body = UserModel(username="owner", email="owner@example.com", password="qwerty")
+        async with self.session_maker() as db:
+            await auth_routes.signup(body, request, db)
+        [row] = await self.outbox()
+        self.assertEqual((row.kind, row.recipient), (CONFIRM_EMAIL, "owner@example.com"))
+        self.assertEqual(json.loads(row.payload), {"username": "owner", "host": "http://testserver/"})
+        self.assertEqual(self.mailbox.messages, [])
+
+    async def test_signup_stores_user_and_email_together(self):
+        user_cache.clear()
+        request = MagicMock()
+        request.base_url = "http://testserver/"
+        body = UserModel(username="owner", email="owner@example.com", password="qwerty")
+        with patch.object(auth_routes.repository_outbox, "enqueue", side_effect=RuntimeError()):
+            async with self.session_maker() as db:
+                with self.assertRaises(RuntimeError):
+                    await auth_routes.signup(body, request, db)
+        async with self.session_maker() as db:
+            self.assertEqual((await db.execute(select(User))).scalars().all(), [])
+        self.assertEqual(await self.outbox(), [])
+
+    async def test_duplicate_keeps_the_callers_transaction(self):
+        await self.enqueue("owner@example.com")
+        async with self.session_maker() as db:
+            user = User(username="owner", email="owner@example.com", password="secret")
+            db.add(user)
+            await db.flush()
+            self.assertFalse(await repository_outbox.enqueue(CONFIRM_EMAIL, "owner@example.com", {}, db))
+            await db.commit()
+            self.assertEqual(user.username, "owner")
+        async with self.session_maker() as db:
+            self.assertEqual(len((await db.execute(select(User))).scalars().all()), 1)
+        self.assertEqual(len(await self.outbox()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import importlib.util
+import unittest
+import os
+import sys
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.database import fts
+from src.database.models import Contact
+from src.repository.contacts import full_text, search_contacts
+from tests.helpers import AsyncDatabaseTestCase, owner, other
+
+
+class TestFullTextSearch(AsyncDatabaseTestCase):
+    async def seed(self, session):
+        session.add_all([owner(), other()])
+        session.add_all([
+            Contact(id=1, first_name="Borys", last_name="Kuchyn", email="borys@uu.cc", phone="+380 53 123-4567",
+                    comments="met at the conference in Kyiv", user_id=1),
+            Contact(id=2, first_name="Nadiia", last_name="Volkova", email="nadiia@uu.cc",
+                    comments="Kyiv, Kyiv office, lives in Kyiv", user_id=1),
+            Contact(id=3, first_name="Kyiv", last_name="Other", email="kyiv@other.cc", user_id=2),
+        ])
+
+    async def search(self, **param):
+        param.setdefault("limit", 10)
+        async with self.session_maker() as session:
+            return [contact.id for contact in await search_contacts(param, 1, session)]
+
+    async def test_ranked_by_relevance(self):
+        self.assertEqual(await self.search(q="kyiv"), [2, 1])
+
+    async def test_covers_phone_and_comments(self):
+        self.assertEqual(await self.search(q="4567"), [1])
+        self.assertEqual(await self.search(q="conference"), [1])
+
+    async def test_every_word_is_a_prefix(self):
+        self.assertEqual(await self.search(q="nad kyi"), [2])
+        self.assertEqual(await self.search(q="nad conference"), [])
+
+    async def test_field_filters_apply_on_top(self):
+        self.assertEqual(await self.search(q="kyiv", last_name="kuch"), [1])
+
+    async def test_skip(self):
+        self.assertEqual(await self.search(q="kyiv", skip=1), [1])
+
+    async def test_query_syntax_is_literal(self):
+        self.assertEqual(await self.search(q='"borys* -('), [1])
+        self.assertEqual(await self.search(q="()*"), [])
+
+    async def test_index_follows_changes(self):
+        async with self.session_maker() as session:
+            contact = await session.get(Contact, 1)
+            contact.first_name = "Zenon"
+            await session.commit()
+            await session.delete(await session.get(Contact, 2))
+            await session.commit()
+        self.assertEqual(await self.search(q="zenon"), [1])
+        self.assertEqual(await self.search(q="nadiia"), [])
+
+    def test_postgresql_statement(self):
+        stmt = full_text(select(Contact), "Borys kyiv", "postgresql")
+        sql = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+        self.assertIn("contacts.search_vector @@ to_tsquery('simple'::regconfig, 'borys:* & kyiv:*')", sql)
+        self.assertIn("ORDER BY ts_rank(contacts.search_vector,", sql)
+
+    async def test_email_and_phone(self):
+        self.assertEqual(await self.search(q="borys@uu.cc"), [1])
+        self.assertEqual(await self.search(q="123-4567"), [1])
+        self.assertEqual(await self.search(q="+380 53"), [1])
+
+    def test_postgresql_email_and_phone(self):
+        for q, expected in [("borys@uu.cc", "'borys:* & uu:* & cc:*'"),
+                            ("+380 53 123-4567", "'380:* & 53:* & 123:* & 4567:*'"),
+                            ("first_name", "'first:* & name:*'")]:
+            with self.subTest(q=q):
+                stmt = full_text(select(Contact), q, "postgresql")
+                sql = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+                self.assertIn(f"to_tsquery('simple'::regconfig, {expected})", sql)
+        # the indexed text is split at the same characters as the query, in the models and in the migration
+        spec = importlib.util.spec_from_file_location(
+            "contact_full_text_search", os.path.join(os.path.dirname(__file__), "..", "migrations", "versions",
+                                                     "5e8a0c3d9b21_contact_full_text_search.py"))
+        migration = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(migration)
+        self.assertIn("regexp_replace(", fts.POSTGRESQL_DDL[0])
+        self.assertIn("'[^[:alnum:]]+', ' ', 'g'", fts.POSTGRESQL_DDL[0])
+        self.assertEqual(migration.SEARCH_VECTOR_DDL, fts.POSTGRESQL_DDL[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import fakeredis.aioredis
+from fastapi import HTTPException
+from redis.exceptions import ConnectionError
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.routes import auth as auth_routes
+from src.services.auth import auth_service
+from src.services.login_throttle import LoginThrottle, LoginThrottled, login_throttle
+from src.services.refresh_tokens import refresh_token_store
+from src.services.revocation import revocation_list
+from src.services.user_cache import user_cache
+from tests.helpers import AsyncDatabaseTestCase, owner
+
+
+class TestLoginThrottle(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        self.throttle = LoginThrottle(window=60, ip_limit=5, account_limit=3, free_failures=2, delay_base=1,
+                                      delay_max=8, client=self.redis)
+
+    async def test_account_limit(self):
+        for _ in range(3):
+            await self.throttle.check("10.0.0.1", "owner@example.com")
+        with self.assertRaises(LoginThrottled) as error:
+            await self.throttle.check("10.0.0.2", "Owner@Example.com")
+        self.assertTrue(0 < error.exception.retry_after <= 60)
+        await self.throttle.check("10.0.0.2", "other@example.com")
+
+    async def test_ip_limit(self):
+        for i in range(5):
+            await self.throttle.check("10.0.0.1", f"user{i}@example.com")
+        with self.assertRaises(LoginThrottled):
+            await self.throttle.check("10.0.0.1", "user5@example.com")
+        await self.throttle.check("10.0.0.2", "user5@example.com")
+        self.assertEqual(self.throttle.stats()["throttled"], 1)
+
+    async def test_window_slides(self):
+        with patch("src.services.login_throttle.time", return_value=1000.0):
+            for _ in range(3):
+                await self.throttle.check("10.0.0.1", "owner@example.com")
+        with patch("src.services.login_throttle.time", return_value=1030.0):
+            with self.assertRaises(LoginThrottled) as error:
+                await self.throttle.check("10.0.0.1", "owner@example.com")
+        self.assertEqual(error.exception.retry_after, 30)
+        with patch("src.services.login_throttle.time", return_value=1060.5):
+            await self.throttle.check("10.0.0.1", "owner@example.com")
+
+    async def test_progressive_delay(self):
+        delays = []
+        for failures in range(6):
+            with patch("src.services.login_throttle.time", return_value=1000.0 + failures * 100):
+                await self.throttle.failed("owner@example.com")
+                try:
+                    await self.throttle.check("10.0.0.1", "owner@example.com")
+                    delays.append(0)
+                except LoginThrottled as error:
+                    delays.append(error.retry_after)
+        self.assertEqual(delays, [0, 0, 1, 2, 4, 8])
+
+    async def test_success_resets_failures(self):
+        for _ in range(3):
+            await self.throttle.failed("owner@example.com")
+        await self.throttle.succeeded("Owner@example.com")
+        await self.throttle.check("10.0.0.1", "owner@example.com")
+
+    async def test_redis_down_lets_logins_through(self):
+        self.throttle.client = MagicMock()
+        self.throttle.client.eval.side_effect = ConnectionError()
+        await self.throttle.check("10.0.0.1", "owner@example.com")
+        await self.throttle.failed("owner@example.com")
+        self.assertEqual(self.throttle.stats()["redis_errors"], 2)
+
+
+class TestLoginRoute(AsyncDatabaseTestCase):
+    async def asyncSetUp(self):
+        user_cache.clear()
+        refresh_token_store.client = revocation_list.client = login_throttle.client = \
+            fakeredis.aioredis.FakeRedis(decode_responses=True)
+        await super().asyncSetUp()
+        self.request = MagicMock()
+        self.request.client.host = "10.0.0.1"
+        self.request.headers = {"user-agent": "tests"}
+
+    async def asyncTearDown(self):
+        refresh_token_store.client = revocation_list.client = login_throttle.client = None
+        user_cache.clear()
+        await super().asyncTearDown()
+
+    async def seed(self, session):
+        session.add(owner(confirmed=True, password=auth_service.get_password_hash("qwerty")))
+
+    async def login(self, password):
+        body = MagicMock(username="owner@example.com", password=password)
+        async with self.session_maker() as session:
+            return await auth_routes.login(self.request, body, session)
+
+    async def test_throttled_before_database_and_bcrypt(self):
+        for _ in range(login_throttle.free_failures):
+            with self.assertRaises(HTTPException) as error:
+                await self.login("wrong")
+            self.assertEqual(error.exception.status_code, 401)
+        with self.assertRaises(HTTPException):
+            await self.login("wrong")
+
+        with patch.object(auth_routes.repository_users, "get_user_by_email") as get_user, \
+                patch.object(auth_service, "verify_password_and_update") as verify:
+            with self.assertRaises(HTTPException) as error:
+                await self.login("qwerty")
+        self.assertEqual(error.exception.status_code, 429)
+        self.assertIn("Retry-After", error.exception.headers)
+        get_user.assert_not_called()
+        verify.assert_not_called()
+
+    async def test_success_clears_failures(self):
+        with self.assertRaises(HTTPException):
+            await self.login("wrong")
+        self.assertIn("access_token", await self.login("qwerty"))
+        self.assertFalse(await login_throttle.redis.exists("login:failures:owner@example.com"))
+
+
+if __name__ == "__main__":
+    unittest.main()
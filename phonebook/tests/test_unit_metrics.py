@@ -0,0 +1,35 @@
+import unittest
+import os
+import sys
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from main import app
+from src.conf.config import settings
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(app)
+
+    def test_disabled_without_token(self):
+        with patch.object(settings, "metrics_token", None):
+            response = self.client.get("/metrics", headers={"X-Metrics-Token": ""})
+        self.assertEqual(response.status_code, 404, response.text)
+
+    def test_requires_token(self):
+        with patch.object(settings, "metrics_token", "secret"):
+            self.assertEqual(self.client.get("/metrics").status_code, 401)
+            response = self.client.get("/metrics", headers={"X-Metrics-Token": "wrong"})
+            self.assertEqual(response.status_code, 401, response.text)
+            response = self.client.get("/metrics", headers={"X-Metrics-Token": "secret"})
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertIn("db_pool", response.json())
+        self.assertIn("redis_pool", response.json())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import os
+import sys
+from datetime import date
+from unittest.mock import patch
+
+from sqlalchemy import literal_column, update
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.database.models import Contact
+from src.repository import pagination
+from src.repository.contacts import get_contacts, search_birthday
+from src.schemas import ContactSort
+from tests.helpers import AsyncDatabaseTestCase, owner
+
+
+class FixedDate(date):
+    @classmethod
+    def today(cls):
+        return cls(2023, 12, 20)
+
+
+class TestKeysetPagination(AsyncDatabaseTestCase):
+    async def seed(self, session):
+        session.add(owner())
+        session.add_all(
+            Contact(
+                first_name=f"first{i % 4}",
+                last_name=None if i % 7 == 0 else f"last{i % 3}",
+                email=f"c{i}@example.com",
+                birthday=None if i % 5 == 0 else date(1990 + i % 3, (i % 12) + 1, (i % 27) + 1),
+                user_id=1,
+            )
+            for i in range(37)
+        )
+        await session.flush()
+        # two groups of rows sharing the same created_at second, in the format func.now() writes on SQLite
+        await session.execute(
+            update(Contact).where(Contact.id <= 20).values(created_at=literal_column("'2024-01-01 10:00:00'"))
+        )
+        await session.execute(
+            update(Contact).where(Contact.id > 20).values(created_at=literal_column("'2024-01-02 10:00:00'"))
+        )
+
+    async def walk(self, sort: ContactSort, limit: int = 10):
+        seen, after = [], None
+        async with self.session_maker() as session:
+            while True:
+                page = await get_contacts(db=session, user_id=1, skip=0, limit=limit, sort=sort, after=after)
+                seen.extend(page)
+                if len(page) < limit:
+                    return seen
+                after = pagination.decode_cursor(pagination.cursor_for(page[-1], sort), sort)
+
+    async def test_every_sort_visits_each_contact_once_in_order(self):
+        async with self.session_maker() as session:
+            everything = await get_contacts(db=session, user_id=1, skip=0, limit=100)
+        keys = {
+            ContactSort.id: lambda c: (c.id,),
+            ContactSort.name: lambda c: (c.last_name or "", c.first_name or "", c.id),
+            ContactSort.created_at: lambda c: (c.created_at, c.id),
+            ContactSort.birthday: lambda c: (c.birthday or date(9999, 12, 31), c.id),
+        }
+        for sort, key in keys.items():
+            with self.subTest(sort=sort):
+                seen = await self.walk(sort)
+                self.assertEqual([c.id for c in seen], [c.id for c in sorted(everything, key=key)])
+
+    async def test_invalid_cursor(self):
+        cursor = pagination.cursor_for(Contact(id=5), ContactSort.id)
+        with self.assertRaises(ValueError):
+            pagination.decode_cursor(cursor, ContactSort.name)
+        with self.assertRaises(ValueError):
+            pagination.decode_cursor("not-a-cursor", ContactSort.id)
+
+    async def test_birthday_cursor_crosses_new_year(self):
+        seen, after = [], None
+        async with self.session_maker() as session:
+            with patch("src.repository.contacts.date", FixedDate):
+                everything = await search_birthday({"days": 30, "limit": 100}, 1, session)
+                while True:
+                    page = await search_birthday({"days": 30, "after": after, "limit": 2}, 1, session)
+                    seen.extend(page)
+                    if len(page) < 2:
+                        break
+                    cursor = pagination.cursor_for(page[-1], pagination.BIRTHDAY_SORT)
+                    after = pagination.decode_cursor(cursor, pagination.BIRTHDAY_SORT)
+        self.assertTrue(any(c.birthday.month == 1 for c in everything))
+        self.assertEqual([c.id for c in seen], [c.id for c in everything])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import asyncio
+import unittest
+import os
+import sys
+import threading
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.services.auth import auth_service
+from src.services.password_hasher import PasswordHasher, PasswordHasherBusy
+
+
+class TestPasswordHasher(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=5, bcrypt__min_rounds=5)
+        self.hasher = PasswordHasher(self.context, workers=2, max_pending=2)
+
+    def tearDown(self):
+        self.hasher.executor.shutdown()
+
+    async def test_hash_and_verify(self):
+        hashed = await self.hasher.hash("qwerty")
+        self.assertTrue(hashed.startswith("$2b$05$"))
+        self.assertEqual(await self.hasher.verify_and_update("qwerty", hashed), (True, None))
+        self.assertEqual(await self.hasher.verify_and_update("wrong", hashed), (False, None))
+
+    async def test_outdated_hash_is_rehashed(self):
+        outdated = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("qwerty")
+        valid, new_hash = await self.hasher.verify_and_update("qwerty", outdated)
+        self.assertTrue(valid)
+        self.assertTrue(new_hash.startswith("$2b$05$"))
+        self.assertTrue(self.context.verify("qwerty", new_hash))
+        self.assertEqual(await self.hasher.verify_and_update("wrong", outdated), (False, None))
+
+    async def test_runs_off_the_event_loop(self):
+        threads = []
+
+        def hash_password(password):
+            threads.append(threading.current_thread().name)
+            return self.context.hash(password)
+
+        await self.hasher._run(hash_password, "qwerty")
+        self.assertTrue(threads[0].startswith("password-hasher"))
+
+    async def test_rejects_when_full(self):
+        release = threading.Event()
+        jobs = [asyncio.ensure_future(self.hasher._run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with self.assertRaises(PasswordHasherBusy):
+            await self.hasher.hash("qwerty")
+        release.set()
+        await asyncio.gather(*jobs)
+        self.assertEqual(self.hasher.stats()["rejected"], 1)
+        self.assertEqual(self.hasher.stats()["pending"], 0)
+
+    async def test_auth_service_busy(self):
+        release = threading.Event()
+        hasher = auth_service.password_hasher
+        jobs = [asyncio.ensure_future(hasher._run(release.wait)) for _ in range(hasher.max_pending)]
+        await asyncio.sleep(0)
+        try:
+            with self.assertRaises(HTTPException) as error:
+                await auth_service.hash_password("qwerty")
+            self.assertEqual(error.exception.status_code, 503)
+        finally:
+            release.set()
+            await asyncio.gather(*jobs)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import os
+import sys
+
+from fastapi import HTTPException
+from jose import jwt
+from sqlalchemy import event
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.services.auth import auth_service
+from src.services.token_cache import token_cache
+from src.services.user_cache import user_cache
+from tests.helpers import AsyncDatabaseTestCase, owner
+
+
+class TestPrincipal(AsyncDatabaseTestCase):
+    async def asyncSetUp(self):
+        token_cache.clear()
+        user_cache.clear()
+        await super().asyncSetUp()
+        self.connections = 0
+        event.listen(self.engine.sync_engine, "engine_connect", lambda connection: self.count_connection())
+
+    async def seed(self, session):
+        self.user = owner(id=7, confirmed=True)
+        session.add(self.user)
+
+    def count_connection(self):
+        self.connections += 1
+
+    async def asyncTearDown(self):
+        token_cache.clear()
+        user_cache.clear()
+        await super().asyncTearDown()
+
+    async def test_access_claims(self):
+        token = await auth_service.create_access_token(data=auth_service.access_claims(self.user))
+        payload = jwt.get_unverified_claims(token)
+        self.assertEqual((payload["sub"], payload["uid"], payload["confirmed"]), ("owner@example.com", 7, True))
+
+    async def test_principal_without_database(self):
+        token = await auth_service.create_access_token(data=auth_service.access_claims(self.user))
+        async with self.session_maker() as session:
+            principal = await auth_service.get_current_principal(token, session)
+        self.assertEqual((principal.id, principal.email, principal.confirmed), (7, "owner@example.com", True))
+        self.assertEqual(self.connections, 0)
+
+    async def test_token_without_uid_falls_back_to_user(self):
+        token = await auth_service.create_access_token(data={"sub": "owner@example.com"})
+        async with self.session_maker() as session:
+            principal = await auth_service.get_current_principal(token, session)
+        self.assertEqual((principal.id, principal.confirmed), (7, True))
+        self.assertEqual(self.connections, 1)
+
+    async def test_refresh_token_is_rejected(self):
+        token = await auth_service.create_refresh_token(data=auth_service.access_claims(self.user))
+        async with self.session_maker() as session:
+            with self.assertRaises(HTTPException) as error:
+                await auth_service.get_current_principal(token, session)
+        self.assertEqual(error.exception.status_code, 401)
+
+
+if __name__ == "__main__":
+    unittest.main()
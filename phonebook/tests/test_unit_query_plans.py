@@ -0,0 +1,96 @@
+import unittest
+import os
+import sys
+from datetime import datetime
+
+from sqlalchemy import event
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.database.models import Contact
+from src.repository import contacts as repository_contacts
+from src.repository import users as repository_users
+from src.repository import pagination
+from src.schemas import ContactSort
+from tests.helpers import AsyncDatabaseTestCase, owner
+
+
+class TestRepositoryQueryPlans(AsyncDatabaseTestCase):
+    """
+    Every SELECT issued by the repository is run through EXPLAIN QUERY PLAN on SQLite
+    and must be answered from an index instead of a full scan of its table.
+    """
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT"):
+                self.statements.append((statement, parameters))
+
+        event.listen(self.engine.sync_engine, "before_cursor_execute", capture)
+
+    async def seed(self, session):
+        session.add(owner(username="planner", email="Planner@Example.com"))
+        session.add_all(
+            Contact(first_name=f"first{i}", last_name=f"last{i}", email=f"c{i}@example.com", user_id=1)
+            for i in range(20)
+        )
+
+    async def assert_uses_index(self, call, ordered: bool = False):
+        self.statements.clear()
+        async with self.session_maker() as session:
+            await call(session)
+        self.assertTrue(self.statements)
+        async with self.engine.connect() as connection:
+            for statement, parameters in self.statements:
+                plan = await connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+                details = [row[-1] for row in plan]
+                scans = [detail for detail in details
+                         if detail.startswith("SCAN") and "USING" not in detail and "VIRTUAL TABLE INDEX" not in detail]
+                self.assertFalse(scans, f"{statement} -> {details}")
+                if ordered:
+                    sorts = [detail for detail in details if "TEMP B-TREE" in detail]
+                    self.assertFalse(sorts, f"{statement} -> {details}")
+
+    async def test_get_contacts(self):
+        await self.assert_uses_index(
+            lambda db: repository_contacts.get_contacts(db=db, user_id=1, skip=0, limit=10, favorite=True)
+        )
+
+    async def test_get_contacts_keyset(self):
+        contact = Contact(id=7, first_name="first7", last_name="last7", created_at=datetime(2024, 1, 1), birthday=None)
+        for sort in ContactSort:
+            after = pagination.decode_cursor(pagination.cursor_for(contact, sort), sort)
+            with self.subTest(sort=sort):
+                await self.assert_uses_index(
+                    lambda db: repository_contacts.get_contacts(db=db, user_id=1, skip=0, limit=10, sort=sort,
+                                                                after=after),
+                    ordered=True,
+                )
+
+    async def test_get_contact_by_id(self):
+        await self.assert_uses_index(lambda db: repository_contacts.get_contact_by_id(3, 1, db))
+
+    async def test_get_contact_by_email(self):
+        await self.assert_uses_index(lambda db: repository_contacts.get_contact_by_email("C3@example.com", 1, db))
+
+    async def test_search_contacts(self):
+        param = {"first_name": "first", "last_name": None, "email": None, "skip": 0, "limit": 10}
+        await self.assert_uses_index(lambda db: repository_contacts.search_contacts(param, 1, db))
+
+    async def test_search_contacts_full_text(self):
+        param = {"q": "first last", "skip": 0, "limit": 10}
+        await self.assert_uses_index(lambda db: repository_contacts.search_contacts(param, 1, db))
+
+    async def test_search_birthday(self):
+        param = {"days": 7, "skip": 0, "limit": 10}
+        await self.assert_uses_index(lambda db: repository_contacts.search_birthday(param, 1, db))
+
+    async def test_get_user_by_email(self):
+        await self.assert_uses_index(lambda db: repository_users.get_user_by_email("planner@example.com", db))
+
+
+if __name__ == '__main__':
+    unittest.main()
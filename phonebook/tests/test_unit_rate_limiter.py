@@ -0,0 +1,136 @@
+import asyncio
+import unittest
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import fakeredis
+import fakeredis.aioredis
+from fastapi import HTTPException
+from redis.exceptions import ConnectionError
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.schemas import Principal
+from src.services.rate_limiter import CircuitBreaker, HybridRateLimiter, RateLimit, rate_limiter
+
+
+def limiter(client) -> HybridRateLimiter:
+    return HybridRateLimiter(lease_fraction=0.1, redis_timeout=0.5,
+                             breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30), max_buckets=1000,
+                             client=client)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_and_recovers(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+        with patch("src.services.rate_limiter.monotonic", return_value=breaker.opened_at + 31):
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())
+            breaker.failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        with patch("src.services.rate_limiter.monotonic", return_value=breaker.opened_at + 31):
+            self.assertTrue(breaker.allow())
+            breaker.success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+class TestHybridRateLimiter(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = fakeredis.FakeServer()
+        self.redis = fakeredis.aioredis.FakeRedis(server=self.server, decode_responses=True)
+        self.limiter = limiter(self.redis)
+
+    async def test_leases_in_batches(self):
+        with patch.object(self.redis, "eval", wraps=self.redis.eval) as redis_eval:
+            for _ in range(100):
+                self.assertEqual(await self.limiter.acquire("ratelimit:api:1", 1, 100, 60), 0)
+        self.assertEqual(redis_eval.call_count, 10)
+        self.assertGreater(await self.limiter.acquire("ratelimit:api:1", 1, 100, 60), 0)
+
+    async def test_cost_weights(self):
+        for _ in range(4):
+            self.assertEqual(await self.limiter.acquire("ratelimit:api:1", 25, 100, 60), 0)
+        self.assertGreater(await self.limiter.acquire("ratelimit:api:1", 1, 100, 60), 0)
+        self.assertEqual(await self.limiter.acquire("ratelimit:api:2", 1, 100, 60), 0)
+
+    async def test_limit_is_shared_by_workers(self):
+        other = limiter(fakeredis.aioredis.FakeRedis(server=self.server, decode_responses=True))
+        allowed = 0
+        for i in range(200):
+            worker = self.limiter if i % 2 else other
+            allowed += await worker.acquire("ratelimit:api:1", 1, 100, 60) == 0
+        self.assertEqual(allowed, 100)
+        self.assertEqual(int(await self.redis.get("ratelimit:api:1")), 100)
+
+    async def test_refusal_is_kept_locally(self):
+        for _ in range(10):
+            await self.limiter.acquire("ratelimit:api:1", 1, 10, 60)
+        with patch.object(self.redis, "eval", wraps=self.redis.eval) as redis_eval:
+            for _ in range(5):
+                self.assertGreater(await self.limiter.acquire("ratelimit:api:1", 1, 10, 60), 0)
+        self.assertEqual(redis_eval.call_count, 1)
+
+    async def test_window_expires(self):
+        await self.limiter.acquire("ratelimit:api:1", 10, 10, 60)
+        self.assertGreater(await self.limiter.acquire("ratelimit:api:1", 1, 10, 60), 0)
+        await self.redis.delete("ratelimit:api:1")
+        with patch("src.services.rate_limiter.monotonic", return_value=10 ** 9):
+            self.assertEqual(await self.limiter.acquire("ratelimit:api:1", 1, 10, 60), 0)
+
+    async def test_fails_open_and_breaker_skips_redis(self):
+        client = MagicMock()
+        client.eval.side_effect = ConnectionError()
+        self.limiter.client = client
+        for _ in range(100):
+            self.assertEqual(await self.limiter.acquire("ratelimit:api:1", 1, 100, 60), 0)
+        self.assertEqual(client.eval.call_count, 1)
+        # the worker enforces the limit on its own
+        self.assertGreater(await self.limiter.acquire("ratelimit:api:1", 1, 100, 60), 0)
+        self.assertEqual(client.eval.call_count, 2)
+        self.assertEqual(self.limiter.stats()["breaker"], CircuitBreaker.OPEN)
+        for key in ("ratelimit:api:2", "ratelimit:api:3"):
+            self.assertEqual(await self.limiter.acquire(key, 1, 100, 60), 0)
+        self.assertEqual(client.eval.call_count, 2)
+
+    async def test_slow_redis_times_out(self):
+        async def slow(*args):
+            await asyncio.sleep(5)
+
+        self.limiter.redis_timeout = 0.01
+        with patch.object(self.redis, "eval", side_effect=slow):
+            self.assertEqual(await self.limiter.acquire("ratelimit:api:1", 1, 100, 60), 0)
+        self.assertEqual(self.limiter.stats()["redis_errors"], 1)
+
+
+class TestRateLimit(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        rate_limiter.clear()
+        rate_limiter.client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+
+    async def asyncTearDown(self):
+        rate_limiter.clear()
+        rate_limiter.client = None
+
+    async def test_scopes_and_retry_after(self):
+        principal = Principal(id=1, email="owner@example.com", confirmed=True)
+        export = RateLimit(times=2, seconds=60, scope="export")
+        await export(principal)
+        await export(principal)
+        with self.assertRaises(HTTPException) as error:
+            await export(principal)
+        self.assertEqual(error.exception.status_code, 429)
+        self.assertTrue(0 < int(error.exception.headers["Retry-After"]) <= 60)
+        await RateLimit(cost=50)(principal)
+        await export(Principal(id=2, email="other@example.com", confirmed=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
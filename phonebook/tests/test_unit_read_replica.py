@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+import os
+import sys
+import tempfile
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from main import app
+from src.database.db import get_db, get_read_db
+from src.database.models import Base, Contact, User
+from src.services.auth import auth_service
+
+
+class TestReadReplicaRouting(unittest.TestCase):
+    """
+    The primary and the replica are two SQLite files holding different data,
+    so every response shows which of them served the request.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engines = []
+        self.overrides = {}
+        for name, dependency in (("primary", get_db), ("replica", get_read_db)):
+            path = os.path.join(self.tmp.name, f"{name}.db")
+            sync_engine = create_engine(f"sqlite:///{path}")
+            Base.metadata.create_all(sync_engine)
+            with Session(sync_engine) as session:
+                session.add(User(id=1, username="borys", email="borys@example.com", password="secret", confirmed=True))
+                session.add(Contact(id=1, first_name=name, last_name="Kuchyn", email="aaa@uu.cc", user_id=1))
+                session.commit()
+            sync_engine.dispose()
+
+            async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+            self.engines.append(async_engine)
+            self.overrides[dependency] = self.make_dependency(async_sessionmaker(async_engine, expire_on_commit=False))
+
+        app.dependency_overrides.update(self.overrides)
+        token = asyncio.run(auth_service.create_access_token(data={"sub": "borys@example.com"}))
+        self.client = TestClient(app)
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    def tearDown(self):
+        for dependency in self.overrides:
+            app.dependency_overrides.pop(dependency, None)
+        for async_engine in self.engines:
+            asyncio.run(async_engine.dispose())
+        self.tmp.cleanup()
+
+    @staticmethod
+    def make_dependency(session_maker):
+        async def override():
+            async with session_maker() as db:
+                yield db
+
+        return override
+
+    def test_reads_use_replica(self):
+        response = self.client.get("/api/contacts", headers=self.headers)
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual([contact["first_name"] for contact in response.json()], ["replica"])
+
+        response = self.client.get("/api/contacts/1", headers=self.headers)
+        self.assertEqual(response.json()["first_name"], "replica")
+
+        response = self.client.get("/api/contacts/search", params={"first_name": "rep"}, headers=self.headers)
+        self.assertEqual(len(response.json()), 1)
+
+    def test_writes_use_primary(self):
+        response = self.client.patch("/api/contacts/1/favorite", json={"favorite": True}, headers=self.headers)
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(response.json()["first_name"], "primary")
+        self.assertTrue(response.json()["favorite"])
+
+        response = self.client.get("/api/contacts", params={"favorite": True}, headers=self.headers)
+        self.assertEqual(response.json(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import os
+import sys
+from unittest.mock import patch
+
+import fakeredis
+import fakeredis.aioredis
+import redis.asyncio as redis
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.conf.config import settings
+from src.services import redis_client
+from src.services.login_throttle import login_throttle
+from src.services.rate_limiter import rate_limiter
+from src.services.refresh_tokens import refresh_token_store
+from src.services.revocation import revocation_list
+
+
+class TestRedisClient(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await redis_client.close_redis()
+
+    async def asyncTearDown(self):
+        await redis_client.close_redis()
+
+    def fake_pool(self, max_connections: int) -> redis_client.CountingConnectionPool:
+        # the shared pool with in-process connections in place of TCP ones
+        redis_client._pool = redis_client.CountingConnectionPool(
+            connection_class=fakeredis.aioredis.FakeAsyncRedisConnection, server=fakeredis.FakeServer(),
+            max_connections=max_connections, timeout=0.1, decode_responses=True,
+        )
+        return redis_client._pool
+
+    async def test_one_pool_for_all_clients(self):
+        client = redis_client.get_redis()
+        self.assertIs(client, redis_client.get_redis())
+        self.assertIs(client.connection_pool, redis_client.get_pool())
+        pool = client.connection_pool
+        self.assertIsInstance(pool, redis.BlockingConnectionPool)
+        self.assertEqual(pool.max_connections, settings.redis_max_connections)
+        self.assertEqual(pool.connection_kwargs["health_check_interval"], settings.redis_health_check_interval)
+        for store in (refresh_token_store, revocation_list, login_throttle, rate_limiter):
+            with patch.object(store, "client", None):
+                self.assertIs(store.redis, client)
+
+        await redis_client.close_redis()
+        self.assertIsNot(redis_client.get_pool(), pool)
+
+    async def test_pool_stats(self):
+        self.fake_pool(max_connections=2)
+        client = redis_client.get_redis()
+        await client.set("key", "value")
+        self.assertEqual(redis_client.pool_stats(), {"max_connections": 2, "in_use": 0, "idle": 1})
+        connection = await client.connection_pool.get_connection("GET")
+        self.assertEqual(redis_client.pool_stats(), {"max_connections": 2, "in_use": 1, "idle": 0})
+        await client.connection_pool.release(connection)
+        self.assertEqual(redis_client.pool_stats(), {"max_connections": 2, "in_use": 0, "idle": 1})
+
+    async def test_pool_is_bounded(self):
+        self.fake_pool(max_connections=1)
+        client = redis_client.get_redis()
+        connection = await client.connection_pool.get_connection("GET")
+        try:
+            self.assertEqual(redis_client.pool_stats()["in_use"], 1)
+            with self.assertRaises(redis.ConnectionError):
+                await client.get("key")
+            self.assertEqual(redis_client.pool_stats()["in_use"], 1)
+        finally:
+            await client.connection_pool.release(connection)
+        self.assertEqual(redis_client.pool_stats()["in_use"], 0)
+        self.assertIsNone(await client.get("key"))
+
+    async def test_failed_checkout_is_not_counted(self):
+        pool = self.fake_pool(max_connections=1)
+        with patch.object(pool, "ensure_connection", side_effect=redis.ConnectionError()):
+            with self.assertRaises(redis.ConnectionError):
+                await redis_client.get_redis().get("key")
+        self.assertEqual(redis_client.pool_stats(), {"max_connections": 1, "in_use": 0, "idle": 1})
+
+    async def test_pipeline(self):
+        client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        async with redis_client.pipeline(client) as pipe:
+            pipe.set("a", 1)
+            pipe.incr("a")
+            self.assertIsNone(await client.get("a"))
+        self.assertEqual(await client.get("a"), "2")
+
+        with self.assertRaises(RuntimeError):
+            async with redis_client.pipeline(client, transaction=True) as pipe:
+                pipe.set("b", 1)
+                raise RuntimeError()
+        self.assertIsNone(await client.get("b"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+import os
+import sys
+from unittest.mock import MagicMock
+
+import fakeredis.aioredis
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.database.models import User
+from src.routes import auth as auth_routes
+from src.services.auth import auth_service
+from src.services.login_throttle import login_throttle
+from src.services.refresh_tokens import REUSED, ROTATED, UNKNOWN, RefreshTokenStore, refresh_token_store
+from tests.helpers import AsyncDatabaseTestCase, owner
+
+
+class TestRefreshTokenStore(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        self.store = RefreshTokenStore(ttl=3600, client=self.redis)
+
+    async def test_issue(self):
+        claims = await self.store.issue(1, "Firefox")
+        family = await self.redis.hgetall(f"refresh:family:{claims['fam']}")
+        self.assertEqual((family["uid"], family["jti"], family["device"]), ("1", claims["jti"], "Firefox"))
+        self.assertTrue(0 < await self.redis.ttl(f"refresh:family:{claims['fam']}") <= 3600)
+
+    async def test_rotation(self):
+        first = await self.store.issue(1)
+        result, second = await self.store.rotate(1, first["fam"], first["jti"])
+        self.assertEqual(result, ROTATED)
+        self.assertEqual(second["fam"], first["fam"])
+        self.assertNotEqual(second["jti"], first["jti"])
+        result, third = await self.store.rotate(1, second["fam"], second["jti"])
+        self.assertEqual(result, ROTATED)
+
+    async def test_reuse_revokes_family(self):
+        first = await self.store.issue(1)
+        _, second = await self.store.rotate(1, first["fam"], first["jti"])
+        self.assertEqual(await self.store.rotate(1, first["fam"], first["jti"]), (REUSED, None))
+        # the legitimate holder is logged out as well, the thief cannot tell the tokens apart
+        self.assertEqual(await self.store.rotate(1, second["fam"], second["jti"]), (UNKNOWN, None))
+
+    async def test_sessions_are_independent(self):
+        phone, laptop = await self.store.issue(1, "phone"), await self.store.issue(1, "laptop")
+        await self.store.revoke(phone["fam"])
+        self.assertEqual((await self.store.rotate(1, phone["fam"], phone["jti"]))[0], UNKNOWN)
+        self.assertEqual((await self.store.rotate(1, laptop["fam"], laptop["jti"]))[0], ROTATED)
+
+    async def test_revoke_all(self):
+        sessions = [await self.store.issue(1) for _ in range(3)]
+        other = await self.store.issue(2)
+        await self.store.revoke_all(1)
+        for claims in sessions:
+            self.assertEqual((await self.store.rotate(1, claims["fam"], claims["jti"]))[0], UNKNOWN)
+        self.assertEqual((await self.store.rotate(2, other["fam"], other["jti"]))[0], ROTATED)
+        after = await self.store.issue(1)
+        self.assertEqual((await self.store.rotate(1, after["fam"], after["jti"]))[0], ROTATED)
+
+    async def test_expired_family(self):
+        claims = await self.store.issue(1)
+        await self.redis.delete(f"refresh:family:{claims['fam']}")
+        self.assertEqual(await self.store.rotate(1, claims["fam"], claims["jti"]), (UNKNOWN, None))
+
+
+class TestRefreshRoutes(AsyncDatabaseTestCase):
+    async def asyncSetUp(self):
+        refresh_token_store.client = login_throttle.client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        await super().asyncSetUp()
+        self.request = MagicMock()
+        self.request.headers = {"user-agent": "tests"}
+
+    async def asyncTearDown(self):
+        refresh_token_store.client = login_throttle.client = None
+        await super().asyncTearDown()
+
+    async def seed(self, session):
+        session.add(owner(confirmed=True, password=auth_service.get_password_hash("qwerty")))
+
+    async def refresh(self, token):
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+        async with self.session_maker() as session:
+            return await auth_routes.refresh_token(self.request, credentials, session)
+
+    async def test_login_and_refresh_do_not_write_users(self):
+        body = MagicMock(username="owner@example.com", password="qwerty")
+        async with self.session_maker() as session:
+            tokens = await auth_routes.login(self.request, body, session)
+        refreshed = await self.refresh(tokens["refresh_token"])
+        claims = jwt.get_unverified_claims(refreshed["refresh_token"])
+        self.assertEqual((claims["sub"], claims["uid"]), ("owner@example.com", 1))
+        async with self.session_maker() as session:
+            self.assertIsNone((await session.get(User, 1)).refresh_token)
+
+        with self.assertRaises(HTTPException) as error:
+            await self.refresh(tokens["refresh_token"])
+        self.assertEqual(error.exception.status_code, 401)
+        with self.assertRaises(HTTPException):
+            await self.refresh(refreshed["refresh_token"])
+
+    async def test_legacy_token_is_migrated_once(self):
+        legacy = await auth_service.create_refresh_token(data={"sub": "owner@example.com"})
+        async with self.session_maker() as session:
+            user = await session.get(User, 1)
+            user.refresh_token = legacy
+            await session.commit()
+        refreshed = await self.refresh(legacy)
+        self.assertIn("fam", jwt.get_unverified_claims(refreshed["refresh_token"]))
+        with self.assertRaises(HTTPException):
+            await self.refresh(legacy)
+
+
+if __name__ == "__main__":
+    unittest.main()
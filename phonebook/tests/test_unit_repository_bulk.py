@@ -0,0 +1,69 @@
+import unittest
+import os
+import sys
+
+from pydantic import ValidationError
+from sqlalchemy import event, select
+from sqlalchemy.dialects import postgresql
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.database.models import Contact
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactBulkSelection
+from tests.helpers import AsyncDatabaseTestCase, owner, other
+
+
+class TestBulkOperations(AsyncDatabaseTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.statements = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: self.statements.append(statement))
+
+    async def seed(self, session):
+        session.add_all([owner(), other()])
+        session.add_all(Contact(id=i, first_name=f"First{i}", last_name="Kyiv" if i % 2 else "Lviv",
+                                email=f"c{i}@uu.cc", user_id=1) for i in range(1, 11))
+        session.add(Contact(id=11, first_name="Other", last_name="Kyiv", email="c11@uu.cc", user_id=2))
+
+    async def favorites(self):
+        async with self.session_maker() as session:
+            stmt = select(Contact.id).filter(Contact.favorite.is_(True)).order_by(Contact.id)
+            return (await session.execute(stmt)).scalars().all()
+
+    async def test_favorite_by_ids(self):
+        selection = ContactBulkSelection(ids=[1, 2, 3, 11, 99])
+        async with self.session_maker() as session:
+            ids = await repository_contacts.bulk_favorite_update(selection, True, 1, session)
+        self.assertEqual(ids, [1, 2, 3])
+        self.assertEqual([statement.split()[0] for statement in self.statements], ["UPDATE"])
+        self.assertEqual(await self.favorites(), [1, 2, 3])
+
+    async def test_delete_by_filter(self):
+        selection = ContactBulkSelection(filter={"last_name": "kyiv"})
+        async with self.session_maker() as session:
+            ids = await repository_contacts.bulk_delete(selection, 1, session)
+            remaining = (await session.execute(select(Contact.id).order_by(Contact.id))).scalars().all()
+        self.assertEqual(ids, [1, 3, 5, 7, 9])
+        self.assertEqual(remaining, [2, 4, 6, 8, 10, 11])
+
+    async def test_filter_full_text(self):
+        selection = ContactBulkSelection(filter={"q": "lviv", "first_name": "first1"})
+        async with self.session_maker() as session:
+            ids = await repository_contacts.bulk_favorite_update(selection, True, 1, session)
+        self.assertEqual(ids, [10])
+
+    def test_selection_validation(self):
+        for payload in ({}, {"ids": [1], "filter": {"favorite": True}}, {"filter": {}}, {"ids": []}):
+            with self.subTest(payload=payload), self.assertRaises(ValidationError):
+                ContactBulkSelection(**payload)
+
+    def test_postgresql_uses_any(self):
+        condition = repository_contacts.bulk_condition(ContactBulkSelection(ids=[1, 2, 3]), 1, "postgresql")
+        sql = str(condition.compile(dialect=postgresql.dialect()))
+        self.assertEqual(sql, "contacts.user_id = %(user_id_1)s AND contacts.id = ANY (%(ids)s::INTEGER[])")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,100 +1,133 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from datetime import date, timedelta
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, text, extract, desc
+from sqlalchemy.dialects import postgresql
 from pathlib import Path
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from src.schemas import ContactModel,ContactFavoriteModel
-from src.database.models import Contact, User
+from src.database.models import Contact, User, birthday_key
+from tests.helpers import create_database, owner
 
 
 
 from src.repository.contacts import (
-    # get_contacts,
+    get_contacts,
     get_contact_by_id,
     get_contact_by_email,
     create,
     update,
     favorite_update,
-    delete
+    delete,
+    birthday_ranges,
+    search_birthday,
 )
 
 class TestContactsRepository (unittest.IsolatedAsyncioTestCase):
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = AsyncMock(spec=AsyncSession)
         self.user = User(id = 1, email = "user@example.com")
+
+    def mock_result(self, value):
+        result = MagicMock()
+        result.scalar_one_or_none.return_value = value
+        result.scalars.return_value.first.return_value = value
+        self.session.execute.return_value = result
         
-    # async def test_get_contacts(self):
-    #     contact = [Contact(), Contact(), Contact()]
-    #     favorite = True
-    #     q = self.session.query().filter_by()
-    #     if favorite is not None:
-    #         q = q.filter_by()
-    #     q.offset().limit().all.return_value = contact
-        
-    #     result = await get_contacts(skip=0, limit=10, user_id=self.user.id, db=self.session)
-    #     self.assertEqual(result, contact)
+    async def test_get_contacts(self):
+        contact = [Contact(), Contact(), Contact()]
+        favorite = True
+        result = MagicMock()
+        result.scalars.return_value.all.return_value = contact
+        self.session.execute.return_value = result
+
+        result = await get_contacts(skip=0, limit=10, favorite=favorite, user_id=self.user.id, db=self.session)
+        self.assertEqual(result, contact)
         
     async def test_get_contact_found_by_id(self):
         contact = Contact()
-        self.session.query().filter_by().first.return_value = contact
+        self.mock_result(contact)
         result = await get_contact_by_id(contact_id=1, user_id=self.user.id, db=self.session)  # type: ignore
         self.assertEqual(result, contact)
         
     async def test_get_contact_found_by_email(self):
         contact = Contact()
-        self.session.query().filter_by().first.return_value = contact
+        self.mock_result(contact)
         result = await get_contact_by_email(email="as@ee.ua", user_id=self.user.id, db=self.session)  # type: ignore
         self.assertEqual(result, contact)
         
     async def test_get_contact_not_found_by_id(self):
-        self.session.query().filter_by().first.return_value = None
+        self.mock_result(None)
         result = await get_contact_by_id(contact_id=1, user_id=self.user.id, db=self.session)  # type: ignore
         self.assertIsNone(result)
         
     async def test_get_contact_not_found_by_email(self):
-        self.session.query().filter_by().first.return_value = None
+        self.mock_result(None)
         result = await get_contact_by_email(email="as@ee.ua", user_id=self.user.id, db=self.session)  # type: ignore
         self.assertIsNone(result)
         
     async def test_create_contact(self):
         body = ContactModel(first_name="test1", last_name="test2", email="aa@uu.uu", phone="+380 (44) 1234567")
+        contact = Contact(id=1, **body.model_dump(), user_id=self.user.id)
+        self.session.bind = MagicMock()
+        self.session.bind.dialect.name = "postgresql"
+        self.mock_result(contact)
         result = await create(body=body, user_id=self.user.id, db=self.session)  # type: ignore
-        self.assertEqual(result.first_name, body.first_name)
-        self.assertEqual(result.last_name, body.last_name)
-        self.assertEqual(result.email, body.email)
-        self.assertEqual(result.phone, body.phone)
-        self.assertTrue(hasattr(result, "id"))
-        self.assertEqual(result.user_id, self.user.id)
+        self.assertEqual(result, contact)
+        self.session.execute.assert_awaited_once()
+        self.session.refresh.assert_not_awaited()
+        sql = str(self.session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+        self.assertIn("ON CONFLICT (user_id, lower(email)) DO NOTHING RETURNING", sql)
+
+    async def test_create_contact_email_taken(self):
+        self.session.bind = MagicMock()
+        self.session.bind.dialect.name = "postgresql"
+        self.mock_result(None)
+        body = ContactModel(first_name="test1", last_name="test2", email="aa@uu.uu")
+        result = await create(body=body, user_id=self.user.id, db=self.session)  # type: ignore
+        self.assertIsNone(result)
+
+    async def test_create_contact_sqlite(self):
+        engine, session_maker = await create_database()
+        async with session_maker() as session:
+            session.add(owner())
+            await session.commit()
+            body = ContactModel(first_name="test1", last_name="test2", email="aa@uu.uu", birthday=date(1990, 12, 31))
+            result = await create(body=body, user_id=1, db=session)
+            duplicate = await create(body=body.model_copy(update={"email": "AA@uu.uu"}), user_id=1, db=session)
+        await engine.dispose()
+        self.assertEqual((result.id, result.email, result.user_id, result.birthday_key), (1, "aa@uu.uu", 1, 1231))
+        self.assertIsNotNone(result.created_at)
+        self.assertIsNone(duplicate)
         
     async def test_remove_contact_found(self):
         contact = Contact()
-        self.session.query().filter_by().first.return_value = contact
+        self.mock_result(contact)
         result = await delete(contact_id=1, user_id=self.user.id, db=self.session)  # type: ignore
         self.assertEqual(result, contact)
 
     async def test_remove_contact_not_found(self):
-        self.session.query().filter_by().first.return_value = None
+        self.mock_result(None)
         result = await delete(contact_id=1, user_id=self.user.id, db=self.session)  # type: ignore
         self.assertIsNone(result)
         
     async def test_update_contact_found(self):
         contact = Contact()
         body = ContactModel(first_name="test1-1", last_name="test2-1", email="aa@uu.uu", phone="+380 (44) 1234567")
-        self.session.query().filter_by().first.return_value = contact
+        self.mock_result(contact)
         self.session.commit.return_value = None
         result = await update(contact_id=1, body=body, user_id=self.user.id, db=self.session)  # type: ignore
         self.assertEqual(result, contact)
 
     async def test_update_contact_not_found(self):
         body = ContactModel(first_name="test1-1", last_name="test2-1", email="aa@uu.uu", phone="+380 (44) 1234567")
-        self.session.query().filter_by().first.return_value = None
+        self.mock_result(None)
         self.session.commit.return_value = None
         result = await update(contact_id=1, body=body, user_id=self.user.id, db=self.session)  # type: ignore
         self.assertIsNone(result)
@@ -102,17 +135,54 @@ class TestContactsRepository (unittest.IsolatedAsyncioTestCase):
     async def test_update_favorite_contact_found(self):
         body = ContactFavoriteModel(favorite=True)
         contact = Contact()
-        self.session.query().filter_by().first.return_value = contact
+        self.mock_result(contact)
         result = await favorite_update(contact_id=1, body=body, user_id=self.user.id, db=self.session)  # type: ignore
         self.assertEqual(result, contact)
 
     async def test_update_favorite_contact_not_found(self):
         body = ContactFavoriteModel(favorite=True)
         contact = Contact()
-        self.session.query().filter_by().first.return_value = None
+        self.mock_result(None)
         result = await favorite_update(contact_id=1, body=body, user_id=self.user.id, db=self.session)  # type: ignore
         self.assertIsNone(result)
         
 
+class FixedDate(date):
+    @classmethod
+    def today(cls):
+        return cls(2023, 12, 28)
+
+
+class TestBirthdaySearch(unittest.IsolatedAsyncioTestCase):
+    def test_birthday_key(self):
+        self.assertEqual(birthday_key(date(1990, 12, 31)), 1231)
+        self.assertEqual(birthday_key(date(1992, 2, 29)), 229)
+        self.assertIsNone(birthday_key(None))
+        self.assertEqual(Contact(birthday=date(1990, 3, 5)).birthday_key, 305)
+
+    def test_birthday_ranges(self):
+        self.assertEqual(birthday_ranges(date(2023, 6, 1), 7), [(601, 608)])
+        self.assertEqual(birthday_ranges(date(2023, 12, 28), 7), [(1228, 1231), (101, 104)])
+        self.assertEqual(birthday_ranges(date(2023, 2, 21), 7), [(221, 229)])
+        self.assertEqual(birthday_ranges(date(2024, 2, 21), 7), [(221, 228)])
+        self.assertEqual(birthday_ranges(date(2024, 2, 25), 7), [(225, 303)])
+        self.assertEqual(birthday_ranges(date(2023, 1, 1), 365), [(101, 1231)])
+
+    async def test_search_birthday_wraps_new_year(self):
+        engine, session_maker = await create_database()
+        async with session_maker() as session:
+            session.add(owner())
+            session.add_all([
+                Contact(first_name="january", email="jan@example.com", birthday=date(1980, 1, 2), user_id=1),
+                Contact(first_name="december", email="dec@example.com", birthday=date(1995, 12, 30), user_id=1),
+                Contact(first_name="june", email="jun@example.com", birthday=date(2000, 6, 1), user_id=1),
+            ])
+            await session.commit()
+            with patch("src.repository.contacts.date", FixedDate):
+                result = await search_birthday({"days": 7, "skip": 0, "limit": 10}, 1, session)
+        await engine.dispose()
+        self.assertEqual([contact.first_name for contact in result], ["december", "january"])
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
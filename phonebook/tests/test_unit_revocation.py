@@ -0,0 +1,173 @@
+import asyncio
+import unittest
+import os
+import sys
+from time import time
+from unittest.mock import MagicMock, patch
+
+import fakeredis
+import fakeredis.aioredis
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from redis.exceptions import ConnectionError
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.routes import auth as auth_routes
+from src.services.auth import auth_service
+from src.services.login_throttle import login_throttle
+from src.services.refresh_tokens import refresh_token_store
+from src.services.revocation import BloomFilter, RevocationList, revocation_list, token_entry
+from src.services.token_cache import token_cache
+from src.services.user_cache import user_cache
+from tests.helpers import AsyncDatabaseTestCase, owner
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(size=1 << 16, hashes=7)
+        items = [f"jti:{i}" for i in range(5000)]
+        for item in items:
+            bloom.add(item)
+        self.assertTrue(all(item in bloom for item in items))
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(size=1 << 16, hashes=7)
+        for i in range(5000):
+            bloom.add(f"jti:{i}")
+        false_positives = sum(f"other:{i}" in bloom for i in range(10000))
+        # 9.6 bits per entry and 7 hashes give about 1%
+        self.assertLess(false_positives / 10000, 0.03)
+
+
+class TestRevocationList(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = fakeredis.FakeServer()
+        self.redis = fakeredis.aioredis.FakeRedis(server=self.server, decode_responses=True)
+        self.revocations = RevocationList(bloom_size=1 << 16, bloom_hashes=7, rebuild_interval=300, client=self.redis)
+
+    async def test_revoke_token(self):
+        await self.revocations.revoke_token("a", time() + 60)
+        self.assertTrue(await self.revocations.is_revoked({"jti": "a", "uid": 1}))
+        self.assertFalse(await self.revocations.is_revoked({"jti": "b", "uid": 1}))
+
+    async def test_miss_does_not_ask_redis(self):
+        await self.revocations.revoke_token("a", time() + 60)
+        with patch.object(self.redis, "zscore", wraps=self.redis.zscore) as zscore:
+            for i in range(100):
+                await self.revocations.is_revoked({"jti": f"other{i}", "uid": 1})
+        self.assertLessEqual(zscore.call_count, 1)
+
+    async def test_revoke_user(self):
+        issued = int(time() * 1000)
+        await self.revocations.revoke_user(1, 900)
+        self.assertTrue(await self.revocations.is_revoked({"jti": "a", "uid": 1, "iat_ms": issued}))
+        self.assertFalse(await self.revocations.is_revoked({"jti": "b", "uid": 1, "iat_ms": issued + 2000}))
+        self.assertFalse(await self.revocations.is_revoked({"jti": "c", "uid": 2, "iat_ms": issued}))
+        # tokens without iat_ms count from the start of their second
+        self.assertTrue(await self.revocations.is_revoked({"jti": "d", "uid": 1, "iat": issued // 1000}))
+
+    async def test_token_issued_in_the_same_second_after_revoke_user(self):
+        with patch("src.services.revocation.time", return_value=1000.2):
+            await self.revocations.revoke_user(1, 900)
+        self.assertTrue(await self.revocations.is_revoked({"jti": "a", "uid": 1, "iat": 1000, "iat_ms": 1000100}))
+        self.assertFalse(await self.revocations.is_revoked({"jti": "b", "uid": 1, "iat": 1000, "iat_ms": 1000300}))
+
+    async def test_false_positive_is_checked_in_redis(self):
+        self.revocations.bloom.add(token_entry("a"))
+        self.assertFalse(await self.revocations.is_revoked({"jti": "a"}))
+        self.assertEqual(self.revocations.stats()["false_positives"], 1)
+
+    async def test_redis_down_after_hit_rejects(self):
+        self.revocations.bloom.add(token_entry("a"))
+        self.revocations.client = MagicMock()
+        self.revocations.client.zscore.side_effect = ConnectionError()
+        self.assertTrue(await self.revocations.is_revoked({"jti": "a"}))
+        self.assertFalse(await self.revocations.is_revoked({"jti": "b"}))
+
+    async def test_rebuild_drops_expired(self):
+        await self.revocations.revoke_token("old", time() - 1)
+        await self.revocations.revoke_token("live", time() + 60)
+        await self.revocations.rebuild()
+        self.assertNotIn(token_entry("old"), self.revocations.bloom)
+        self.assertIn(token_entry("live"), self.revocations.bloom)
+        self.assertEqual(await self.redis.zcard("revoked:entries"), 1)
+
+    async def test_other_workers_learn_by_pubsub(self):
+        await self.revocations.revoke_token("before", time() + 60)
+        other = RevocationList(bloom_size=1 << 16, bloom_hashes=7, rebuild_interval=300,
+                               client=fakeredis.aioredis.FakeRedis(server=self.server, decode_responses=True))
+        other.start()
+        try:
+            for _ in range(100):
+                if token_entry("before") in other.bloom:
+                    break
+                await asyncio.sleep(0.01)
+            await self.revocations.revoke_token("after", time() + 60)
+            for _ in range(300):
+                if token_entry("after") in other.bloom:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertTrue(await other.is_revoked({"jti": "before"}))
+            self.assertTrue(await other.is_revoked({"jti": "after"}))
+        finally:
+            await other.stop()
+
+
+class TestLogout(AsyncDatabaseTestCase):
+    async def asyncSetUp(self):
+        token_cache.clear()
+        user_cache.clear()
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        refresh_token_store.client = revocation_list.client = login_throttle.client = redis
+        revocation_list.bloom = BloomFilter(revocation_list.bloom_size, revocation_list.bloom_hashes)
+        await super().asyncSetUp()
+        self.request = MagicMock()
+        self.request.headers = {"user-agent": "tests"}
+
+    async def asyncTearDown(self):
+        refresh_token_store.client = revocation_list.client = login_throttle.client = None
+        revocation_list.bloom = BloomFilter(revocation_list.bloom_size, revocation_list.bloom_hashes)
+        token_cache.clear()
+        user_cache.clear()
+        await super().asyncTearDown()
+
+    async def seed(self, session):
+        session.add(owner(confirmed=True, password=auth_service.get_password_hash("qwerty")))
+
+    async def login(self):
+        body = MagicMock(username="owner@example.com", password="qwerty")
+        async with self.session_maker() as session:
+            return await auth_routes.login(self.request, body, session)
+
+    async def current_user(self, token):
+        async with self.session_maker() as session:
+            return await auth_service.get_current_user(token, session)
+
+    async def test_logout(self):
+        tokens, other_device = await self.login(), await self.login()
+        self.assertEqual((await self.current_user(tokens["access_token"])).id, 1)
+        await auth_routes.logout(tokens["access_token"])
+
+        with self.assertRaises(HTTPException) as error:
+            await self.current_user(tokens["access_token"])
+        self.assertEqual(error.exception.status_code, 401)
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=tokens["refresh_token"])
+        with self.assertRaises(HTTPException):
+            async with self.session_maker() as session:
+                await auth_routes.refresh_token(self.request, credentials, session)
+        self.assertEqual((await self.current_user(other_device["access_token"])).id, 1)
+
+    async def test_logout_all(self):
+        tokens = await self.login()
+        principal = await auth_service.get_current_principal(tokens["access_token"], None)
+        await auth_routes.logout_all(principal)
+        with self.assertRaises(HTTPException):
+            await auth_service.get_current_principal(tokens["access_token"], None)
+        # signing in again right away, within the same second, gives a token that works
+        tokens = await self.login()
+        self.assertEqual((await auth_service.get_current_principal(tokens["access_token"], None)).id, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import os
+import sys
+from unittest.mock import patch
+
+import fakeredis.aioredis
+from fastapi import HTTPException
+from jose import jwt
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.services.auth import auth_service
+from src.services.revocation import revocation_list
+from src.services.token_cache import TokenCache, token_cache, token_digest
+from src.services.user_cache import user_cache
+from tests.helpers import AsyncDatabaseTestCase, owner
+
+
+class TestTokenCache(unittest.TestCase):
+    def test_expires_at_exp(self):
+        cache = TokenCache(max_size=10)
+        with patch("src.services.token_cache.time", return_value=1000):
+            cache.put("token", {"sub": "a@example.com", "exp": 1060})
+            self.assertEqual(cache.get("token")["sub"], "a@example.com")
+        with patch("src.services.token_cache.time", return_value=1060):
+            self.assertIsNone(cache.get("token"))
+        self.assertEqual(len(cache.entries), 0)
+
+    def test_keyed_by_digest(self):
+        cache = TokenCache(max_size=10)
+        cache.put("secret.token.value", {"sub": "a@example.com", "exp": 2 ** 40})
+        self.assertEqual(list(cache.entries), [token_digest("secret.token.value")])
+
+    def test_lru_eviction(self):
+        cache = TokenCache(max_size=2)
+        for token in ("a", "b"):
+            cache.put(token, {"exp": 2 ** 40})
+        cache.get("a")
+        cache.put("c", {"exp": 2 ** 40})
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+
+    def test_token_without_exp_is_not_cached(self):
+        cache = TokenCache(max_size=10)
+        cache.put("token", {"sub": "a@example.com"})
+        self.assertIsNone(cache.get("token"))
+
+    def test_revoke(self):
+        cache = TokenCache(max_size=10)
+        with patch("src.services.token_cache.time", return_value=1000):
+            cache.put("token", {"exp": 1060})
+            cache.revoke("token", 1060)
+            self.assertIsNone(cache.get("token"))
+            self.assertTrue(cache.is_revoked("token"))
+            cache.put("token", {"exp": 1060})
+            self.assertIsNone(cache.get("token"))
+        with patch("src.services.token_cache.time", return_value=1061):
+            cache.revoke("other", 2000)
+        self.assertFalse(cache.is_revoked("token"))
+
+
+class TestGetCurrentUser(AsyncDatabaseTestCase):
+    async def asyncSetUp(self):
+        token_cache.clear()
+        user_cache.clear()
+        await super().asyncSetUp()
+
+    async def asyncTearDown(self):
+        token_cache.clear()
+        user_cache.clear()
+        await super().asyncTearDown()
+
+    async def seed(self, session):
+        session.add(owner())
+
+    async def test_signature_checked_once(self):
+        token = await auth_service.create_access_token(data={"sub": "owner@example.com"})
+        async with self.session_maker() as session:
+            with patch("src.services.auth.jwt.decode", wraps=jwt.decode) as decode:
+                for _ in range(3):
+                    self.assertEqual((await auth_service.get_current_user(token, session)).id, 1)
+        self.assertEqual(decode.call_count, 1)
+
+    async def test_rejected_tokens_are_not_cached(self):
+        refresh_token = await auth_service.create_refresh_token(data={"sub": "owner@example.com"})
+        async with self.session_maker() as session:
+            for _ in range(2):
+                with self.assertRaises(HTTPException):
+                    await auth_service.get_current_user(refresh_token, session)
+        self.assertEqual(len(token_cache.entries), 0)
+
+    async def test_revoked_token_is_rejected(self):
+        revocation_list.client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        self.addCleanup(setattr, revocation_list, "client", None)
+        token = await auth_service.create_access_token(data={"sub": "owner@example.com"})
+        async with self.session_maker() as session:
+            await auth_service.get_current_user(token, session)
+            await auth_service.revoke_access_token(token)
+            with self.assertRaises(HTTPException) as error:
+                await auth_service.get_current_user(token, session)
+        self.assertEqual(error.exception.status_code, 401)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+import os
+import sys
+from unittest.mock import patch
+
+import fakeredis.aioredis
+from redis.exceptions import ConnectionError
+from sqlalchemy import event
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.database.models import User
+from src.repository import users as repository_users
+from src.services.auth import auth_service
+from src.services.token_cache import token_cache
+from src.services.user_cache import UserCache, user_cache
+from tests.helpers import AsyncDatabaseTestCase, owner
+
+
+class TestUserCache(AsyncDatabaseTestCase):
+    async def asyncSetUp(self):
+        user_cache.clear()
+        token_cache.clear()
+        await super().asyncSetUp()
+        self.loads = 0
+        self.statements = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: self.statements.append(statement))
+
+    async def asyncTearDown(self):
+        user_cache.clear()
+        await super().asyncTearDown()
+
+    async def seed(self, session):
+        session.add(owner(refresh_token="refresh"))
+
+    async def get(self, cache, email="owner@example.com"):
+        async def load():
+            self.loads += 1
+            async with self.session_maker() as session:
+                return await repository_users.get_user_by_email(email, session)
+        return await cache.get_or_load(email, load)
+
+    async def test_hit_returns_detached_copy(self):
+        cache = UserCache(max_size=10, ttl=60)
+        first = await self.get(cache)
+        second = await self.get(cache, "OWNER@example.com")
+        self.assertEqual(self.loads, 1)
+        self.assertIsNot(first, second)
+        self.assertEqual((second.id, second.email, second.username), (1, "owner@example.com", "owner"))
+        self.assertIsNone(second.password)
+        self.assertIsNone(second.refresh_token)
+        self.assertEqual(cache.stats()["hit_rate"], 0.5)
+
+    async def test_missing_user_is_not_cached(self):
+        cache = UserCache(max_size=10, ttl=60)
+        self.assertIsNone(await self.get(cache, "nobody@example.com"))
+        self.assertIsNone(await self.get(cache, "nobody@example.com"))
+        self.assertEqual(self.loads, 2)
+
+    async def test_ttl(self):
+        cache = UserCache(max_size=10, ttl=60)
+        with patch("src.services.user_cache.monotonic", return_value=1000):
+            await self.get(cache)
+        with patch("src.services.user_cache.monotonic", return_value=1059):
+            await self.get(cache)
+        self.assertEqual(self.loads, 1)
+        with patch("src.services.user_cache.monotonic", return_value=1061):
+            await self.get(cache)
+        self.assertEqual(self.loads, 2)
+
+    async def test_lru_eviction(self):
+        async with self.session_maker() as session:
+            session.add_all(User(id=i, username=f"user{i}", email=f"u{i}@example.com", password="secret")
+                            for i in range(2, 5))
+            await session.commit()
+        cache = UserCache(max_size=2, ttl=60)
+        await self.get(cache, "u2@example.com")
+        await self.get(cache, "u3@example.com")
+        await self.get(cache, "u2@example.com")
+        await self.get(cache, "u4@example.com")
+        self.assertEqual(list(cache.entries), ["u2@example.com", "u4@example.com"])
+
+    async def test_repository_writes_invalidate(self):
+        cached = await self.get(user_cache)
+        self.assertFalse(cached.confirmed)
+        async with self.session_maker() as session:
+            await repository_users.confirmed_email("owner@example.com", session)
+        self.assertTrue((await self.get(user_cache)).confirmed)
+        async with self.session_maker() as session:
+            await repository_users.update_avatar("owner@example.com", "https://avatar", session)
+        self.assertEqual((await self.get(user_cache)).avatar, "https://avatar")
+        async with self.session_maker() as session:
+            user = await repository_users.get_user_by_email("owner@example.com", session)
+            await repository_users.update_token(user, None, session)
+        self.assertNotIn("owner@example.com", user_cache.entries)
+
+    async def test_write_during_load_is_not_cached(self):
+        cache = UserCache(max_size=10, ttl=60)
+
+        async def load():
+            await cache.invalidate("owner@example.com")
+            async with self.session_maker() as session:
+                return await repository_users.get_user_by_email("owner@example.com", session)
+
+        self.assertIsNotNone(await cache.get_or_load("owner@example.com", load))
+        self.assertEqual(len(cache.entries), 0)
+
+    async def test_generations_are_not_kept(self):
+        cache = UserCache(max_size=10, ttl=60)
+        for i in range(100):
+            await cache.invalidate(f"user{i}@example.com")
+        self.assertEqual(cache.generations, {})
+
+        async def load():
+            await cache.invalidate("owner@example.com")
+            async with self.session_maker() as session:
+                return await repository_users.get_user_by_email("owner@example.com", session)
+
+        await cache.get_or_load("owner@example.com", load)
+        self.assertEqual((cache.generations, cache.loading), ({}, {}))
+
+    async def test_redis_second_tier(self):
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        with patch("src.services.user_cache.get_redis", return_value=redis):
+            worker = UserCache(max_size=10, ttl=60, redis_enabled=True)
+            other_worker = UserCache(max_size=10, ttl=60, redis_enabled=True)
+            await self.get(worker)
+            user = await self.get(other_worker)
+            self.assertEqual(self.loads, 1)
+            self.assertEqual(other_worker.stats()["redis_hits"], 1)
+            self.assertEqual(user.created_at, (await self.get(worker)).created_at)
+            self.assertNotIn("secret", await redis.get("user:owner@example.com"))
+
+            await worker.invalidate("owner@example.com")
+            self.assertIsNone(await redis.get("user:owner@example.com"))
+
+    async def test_redis_down_falls_back_to_database(self):
+        with patch("src.services.user_cache.get_redis") as get_redis:
+            get_redis.return_value.get.side_effect = ConnectionError()
+            get_redis.return_value.set.side_effect = ConnectionError()
+            cache = UserCache(max_size=10, ttl=60, redis_enabled=True)
+            self.assertEqual((await self.get(cache)).id, 1)
+        self.assertEqual(cache.stats()["redis_errors"], 2)
+
+    async def test_get_current_user_reads_database_once(self):
+        token = await auth_service.create_access_token(data={"sub": "owner@example.com"})
+        async with self.session_maker() as session:
+            for _ in range(3):
+                user = await auth_service.get_current_user(token, session)
+                self.assertEqual(user.id, 1)
+        self.assertEqual(len([s for s in self.statements if s.startswith("SELECT")]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import os
+import sys
+from datetime import date
+
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.database.models import Contact
+from src.repository import contacts as repository_contacts
+from src.routes import contacts as contacts_routes
+from src.schemas import ContactFavoriteModel, ContactModel, ContactResponse, Principal
+from tests.helpers import AsyncDatabaseTestCase, owner, other
+
+
+class TestWriteStatements(AsyncDatabaseTestCase):
+    """
+    Each write, including serializing its result as ContactResponse, costs one SQL statement.
+    """
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.statements = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: self.statements.append(statement.split()[0]))
+
+    async def seed(self, session):
+        session.add_all([owner(), other()])
+        session.add(Contact(id=1, first_name="Borys", last_name="Kuchyn", email="borys@uu.cc", user_id=1))
+
+    async def run_write(self, call):
+        self.statements.clear()
+        async with self.session_maker() as session:
+            contact = await call(session)
+            response = ContactResponse.model_validate(contact) if contact else None
+        return response, self.statements
+
+    async def test_create(self):
+        body = ContactModel(first_name="Nadiia", last_name="Volkova", email="nadiia@uu.cc")
+        response, statements = await self.run_write(lambda db: repository_contacts.create(body, 1, db))
+        self.assertEqual(response.email, "nadiia@uu.cc")
+        self.assertEqual(statements, ["INSERT"])
+
+    async def test_update(self):
+        body = ContactModel(first_name="Zenon", last_name="Kuchyn", email="zenon@uu.cc", birthday=date(1990, 12, 31))
+        response, statements = await self.run_write(lambda db: repository_contacts.update(1, body, 1, db))
+        self.assertEqual((response.first_name, response.birthday), ("Zenon", date(1990, 12, 31)))
+        self.assertEqual(statements, ["UPDATE"])
+        async with self.session_maker() as session:
+            self.assertEqual((await session.get(Contact, 1)).birthday_key, 1231)
+
+    async def test_update_to_existing_email(self):
+        async with self.session_maker() as session:
+            session.add(Contact(id=2, first_name="Nadiia", last_name="Volkova", email="nadiia@uu.cc", user_id=1))
+            await session.commit()
+        body = ContactModel(first_name="Borys", last_name="Kuchyn", email="Nadiia@uu.cc")
+        with self.assertRaises(IntegrityError):
+            await self.run_write(lambda db: repository_contacts.update(1, body, 1, db))
+        principal = Principal(id=1, email="owner@example.com", confirmed=True)
+        async with self.session_maker() as session:
+            with self.assertRaises(HTTPException) as error:
+                await contacts_routes.update_contact(body, 1, session, principal)
+        self.assertEqual(error.exception.status_code, 409)
+        async with self.session_maker() as session:
+            self.assertEqual((await session.get(Contact, 1)).email, "borys@uu.cc")
+
+    async def test_favorite_update(self):
+        body = ContactFavoriteModel(favorite=True)
+        response, statements = await self.run_write(lambda db: repository_contacts.favorite_update(1, body, 1, db))
+        self.assertTrue(response.favorite)
+        self.assertEqual(statements, ["UPDATE"])
+
+    async def test_delete(self):
+        response, statements = await self.run_write(lambda db: repository_contacts.delete(1, 1, db))
+        self.assertEqual(response.id, 1)
+        self.assertEqual(statements, ["DELETE"])
+
+    async def test_other_user(self):
+        body = ContactFavoriteModel(favorite=True)
+        response, statements = await self.run_write(lambda db: repository_contacts.favorite_update(1, body, 2, db))
+        self.assertIsNone(response)
+        self.assertEqual(statements, ["UPDATE"])
+        response, statements = await self.run_write(lambda db: repository_contacts.delete(1, 2, db))
+        self.assertIsNone(response)
+        self.assertEqual(statements, ["DELETE"])
+
+
+if __name__ == '__main__':
+    unittest.main()